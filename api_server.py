@@ -0,0 +1,329 @@
+"""ASGI API for the mortgage agent.
+
+Run several workers behind a load balancer, sharing session state through the store:
+
+    MORTGAGE_SESSION_STORE=sqlite:///sessions.db uvicorn api_server:app --workers 4 --port 8000
+
+With session affinity at the load balancer, add the in-memory caching layer
+(lazy load, write-behind batching, idle eviction):
+
+    MORTGAGE_SESSION_STORE="sqlite:///sessions.db?cache=1&write_behind=0.5&idle_ttl=900"
+
+Routes:
+    POST   /sessions                     start a conversation
+    GET    /sessions/{id}                fetch conversation state
+    DELETE /sessions/{id}                forget a conversation
+    POST   /sessions/{id}/turns          {"message": ...}; add ?stream=1 for server-sent events
+    WS     /sessions/{id}/ws             send {"message": ...}, receive delta/done events
+"""
+import asyncio
+import json
+import os
+import threading
+import sys
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from dotenv import load_dotenv
+
+import metrics
+from mortgage_assistant import ConversationalMortgageAgent
+from session_store import SessionConflict, create_store
+from traffic_capture import record_turn
+
+load_dotenv()
+
+WELCOME_MESSAGE = "Hello! I'm your mortgage advisor. I'm here to help you find the right mortgage solution. What brings you in today?"
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class MortgageAPI:
+    """ASGI application hosting many agent conversations per process
+
+    Agents are rebuilt from the session store for every turn, so any worker can serve
+    any session. A turn is the agent's synchronous pipeline (purpose, extraction, reply,
+    scenario query), shared with the Streamlit app, so turns run on a thread pool sized
+    by MORTGAGE_API_TURN_THREADS while the event loop handles sockets and streaming.
+    Each turn saves with the session version it read. If another worker saved in
+    between, the turn fails with 409 instead of overwriting that worker's history.
+    Any other error is logged and answered with a JSON 500 (or an 'error' event once a
+    stream has started). The store is opened on first use, not at import.
+    """
+
+    def __init__(self, store=None, turn_threads=None):
+        self._store = store
+        self.store_lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(
+            max_workers=int(turn_threads or os.getenv("MORTGAGE_API_TURN_THREADS", 64)),
+            thread_name_prefix='mortgage-turn'
+        )
+        self.session_locks = {}
+
+    @property
+    def store(self):
+        if self._store is None:
+            with self.store_lock:
+                if self._store is None:
+                    self._store = create_store(os.getenv("MORTGAGE_SESSION_STORE", "sqlite:///sessions.db"))
+        return self._store
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http':
+            await self.handle_http(scope, receive, send)
+        elif scope['type'] == 'websocket':
+            await self.handle_websocket(scope, receive, send)
+        elif scope['type'] == 'lifespan':
+            await self.handle_lifespan(receive, send)
+
+    async def handle_lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    metrics.start_metrics_server()
+                except OSError as e:
+                    # With several workers only the first one can bind the metrics port
+                    print(f"Metrics server not started in this worker: {e}")
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                if self._store is not None:
+                    self._store.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    # Session and turn handling (runs on the thread pool)
+
+    def create_session(self):
+        session_id = uuid.uuid4().hex
+        self.store.put(session_id, ConversationalMortgageAgent().export_state())
+        return {'session_id': session_id, 'message': WELCOME_MESSAGE}
+
+    def load_state(self, session_id):
+        return self.load_versioned(session_id)[0]
+
+    def load_versioned(self, session_id):
+        state, version = self.store.get_versioned(session_id)
+        if state is None:
+            raise HTTPError(404, f"Unknown session {session_id}")
+        return state, version
+
+    def run_turn(self, session_id, message, on_delta=None):
+        state, version = self.load_versioned(session_id)
+        agent = ConversationalMortgageAgent.from_state(state)
+        start = time.perf_counter()
+        if on_delta is None:
+            reply = agent.get_next_response(message)
+        else:
+            parts = []
+            for piece in agent.stream_next_response(message):
+                parts.append(piece)
+                on_delta(piece)
+            reply = ''.join(parts)
+        record_turn(session_id, agent, message, time.perf_counter() - start, streamed=on_delta is not None)
+        try:
+            self.store.put(session_id, agent.export_state(), expected_version=version)
+        except SessionConflict:
+            raise HTTPError(409, "Session was updated by another request; retry the turn")
+        return {'session_id': session_id, 'reply': reply, 'stage': agent.state.get('current_stage')}
+
+    async def in_thread(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    async def locked_turn(self, session_id, message, on_delta=None):
+        """Serialise turns of one session within this worker so history appends stay ordered
+
+        Across workers, the versioned save in run_turn catches overlapping turns.
+        """
+        lock = self.session_locks.setdefault(session_id, [asyncio.Lock(), 0])
+        lock[1] += 1
+        try:
+            async with lock[0]:
+                return await self.in_thread(self.run_turn, session_id, message, on_delta)
+        finally:
+            lock[1] -= 1
+            if lock[1] == 0:
+                self.session_locks.pop(session_id, None)
+
+    # HTTP
+
+    async def handle_http(self, scope, receive, send):
+        started = False
+
+        async def tracked_send(message):
+            nonlocal started
+            started = started or message['type'] == 'http.response.start'
+            await send(message)
+
+        try:
+            await self.route_http(scope, receive, tracked_send)
+        except Exception:
+            log_error(f"{scope['method']} {scope['path']}")
+            if not started:
+                await send_json(send, 500, {'error': "Internal server error"})
+
+    async def route_http(self, scope, receive, send):
+        method = scope['method']
+        parts = [p for p in scope['path'].split('/') if p]
+        query = parse_qs(scope.get('query_string', b'').decode())
+        try:
+            if parts == ['healthz'] and method == 'GET':
+                await send_json(send, 200, {'status': 'ok'})
+            elif parts == ['sessions'] and method == 'POST':
+                await send_json(send, 201, await self.in_thread(self.create_session))
+            elif len(parts) == 2 and parts[0] == 'sessions' and method == 'GET':
+                state = await self.in_thread(self.load_state, parts[1])
+                await send_json(send, 200, {'session_id': parts[1], 'state': state})
+            elif len(parts) == 2 and parts[0] == 'sessions' and method == 'DELETE':
+                await self.in_thread(self.store.delete, parts[1])
+                await send_json(send, 204, None)
+            elif len(parts) == 3 and parts[0] == 'sessions' and parts[2] == 'turns' and method == 'POST':
+                message = parse_message(await read_body(receive))
+                if query.get('stream', ['0'])[0] in ('1', 'true'):
+                    await self.stream_turn(send, parts[1], message)
+                else:
+                    await send_json(send, 200, await self.locked_turn(parts[1], message))
+            else:
+                raise HTTPError(404, "Not found")
+        except HTTPError as e:
+            await send_json(send, e.status, {'error': e.message})
+
+    async def stream_turn(self, send, session_id, message):
+        """Reply as server-sent events: one 'delta' per chunk, then 'done'"""
+        await self.in_thread(self.load_state, session_id)
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [(b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache')]
+        })
+
+        async def emit(event, payload):
+            data = f"event: {event}\ndata: {json.dumps(payload)}\n\n".encode()
+            await send({'type': 'http.response.body', 'body': data, 'more_body': True})
+
+        try:
+            result = await self.relay_stream(session_id, message, lambda piece: emit('delta', {'content': piece}))
+            await emit('done', result)
+        except HTTPError as e:
+            await emit('error', {'error': e.message})
+        except Exception:
+            log_error(f"streamed turn of session {session_id}")
+            await emit('error', {'error': "Internal server error"})
+        await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+    async def relay_stream(self, session_id, message, on_delta):
+        """Run a streaming turn on the pool and forward its chunks from the event loop"""
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        done = object()
+
+        def push(piece):
+            loop.call_soon_threadsafe(queue.put_nowait, piece)
+
+        async def produce():
+            try:
+                return await self.locked_turn(session_id, message, push)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+
+        task = asyncio.ensure_future(produce())
+        try:
+            while (piece := await queue.get()) is not done:
+                await on_delta(piece)
+        except asyncio.CancelledError:
+            task.add_done_callback(log_abandoned_turn)
+            raise
+        except Exception:
+            # The client went away mid-stream. The turn still runs to the end and saves, so wait
+            # for it (keeping the session lock order) and log its outcome rather than drop it
+            try:
+                await task
+            except Exception:
+                log_error(f"turn of session {session_id} after its client disconnected")
+            raise
+        return await task
+
+    # WebSocket
+
+    async def handle_websocket(self, scope, receive, send):
+        parts = [p for p in scope['path'].split('/') if p]
+        if not (len(parts) == 3 and parts[0] == 'sessions' and parts[2] == 'ws'):
+            await send({'type': 'websocket.close', 'code': 4404})
+            return
+        session_id = parts[1]
+        await receive()  # websocket.connect
+        if await self.in_thread(self.store.get, session_id) is None:
+            await send({'type': 'websocket.close', 'code': 4404})
+            return
+        await send({'type': 'websocket.accept'})
+
+        async def send_event(payload):
+            await send({'type': 'websocket.send', 'text': json.dumps(payload)})
+
+        while True:
+            event = await receive()
+            if event['type'] == 'websocket.disconnect':
+                return
+            try:
+                message = parse_message(event.get('text') or event.get('bytes') or b'')
+                result = await self.relay_stream(
+                    session_id, message, lambda piece: send_event({'type': 'delta', 'content': piece}))
+                await send_event({'type': 'done', **result})
+            except HTTPError as e:
+                await send_event({'type': 'error', 'error': e.message})
+            except Exception:
+                log_error(f"websocket turn of session {session_id}")
+                await send_event({'type': 'error', 'error': "Internal server error"})
+
+
+def log_error(context):
+    print(f"Error handling {context}:", file=sys.stderr)
+    traceback.print_exc()
+
+
+def log_abandoned_turn(task):
+    """Done callback for a turn whose request was cancelled, so its outcome is still observed"""
+    if not task.cancelled() and task.exception() is not None:
+        print(f"Turn abandoned by a cancelled request failed: {task.exception()!r}", file=sys.stderr)
+
+
+async def read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+def parse_message(raw):
+    try:
+        payload = json.loads(raw or b'{}')
+    except json.JSONDecodeError:
+        raise HTTPError(400, "Body must be JSON")
+    message = payload.get('message') if isinstance(payload, dict) else None
+    if not isinstance(message, str) or not message.strip():
+        raise HTTPError(400, "Expected a non-empty 'message' string")
+    return message
+
+
+async def send_json(send, status, payload):
+    body = b'' if payload is None else json.dumps(payload).encode()
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+app = MortgageAPI()
@@ -1,14 +1,4 @@
-import openai
 import os
-from dotenv import load_dotenv
-from colorama import Fore, Style, init
-
-# Initialize colorama
-init(autoreset=True)
-
-# Load API key from .env file
-load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
 
 # Mock mortgage product data
 MORTGAGE_PRODUCTS = [
@@ -36,6 +26,8 @@ MORTGAGE_PRODUCTS = [
 ]
 
 def collect_user_data():
+    from colorama import Fore, Style
+
     print(Fore.CYAN + "\nWelcome to the Mortgage Assistant!")
     print(Fore.CYAN + "I'll guide you through a quick pre-eligibility check.")
     print(Style.DIM + "-" * 50)
@@ -87,6 +79,18 @@ def generate_document_checklist(user_data, is_eligible):
     return checklist
 
 if __name__ == "__main__":
+    # UI and API setup happens only when run as a CLI, so importing the eligibility rules stays cheap
+    import openai
+    from dotenv import load_dotenv
+    from colorama import Fore, Style, init
+
+    # Initialize colorama
+    init(autoreset=True)
+
+    # Load API key from .env file
+    load_dotenv()
+    openai.api_key = os.getenv("OPENAI_API_KEY")
+
     # Collect user data
     user_data = collect_user_data()
     is_eligible, max_loan = calculate_eligibility(user_data)
@@ -0,0 +1,223 @@
+"""Benchmarks for the finance, matching, prompt-building and formatting hot paths.
+
+Run from the repository root:
+
+    python -m benchmarks.hot_paths --output bench.json
+    python -m benchmarks.hot_paths --products 10,1000 --turns 1,10 --compare bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import app
+import migrations
+from message_log import MessageLog
+from mortgage_assistant import ConversationalMortgageAgent
+
+PRODUCT_NAMES = ["Basic Home Loan", "Premium Home Loan", "First-Time Buyer Loan",
+                 "Standard Variable", "Fixed 3-Year Special", "Investment Property"]
+
+CUSTOMER = {
+    'income': 120000,
+    'expenses': 3500,
+    'loan_amount': 560000,
+    'property_value': 700000,
+    'deposit': 140000
+}
+
+
+def make_products(count, seed):
+    """Synthetic products in the app.py layout (interest_rate as "3.5%")"""
+    rng = random.Random(seed)
+    products = []
+    for i in range(count):
+        products.append({
+            'id': i + 1,
+            'name': f"{rng.choice(PRODUCT_NAMES)} {i + 1}",
+            'min_income': float(rng.randrange(30000, 150000, 5000)),
+            'max_loan': float(rng.randrange(300000, 2000000, 50000)),
+            'property_value_min': float(rng.randrange(100000, 800000, 50000)),
+            'interest_rate': f"{rng.uniform(2.5, 7.5):.2f}%"
+        })
+    return products
+
+
+def make_products_db(path, products):
+    """Catalog at the current schema version; rates are stored typed, as after migration"""
+    conn = sqlite3.connect(path)
+    migrations.migrate(conn)
+    conn.executemany('INSERT INTO mortgage_products (id, name, min_income, max_loan, property_value_min, base_rate) '
+                     'VALUES (?, ?, ?, ?, ?, ?)',
+                     [(p['id'], p['name'], p['min_income'], p['max_loan'], p['property_value_min'],
+                       float(p['interest_rate'].rstrip('%'))) for p in products])
+    conn.commit()
+    conn.close()
+
+
+def make_history(turns, agent, seed):
+    """Alternating user/assistant messages; assistant turns carry a scenario table like real replies"""
+    rng = random.Random(seed)
+    scenarios = agent.generate_loan_scenarios({'financial': CUSTOMER})[:3]
+    table = agent.format_scenario_message(scenarios)
+    history = MessageLog()
+    for i in range(turns):
+        history.append("user", f"My income is about ${rng.randrange(60000, 250000, 1000):,} and I want to borrow more.")
+        history.append("assistant", "Thanks, here is what that means for your borrowing power.\n\n" + table)
+    return history
+
+
+def measure(fn, repeat, min_time):
+    """Time fn with enough iterations per sample to exceed min_time seconds"""
+    number = 1
+    while True:
+        start = time.perf_counter_ns()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter_ns() - start
+        if elapsed >= min_time * 1e9 or number >= 1 << 20:
+            break
+        number *= 10 if elapsed < min_time * 1e8 else 2
+
+    samples = [elapsed / number]
+    for _ in range(repeat - 1):
+        start = time.perf_counter_ns()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter_ns() - start) / number)
+
+    samples.sort()
+    return {
+        'number': number,
+        'repeat': repeat,
+        'min_ns': samples[0],
+        'median_ns': statistics.median(samples),
+        'mean_ns': statistics.fmean(samples),
+        'p95_ns': samples[min(len(samples) - 1, int(round(0.95 * (len(samples) - 1))))],
+        'stdev_ns': statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        'ops_per_sec': 1e9 / samples[0] if samples[0] else None
+    }
+
+
+def run(product_scales, turn_scales, repeat, min_time, seed, only=None):
+    results = []
+
+    def bench(name, params, fn):
+        label = name + ''.join(f"[{k}={v}]" for k, v in params.items())
+        if only and only not in label:
+            return
+        stats = measure(fn, repeat, min_time)
+        results.append({'name': name, 'params': params, **stats})
+        print(f"{label:<60} {stats['median_ns'] / 1e3:>12.2f} us  (min {stats['min_ns'] / 1e3:.2f}, n={stats['number']})",
+              file=sys.stderr)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        base_db = os.path.join(tmp, 'products_10.db')
+        make_products_db(base_db, make_products(10, seed))
+        agent = ConversationalMortgageAgent(llm_client=object(), db_path=base_db)
+
+        # Pure finance functions do not depend on catalog size
+        bench('estimate_monthly_payment', {}, lambda: agent.estimate_monthly_payment(560000, 0.0612, 30))
+        bench('calculate_serviceability', {}, lambda: agent.calculate_serviceability(120000, 3500, 560000, 700000))
+        bench('analyze_rate_impact', {}, lambda: agent.analyze_rate_impact(560000, 6.12))
+
+        for count in product_scales:
+            products = make_products(count, seed)
+            db_path = os.path.join(tmp, f'products_{count}.db')
+            if count != 10:
+                make_products_db(db_path, products)
+            else:
+                db_path = base_db
+            agent = ConversationalMortgageAgent(llm_client=object(), db_path=db_path)
+            agent.state['collected_info'].update(CUSTOMER)
+            agent.state['mortgage_purpose'] = 'First home purchase'
+            profile = {'financial': CUSTOMER}
+            scenarios = agent.generate_loan_scenarios(profile)
+
+            bench('generate_loan_scenarios', {'products': count}, lambda: agent.generate_loan_scenarios(profile))
+            bench('format_scenario_message', {'products': count, 'scenarios': len(scenarios)},
+                  lambda: agent.format_scenario_message(scenarios))
+
+            app.MORTGAGE_PRODUCTS = products
+            bench('recommend_products', {'products': count}, lambda: app.recommend_products(CUSTOMER))
+
+            for turns in turn_scales:
+                agent.state['conversation_history'] = make_history(turns, agent, seed)
+                bench('get_system_prompt', {'products': count, 'turns': turns}, agent.get_system_prompt)
+                bench('build_messages', {'products': count, 'turns': turns},
+                      lambda: agent.build_messages("What would my repayments be on a variable rate?"))
+
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(results, baseline_path, threshold):
+    """Print median ratios against a baseline run; return the cases slower than threshold"""
+    with open(baseline_path) as f:
+        baseline = {(r['name'], json.dumps(r['params'], sort_keys=True)): r for r in json.load(f)['results']}
+    regressions = []
+    for r in results:
+        base = baseline.get((r['name'], json.dumps(r['params'], sort_keys=True)))
+        if not base:
+            continue
+        ratio = r['median_ns'] / base['median_ns']
+        label = r['name'] + ''.join(f"[{k}={v}]" for k, v in r['params'].items())
+        marker = 'REGRESSION' if ratio > 1 + threshold else ''
+        print(f"{label:<60} {ratio:>6.2f}x {marker}", file=sys.stderr)
+        if marker:
+            regressions.append(label)
+    return regressions
+
+
+def parse_scales(value):
+    return [int(v) for v in value.split(',') if v]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the mortgage assistant hot paths")
+    parser.add_argument('--products', type=parse_scales, default=[10, 1000, 100000], help="Catalog sizes, comma separated")
+    parser.add_argument('--turns', type=parse_scales, default=[1, 10, 100], help="History lengths in turns, comma separated")
+    parser.add_argument('--repeat', type=int, default=7, help="Samples per case")
+    parser.add_argument('--min-time', type=float, default=0.05, help="Minimum seconds per sample")
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--only', help="Run only cases whose label contains this text")
+    parser.add_argument('--output', help="Write JSON results here (default: stdout)")
+    parser.add_argument('--compare', help="Baseline JSON to compare medians against")
+    parser.add_argument('--threshold', type=float, default=0.10, help="Allowed slowdown before flagging a regression")
+    args = parser.parse_args()
+
+    results = run(args.products, args.turns, args.repeat, args.min_time, args.seed, args.only)
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'seed': args.seed
+        },
+        'results': results
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
@@ -0,0 +1,248 @@
+"""Load test: concurrent synthetic customers talking to the agent, ramped until it saturates.
+
+Each customer runs a scripted multi-turn conversation (first-home buyer, investor or
+refinancer) through ConversationalMortgageAgent.get_next_response, with sessions held
+by a SessionManager as in the advisor. By default the LLM is an in-process stub server.
+
+Run from the repository root:
+
+    python -m benchmarks.load_test --concurrency 1,2,4,8,16,32 --output load.json
+    python -m benchmarks.load_test --latency lognormal:0.4,0.5 --error-rate 0.02
+    python -m benchmarks.load_test --base-url http://127.0.0.1:8089/v1
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+# The stub ignores the key, but the OpenAI client refuses to start without one
+os.environ.setdefault("OPENAI_API_KEY", "load-test")
+
+from openai import OpenAI
+
+import tracing
+from benchmarks.hot_paths import git_commit, parse_scales
+from session_manager import SessionManager
+from session_store import MemorySessionStore
+from stub_llm_server import StubConfig, start_stub_server
+
+SCRIPTS = {
+    'first_home': [
+        "Hi, we're looking to buy our first home.",
+        "We're looking at places around $650,000 in the outer suburbs and have saved a $90,000 deposit.",
+        "I earn $95,000 and my partner earns $60,000. Our expenses are about $3,800 a month.",
+        "We'd like a baby in the next two years, so lower repayments matter more than paying it off fast.",
+        "Are there any first home buyer grants we should know about?",
+        "What would the repayments look like on a variable rate?"
+    ],
+    'investor': [
+        "I'm interested in buying an investment property.",
+        "I already own my home. The investment would be a $850,000 apartment and I can put down $200,000.",
+        "My income is $210,000 a year and living expenses are around $5,500 a month.",
+        "I'd prefer interest only for the first five years. How do fixed and variable compare?",
+        "What happens to my cash flow if rates rise by 2%?"
+    ],
+    'refinancer': [
+        "I want to refinance my current mortgage.",
+        "The property is worth about $900,000 and I owe $520,000 at 6.4% variable.",
+        "Household income is $180,000 and expenses about $4,200 a month.",
+        "Could I save by switching to a fixed rate for three years?"
+    ]
+}
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of an already sorted list"""
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, int(round(q * (len(values) - 1)))))]
+
+
+def summarize(values, scale=1e3):
+    """Latency summary in milliseconds"""
+    values = sorted(values)
+    if not values:
+        return {'count': 0}
+    return {
+        'count': len(values),
+        'mean_ms': sum(values) / len(values) * scale,
+        'p50_ms': percentile(values, 0.50) * scale,
+        'p90_ms': percentile(values, 0.90) * scale,
+        'p95_ms': percentile(values, 0.95) * scale,
+        'p99_ms': percentile(values, 0.99) * scale,
+        'max_ms': values[-1] * scale
+    }
+
+
+def peak_rss_bytes():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class LoadTest:
+    """Runs ramp levels against one LLM endpoint and collects per-level results"""
+
+    def __init__(self, base_url, db_path='mortgage_products.db', conversations=2, think_time=0.0,
+                 max_retries=0, timeout=60.0, seed=1234):
+        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=base_url,
+                             max_retries=max_retries, timeout=timeout)
+        self.db_path = db_path
+        self.conversations = conversations
+        self.think_time = think_time
+        self.seed = seed
+        self.sink = tracing.MemorySink()
+
+    def run_customer(self, manager, profile, rng, results):
+        """One scripted conversation; appends (latency, ok) per turn to results"""
+        session_id = uuid.uuid4().hex
+        for message in SCRIPTS[profile]:
+            with manager.session(session_id) as agent:
+                start = time.perf_counter()
+                try:
+                    reply = agent.get_next_response(message)
+                    ok = not reply.startswith("I apologize, but I encountered an error")
+                except Exception as e:
+                    print(f"Turn failed: {e}", file=sys.stderr)
+                    ok = False
+                results.append((time.perf_counter() - start, ok))
+                manager.save(session_id, agent)
+            if self.think_time:
+                time.sleep(rng.expovariate(1 / self.think_time))
+
+    def run_level(self, concurrency):
+        manager = SessionManager(MemorySessionStore(), sweep_interval=0,
+                                 agent_kwargs={'llm_client': self.client, 'db_path': self.db_path})
+        self.sink.drain()
+        profiles = list(SCRIPTS)
+        turns = []
+        customers = 0
+        lock = threading.Lock()
+
+        def worker(index):
+            nonlocal customers
+            rng = random.Random(self.seed * 1000 + index)
+            local = []
+            for _ in range(self.conversations):
+                self.run_customer(manager, rng.choice(profiles), rng, local)
+            with lock:
+                turns.extend(local)
+                customers += self.conversations
+
+        threads = [threading.Thread(target=worker, args=(i,), name=f'customer-{i}') for i in range(concurrency)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+
+        durations, errors = self.sink.drain()
+        sessions = sorted(manager.memory_usage().values())
+        manager.close()
+        failed = sum(1 for _, ok in turns if not ok)
+        return {
+            'concurrency': concurrency,
+            'customers': customers,
+            'turns': len(turns),
+            'elapsed_s': elapsed,
+            'throughput_turns_per_s': len(turns) / elapsed if elapsed else None,
+            'turn_latency': summarize([latency for latency, _ in turns]),
+            'turn_error_rate': failed / len(turns) if turns else 0.0,
+            'stages': {
+                name: {**summarize(values), 'error_rate': errors.get(name, 0) / len(values)}
+                for name, values in sorted(durations.items())
+            },
+            'session_bytes': {
+                'sessions': len(sessions),
+                'mean': sum(sessions) / len(sessions) if sessions else 0,
+                'p95': percentile(sessions, 0.95),
+                'max': sessions[-1] if sessions else 0
+            },
+            'peak_rss_bytes': peak_rss_bytes()
+        }
+
+    def ramp(self, levels, min_gain=0.10):
+        """Run each concurrency level in turn; saturation is the last level before throughput stops improving"""
+        previous_tracer = tracing.tracer.sink, tracing.tracer.sample_rate
+        tracing.tracer.sink, tracing.tracer.sample_rate = self.sink, 1.0
+        results = []
+        saturation = None
+        try:
+            for concurrency in levels:
+                result = self.run_level(concurrency)
+                results.append(result)
+                print(f"c={concurrency:<4} {result['throughput_turns_per_s']:8.2f} turns/s  "
+                      f"p50 {result['turn_latency'].get('p50_ms', 0):8.1f} ms  "
+                      f"p95 {result['turn_latency'].get('p95_ms', 0):8.1f} ms  "
+                      f"errors {result['turn_error_rate']:.1%}", file=sys.stderr)
+                if len(results) > 1 and saturation is None:
+                    before = results[-2]['throughput_turns_per_s']
+                    if result['throughput_turns_per_s'] < before * (1 + min_gain):
+                        saturation = results[-2]['concurrency']
+        finally:
+            tracing.tracer.sink, tracing.tracer.sample_rate = previous_tracer
+        return results, saturation
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ramp concurrent synthetic customers through the mortgage agent")
+    parser.add_argument('--concurrency', type=parse_scales, default=[1, 2, 4, 8, 16, 32],
+                        help="Concurrent customers per level, comma separated")
+    parser.add_argument('--conversations', type=int, default=2, help="Scripted conversations per customer per level")
+    parser.add_argument('--think-time', type=float, default=0.0, help="Mean seconds between a customer's turns")
+    parser.add_argument('--min-gain', type=float, default=0.10,
+                        help="Throughput gain below which the previous level is reported as saturation")
+    parser.add_argument('--base-url', help="OpenAI-compatible endpoint to target instead of the in-process stub")
+    parser.add_argument('--latency', default='fixed:0.2', help="Stub latency model (see stub_llm_server.py)")
+    parser.add_argument('--tokens-per-second', type=float, default=200.0, help="Stub streaming rate")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Stub error injection rate")
+    parser.add_argument('--max-retries', type=int, default=0, help="OpenAI client retries per call")
+    parser.add_argument('--db', default='mortgage_products.db', help="Product catalog database")
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--output', help="Write JSON results here (default: stdout)")
+    args = parser.parse_args()
+
+    server = None
+    base_url = args.base_url
+    if base_url is None:
+        server, base_url = start_stub_server(StubConfig(latency=args.latency, tokens_per_second=args.tokens_per_second,
+                                                        error_rate=args.error_rate, seed=args.seed))
+    try:
+        test = LoadTest(base_url, db_path=args.db, conversations=args.conversations, think_time=args.think_time,
+                        max_retries=args.max_retries, seed=args.seed)
+        results, saturation = test.ramp(args.concurrency, args.min_gain)
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'seed': args.seed,
+            'base_url': args.base_url or 'stub',
+            'stub': None if args.base_url else {'latency': args.latency, 'tokens_per_second': args.tokens_per_second,
+                                                'error_rate': args.error_rate}
+        },
+        'saturation_concurrency': saturation,
+        'levels': results
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
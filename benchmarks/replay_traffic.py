@@ -0,0 +1,332 @@
+"""Replay captured advisor traffic through the agent and report latency regressions.
+
+Turns captured with MORTGAGE_CAPTURE_FILE (see traffic_capture.py) are streamed from the
+file, regrouped by session and re-driven through ConversationalMortgageAgent with their
+recorded spacing divided by --speedup (0 replays as fast as possible). Turns of one
+session run in order; different sessions overlap as they did in production. Memory stays
+constant in the file size: the reader blocks once --max-in-flight turns are queued,
+sessions idle for --session-gap recorded seconds are dropped, and latency summaries are
+kept in fixed-size reservoirs.
+
+Run from the repository root:
+
+    python -m benchmarks.replay_traffic captured.jsonl --speedup 10 --output replay.json
+    python -m benchmarks.replay_traffic captured.jsonl --cassette cassettes/prod.jsonl.gz --compare replay.json
+"""
+import argparse
+import gzip
+import json
+import os
+import platform
+import random
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+# The stub ignores the key, but the OpenAI client refuses to start without one
+os.environ.setdefault("OPENAI_API_KEY", "replay")
+
+from openai import OpenAI
+
+import tracing
+from benchmarks.hot_paths import git_commit
+from benchmarks.load_test import peak_rss_bytes, summarize
+from llm_cassette import CassetteClient
+from mortgage_assistant import ConversationalMortgageAgent
+from stub_llm_server import StubConfig, start_stub_server
+
+
+def read_records(path):
+    """Yield captured turns one line at a time; malformed lines are counted and skipped"""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                if isinstance(record.get('message'), str) and record.get('session_id'):
+                    yield record
+                    continue
+            except (json.JSONDecodeError, AttributeError):
+                pass
+            yield None
+
+
+class Reservoir:
+    """Uniform sample of at most size values (algorithm R), so summaries need constant memory"""
+
+    def __init__(self, size=100000, seed=0):
+        self.size = size
+        self.values = []
+        self.count = 0
+        self.rng = random.Random(seed)
+
+    def add(self, value):
+        self.count += 1
+        if len(self.values) < self.size:
+            self.values.append(value)
+        else:
+            index = self.rng.randrange(self.count)
+            if index < self.size:
+                self.values[index] = value
+
+    def summary(self):
+        return {**summarize(self.values), 'count': self.count}
+
+
+class ReplaySession:
+    __slots__ = ('agent', 'pending', 'running', 'last_ts')
+
+    def __init__(self):
+        self.agent = None
+        self.pending = deque()
+        self.running = False
+        self.last_ts = None
+
+
+class Replayer:
+    """Re-drives captured turns against one LLM client, keeping per-session order"""
+
+    def __init__(self, client, db_path='mortgage_products.db', speedup=1.0, max_in_flight=64,
+                 session_gap=1800.0, seed=1234):
+        self.client = client
+        self.db_path = db_path
+        self.speedup = float(speedup)
+        self.max_in_flight = max_in_flight
+        self.session_gap = float(session_gap)
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix='replay')
+        self.slots = threading.BoundedSemaphore(max_in_flight)
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.sink = tracing.MemorySink()
+        self.turn_latency = Reservoir(seed=seed)
+        self.recorded_latency = Reservoir(seed=seed)
+        self.lag = Reservoir(seed=seed)
+        self.stages = {}  # span name -> [Reservoir, errors]
+        self.counts = {'records': 0, 'malformed': 0, 'turns': 0, 'errors': 0, 'sessions': 0, 'peak_sessions': 0}
+        self.seed = seed
+
+    def run(self, records):
+        previous_tracer = tracing.tracer.sink, tracing.tracer.sample_rate
+        tracing.tracer.sink, tracing.tracer.sample_rate = self.sink, 1.0
+        first_ts = last_ts = None
+        start = time.perf_counter()
+        try:
+            for record in records:
+                if record is None:
+                    self.counts['malformed'] += 1
+                    continue
+                self.counts['records'] += 1
+                ts = float(record.get('ts') or 0)
+                if first_ts is None:
+                    first_ts = ts
+                last_ts = ts
+                due = None
+                if self.speedup > 0:
+                    due = start + (ts - first_ts) / self.speedup
+                    wait = due - time.perf_counter()
+                    if wait > 0:
+                        time.sleep(wait)
+                # Backpressure: the reader never holds more than max_in_flight turns
+                self.slots.acquire()
+                self.dispatch(record, ts, due)
+                if self.counts['records'] % 1000 == 0:
+                    self.evict_idle(ts)
+                    self.collect_stages()
+
+            for _ in range(self.max_in_flight):
+                self.slots.acquire()
+        finally:
+            self.executor.shutdown(wait=True)
+            tracing.tracer.sink, tracing.tracer.sample_rate = previous_tracer
+        self.collect_stages()
+        return time.perf_counter() - start, (last_ts - first_ts) if first_ts is not None else 0.0
+
+    def dispatch(self, record, ts, due):
+        with self.lock:
+            session = self.sessions.get(record['session_id'])
+            if session is None:
+                session = self.sessions[record['session_id']] = ReplaySession()
+                self.counts['sessions'] += 1
+                self.counts['peak_sessions'] = max(self.counts['peak_sessions'], len(self.sessions))
+            session.pending.append((record, due))
+            session.last_ts = ts
+            if session.running:
+                return
+            session.running = True
+        self.executor.submit(self.drain, session)
+
+    def drain(self, session):
+        """Run a session's queued turns in order on one pool thread"""
+        while True:
+            with self.lock:
+                if not session.pending:
+                    session.running = False
+                    return
+                record, due = session.pending.popleft()
+            try:
+                self.replay_turn(session, record, due)
+            except Exception as e:
+                print(f"Replay of session {record['session_id']} failed: {e}", file=sys.stderr)
+                with self.lock:
+                    self.counts['turns'] += 1
+                    self.counts['errors'] += 1
+            finally:
+                self.slots.release()
+
+    def replay_turn(self, session, record, due):
+        if session.agent is None:
+            session.agent = ConversationalMortgageAgent(llm_client=self.client, db_path=self.db_path)
+        start = time.perf_counter()
+        reply = session.agent.get_next_response(record['message'])
+        latency = time.perf_counter() - start
+        with self.lock:
+            self.counts['turns'] += 1
+            if reply.startswith("I apologize, but I encountered an error"):
+                self.counts['errors'] += 1
+            self.turn_latency.add(latency)
+            if due is not None:
+                self.lag.add(max(0.0, start - due))
+            if record.get('latency_ms') is not None:
+                self.recorded_latency.add(record['latency_ms'] / 1e3)
+
+    def evict_idle(self, now_ts):
+        """Forget sessions with nothing queued whose last recorded turn is session_gap behind"""
+        cutoff = now_ts - self.session_gap
+        with self.lock:
+            for session_id in [sid for sid, s in self.sessions.items()
+                               if not s.running and not s.pending and s.last_ts < cutoff]:
+                del self.sessions[session_id]
+
+    def collect_stages(self):
+        durations, errors = self.sink.drain()
+        with self.lock:
+            for name, values in durations.items():
+                entry = self.stages.setdefault(name, [Reservoir(seed=self.seed), 0])
+                for value in values:
+                    entry[0].add(value)
+                entry[1] += errors.get(name, 0)
+
+    def report(self, elapsed, recorded_span):
+        turns = self.counts['turns']
+        return {
+            **self.counts,
+            'speedup': self.speedup,
+            'elapsed_s': elapsed,
+            'recorded_span_s': recorded_span,
+            'throughput_turns_per_s': turns / elapsed if elapsed else None,
+            'error_rate': self.counts['errors'] / turns if turns else 0.0,
+            'turn_latency': self.turn_latency.summary(),
+            'recorded_latency': self.recorded_latency.summary(),
+            'schedule_lag': self.lag.summary(),
+            'stages': {
+                name: {**reservoir.summary(), 'error_rate': errors / reservoir.count if reservoir.count else 0.0}
+                for name, (reservoir, errors) in sorted(self.stages.items())
+            },
+            'peak_rss_bytes': peak_rss_bytes()
+        }
+
+
+def compare(report, baseline_path, threshold, error_threshold):
+    """Print latency ratios against a baseline replay; return the regressed metrics"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)['replay']
+    pairs = [('turn', report['turn_latency'], baseline['turn_latency'])]
+    pairs += [(name, stats, baseline['stages'][name]) for name, stats in report['stages'].items()
+              if name in baseline['stages']]
+
+    regressions = []
+    for name, current, base in pairs:
+        for key in ('p50_ms', 'p95_ms'):
+            if not current.get(key) or not base.get(key):
+                continue
+            ratio = current[key] / base[key]
+            label = f"{name} {key}"
+            marker = 'REGRESSION' if ratio > 1 + threshold else ''
+            print(f"{label:<50} {ratio:>6.2f}x {marker}", file=sys.stderr)
+            if marker:
+                regressions.append(label)
+
+    delta = report['error_rate'] - baseline['error_rate']
+    marker = 'REGRESSION' if delta > error_threshold else ''
+    print(f"{'error rate':<50} {delta:>+6.2%} {marker}", file=sys.stderr)
+    if marker:
+        regressions.append('error rate')
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay captured advisor traffic through the mortgage agent")
+    parser.add_argument('capture', help="Captured turns (JSON lines, optionally .gz)")
+    parser.add_argument('--speedup', type=float, default=1.0,
+                        help="Divide recorded gaps between turns by this factor; 0 replays as fast as possible")
+    parser.add_argument('--limit', type=int, help="Replay only the first N turns")
+    parser.add_argument('--max-in-flight', type=int, default=64, help="Turns queued or running at once")
+    parser.add_argument('--session-gap', type=float, default=1800.0,
+                        help="Recorded seconds of inactivity after which a session is dropped")
+    parser.add_argument('--base-url', help="OpenAI-compatible endpoint to target instead of the in-process stub")
+    parser.add_argument('--cassette', help="Replay LLM responses from this cassette instead of calling an endpoint")
+    parser.add_argument('--latency', default='fixed:0.2', help="Stub latency model (see stub_llm_server.py)")
+    parser.add_argument('--tokens-per-second', type=float, default=200.0, help="Stub generation rate")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Stub error injection rate")
+    parser.add_argument('--db', default='mortgage_products.db', help="Product catalog database")
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--output', help="Write the JSON report here (default: stdout)")
+    parser.add_argument('--compare', help="Baseline replay report to compare against")
+    parser.add_argument('--threshold', type=float, default=0.10, help="Allowed latency slowdown before flagging")
+    parser.add_argument('--error-threshold', type=float, default=0.01, help="Allowed error rate increase")
+    args = parser.parse_args()
+
+    server = None
+    if args.cassette:
+        client, target = CassetteClient(None, args.cassette, 'replay'), f"cassette:{args.cassette}"
+    else:
+        base_url, target = args.base_url, args.base_url
+        if base_url is None:
+            server, base_url = start_stub_server(StubConfig(latency=args.latency, tokens_per_second=args.tokens_per_second,
+                                                            error_rate=args.error_rate, seed=args.seed))
+            target = 'stub'
+        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=base_url, max_retries=0)
+
+    records = read_records(args.capture)
+    if args.limit:
+        records = (r for _, r in zip(range(args.limit), records))
+    replayer = Replayer(client, db_path=args.db, speedup=args.speedup, max_in_flight=args.max_in_flight,
+                        session_gap=args.session_gap, seed=args.seed)
+    try:
+        elapsed, recorded_span = replayer.run(records)
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    result = replayer.report(elapsed, recorded_span)
+    print(f"{result['turns']} turns from {result['sessions']} sessions in {elapsed:.1f}s "
+          f"({result['throughput_turns_per_s'] or 0:.2f} turns/s), p50 {result['turn_latency'].get('p50_ms', 0):.1f} ms, "
+          f"p95 {result['turn_latency'].get('p95_ms', 0):.1f} ms, errors {result['error_rate']:.1%}", file=sys.stderr)
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'capture': args.capture,
+            'target': target,
+            'stub': {'latency': args.latency, 'tokens_per_second': args.tokens_per_second,
+                     'error_rate': args.error_rate} if target == 'stub' else None
+        },
+        'replay': result
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare and compare(result, args.compare, args.threshold, args.error_threshold):
+        sys.exit(1)
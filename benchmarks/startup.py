@@ -0,0 +1,107 @@
+"""Cold-start guard: import time of the entry modules and which heavy dependencies they pull in.
+
+Each module is imported in a fresh interpreter with -X importtime. The run fails when a
+module loads one of the UI/LLM dependencies that must stay lazy, or exceeds its budget.
+
+Run from the repository root:
+
+    python -m benchmarks.startup --output startup.json
+    python -m benchmarks.startup --compare startup.json --budget-ms 150
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+from datetime import datetime, timezone
+
+from benchmarks.hot_paths import compare, git_commit
+
+# Entry modules and the modules each must not import at load time
+TARGETS = {
+    'mortgage_finance': ('openai', 'streamlit', 'dotenv', 'colorama', 'httpx', 'sqlite3', 'http.server'),
+    'mortgage_assistant': ('openai', 'streamlit', 'dotenv', 'colorama', 'httpx', 'http.server'),
+    'session_manager': ('openai', 'streamlit', 'dotenv', 'colorama', 'httpx', 'http.server'),
+    'app': ('openai', 'streamlit', 'dotenv', 'colorama', 'httpx')
+}
+
+PROBE = "import sys, json; import {module}; print(json.dumps([m for m in {heavy!r} if m in sys.modules]))"
+
+
+def import_once(module, heavy):
+    """Import module in a new interpreter; return (cumulative import microseconds, heavy modules loaded)"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROBE.format(module=module, heavy=list(heavy))],
+        capture_output=True, text=True, check=True, cwd=os.getcwd()
+    )
+    cumulative = None
+    for line in result.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        parts = line.split('|')
+        if len(parts) == 3 and parts[2].strip() == module:
+            cumulative = int(parts[1])
+    return cumulative, json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def run(targets, repeat):
+    results = []
+    for module, heavy in targets.items():
+        samples = []
+        loaded = set()
+        for _ in range(repeat):
+            cumulative, found = import_once(module, heavy)
+            samples.append(cumulative * 1000)
+            loaded.update(found)
+        samples.sort()
+        results.append({
+            'name': 'import',
+            'params': {'module': module},
+            'repeat': repeat,
+            'min_ns': samples[0],
+            'median_ns': statistics.median(samples),
+            'heavy_modules': sorted(loaded)
+        })
+        status = f"loads {', '.join(sorted(loaded))}" if loaded else "ok"
+        print(f"{module:<24} {statistics.median(samples) / 1e6:>8.1f} ms  {status}", file=sys.stderr)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure cold import time of the mortgage assistant entry modules")
+    parser.add_argument('--only', help="Measure only this module")
+    parser.add_argument('--repeat', type=int, default=5, help="Fresh interpreters per module")
+    parser.add_argument('--budget-ms', type=float, help="Fail when a module's median import time exceeds this")
+    parser.add_argument('--output', help="Write JSON results here (default: stdout)")
+    parser.add_argument('--compare', help="Baseline JSON to compare medians against")
+    parser.add_argument('--threshold', type=float, default=0.25, help="Allowed slowdown before flagging a regression")
+    args = parser.parse_args()
+
+    targets = {m: heavy for m, heavy in TARGETS.items() if not args.only or m == args.only}
+    results = run(targets, args.repeat)
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform()
+        },
+        'results': results
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    failures = [r['params']['module'] for r in results if r['heavy_modules']]
+    if args.budget_ms is not None:
+        failures += [r['params']['module'] for r in results if r['median_ns'] > args.budget_ms * 1e6]
+    if args.compare:
+        failures += compare(results, args.compare, args.threshold)
+    if failures:
+        print(f"Startup check failed: {', '.join(failures)}", file=sys.stderr)
+        sys.exit(1)
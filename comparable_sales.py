@@ -0,0 +1,139 @@
+"""Comparable-sales search: the k recent sales most like a described property.
+
+Each suburb's sales come from market_arrays.MarketArrays. Its LRU cache is keyed by
+suburb_versions, so the feature matrix built here is cached alongside the sales and
+rebuilt only when ingest changes the suburb. Sales are scaled so that one unit of
+distance is one bedroom, one bathroom, two parking spaces or FEATURE_DAYS days of age.
+A property type mismatch adds TYPE_MISMATCH units. One vectorized distance pass and an
+argpartition find the k nearest.
+
+Each comparable is weighted by recency (halving every half_life_days) and closeness;
+the estimate is the weighted median of their prices.
+
+    python comparable_sales.py --suburb Bondi --type House --bedrooms 3 --bathrooms 2 --parking 1
+"""
+import argparse
+import time
+import weakref
+from datetime import date
+
+import numpy as np
+
+from market_arrays import MarketArrays, day_number
+from market_queries import MarketData
+
+# Feature -> sale attribute difference that counts as one unit of distance
+FEATURE_SCALES = {'bedrooms': 1.0, 'bathrooms': 1.0, 'parking': 2.0}
+FEATURE_DAYS = 365.0
+TYPE_MISMATCH = 3.0
+# Distance contributed by a feature the sale did not record
+MISSING_FEATURE = 1.0
+
+
+def feature_matrix(sales):
+    """float32 matrix of scaled bedrooms, bathrooms and parking, NaN where the sale did not record one"""
+    columns = [np.where(getattr(sales, name) < 0, np.nan, getattr(sales, name) / scale)
+               for name, scale in FEATURE_SCALES.items()]
+    return np.column_stack(columns).astype(np.float32)
+
+
+def weighted_median(values, weights):
+    order = np.argsort(values)
+    cumulative = np.cumsum(weights[order])
+    return float(values[order][np.searchsorted(cumulative, cumulative[-1] / 2)])
+
+
+class ComparableSales:
+    """k-nearest comparable sales over the cached per-suburb arrays"""
+
+    def __init__(self, db_path='property_market.db', arrays=None):
+        self.arrays = arrays or MarketArrays(db_path)
+        self.market = MarketData(self.arrays.db_path)
+        # Keyed by the cached SuburbSales, so a matrix is dropped with the suburb version it was built from
+        self.indexes = weakref.WeakKeyDictionary()
+
+    def features(self, sales):
+        features = self.indexes.get(sales)
+        if features is None:
+            features = self.indexes[sales] = feature_matrix(sales)
+        return features
+
+    def search(self, suburb_id, property_type=None, bedrooms=None, bathrooms=None, parking=None, k=10,
+               as_of=None, max_age_days=730, half_life_days=180):
+        """The k nearest sales sold up to as_of and at most max_age_days before it
+
+        as_of defaults to the suburb's latest sale, so a database loaded up to a past date
+        still finds comparables; pass today's date to value as of now.
+
+        Returns {'comparables': [...], 'estimate': weighted median price or None}.
+        """
+        sales = self.arrays.suburb(suburb_id)
+        if as_of is not None:
+            today = day_number(as_of)
+        else:
+            today = int(sales.day.max()) if len(sales) else day_number(date.today().isoformat())
+        age = today - sales.day
+        eligible = (age >= 0) & (age <= max_age_days)
+
+        target = np.array([np.nan if v is None else v / scale
+                           for v, scale in zip((bedrooms, bathrooms, parking), FEATURE_SCALES.values())],
+                          dtype=np.float32)
+        diff = self.features(sales) - target
+        # Features the caller left out do not count; ones the sale is missing cost MISSING_FEATURE
+        diff = np.where(np.isnan(target), 0, np.where(np.isnan(diff), MISSING_FEATURE, diff))
+        distance = (diff ** 2).sum(axis=1) + (age / FEATURE_DAYS) ** 2
+        if property_type is not None:
+            codes = np.flatnonzero(sales.type_names == property_type)
+            distance += np.where(np.isin(sales.type_code, codes), 0, TYPE_MISMATCH ** 2)
+        distance = np.sqrt(distance)
+
+        candidates = np.flatnonzero(eligible)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(distance[candidates], k)[:k]]
+        candidates = candidates[np.argsort(distance[candidates], kind='stable')]
+
+        recency = 0.5 ** (age[candidates] / half_life_days)
+        weights = recency / (1 + distance[candidates])
+        comparables = [{
+            'id': int(sales.id[i]),
+            'sale_price': float(sales.price[i]),
+            'sale_date': str(np.datetime64(int(sales.day[i]), 'D')),
+            'property_type': str(sales.type_names[sales.type_code[i]]),
+            'bedrooms': int(sales.bedrooms[i]),
+            'bathrooms': int(sales.bathrooms[i]),
+            'parking': int(sales.parking[i]),
+            'distance': float(distance[i]),
+            'weight': float(w)
+        } for i, w in zip(candidates, weights)]
+        estimate = weighted_median(sales.price[candidates], weights) if len(candidates) else None
+        return {'comparables': comparables, 'estimate': estimate}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find comparable recent sales for a property")
+    parser.add_argument('--db', default='property_market.db')
+    parser.add_argument('--suburb', required=True)
+    parser.add_argument('--postcode')
+    parser.add_argument('--type', help="Property type, e.g. House")
+    parser.add_argument('--bedrooms', type=int)
+    parser.add_argument('--bathrooms', type=int)
+    parser.add_argument('--parking', type=int)
+    parser.add_argument('-k', type=int, default=10)
+    parser.add_argument('--as-of', help="Valuation date, YYYY-MM-DD (default: the suburb's latest sale)")
+    args = parser.parse_args()
+
+    engine = ComparableSales(args.db)
+    suburb = engine.market.find_suburb(args.suburb, args.postcode)
+    if suburb is None:
+        raise SystemExit(f"Unknown suburb {args.suburb}")
+    for label in ('cold', 'warm'):
+        start = time.perf_counter()
+        result = engine.search(suburb['id'], args.type, args.bedrooms, args.bathrooms, args.parking, args.k,
+                               args.as_of)
+        print(f"{label}: {(time.perf_counter() - start) * 1e3:.2f} ms")
+    for comp in result['comparables']:
+        print(f"  ${comp['sale_price']:>12,.0f}  {comp['sale_date']}  {comp['property_type']:<10} "
+              f"{comp['bedrooms']}bd {comp['bathrooms']}ba {comp['parking']}car  "
+              f"distance {comp['distance']:.2f}  weight {comp['weight']:.3f}")
+    if result['estimate'] is not None:
+        print(f"Estimate: ${result['estimate']:,.0f}")
@@ -0,0 +1,90 @@
+import os
+import sqlite3
+import threading
+from urllib.parse import quote
+
+
+class ReadPool:
+    """Read-only SQLite connections, one per thread, shared by every agent in the process
+
+    Connections open the file through a mode=ro URI (plus immutable=1 for catalogs that
+    never change while the process runs, which skips file locking entirely), keep their
+    prepared statements in sqlite3's per-connection statement cache, and are tuned with
+    mmap_size and cache_size. A connection is reopened if the file is replaced on disk.
+    Rows are sqlite3.Row, so they can be read by column name. functions are registered as
+    deterministic SQL functions on every connection.
+    """
+
+    def __init__(self, path, immutable=False, mmap_size=256 * 1024 * 1024, cache_size_kib=16 * 1024,
+                 cached_statements=128, functions=()):
+        self.path = os.path.abspath(path)
+        self.functions = list(functions)
+        self.immutable = immutable
+        self.mmap_size = int(mmap_size)
+        self.cache_size_kib = int(cache_size_kib)
+        self.cached_statements = cached_statements
+        self.connections = {}  # thread ident -> (file identity, connection)
+        self.lock = threading.Lock()
+
+    def uri(self):
+        uri = f"file:{quote(self.path)}?mode=ro"
+        return uri + "&immutable=1" if self.immutable else uri
+
+    def open(self):
+        conn = sqlite3.connect(self.uri(), uri=True, check_same_thread=False,
+                               cached_statements=self.cached_statements)
+        conn.row_factory = sqlite3.Row
+        for name, num_args, fn in self.functions:
+            conn.create_function(name, num_args, fn, deterministic=True)
+        conn.execute(f'PRAGMA mmap_size={self.mmap_size}')
+        conn.execute(f'PRAGMA cache_size=-{self.cache_size_kib}')
+        return conn
+
+    def connection(self):
+        """This thread's connection, opened on first use"""
+        stat = os.stat(self.path)
+        identity = (stat.st_dev, stat.st_ino)
+        ident = threading.get_ident()
+        entry = self.connections.get(ident)
+        if entry is not None and entry[0] == identity:
+            return entry[1]
+
+        conn = self.open()
+        with self.lock:
+            if entry is not None:
+                entry[1].close()
+            self.connections[ident] = (identity, conn)
+            # Close connections left behind by threads that have exited
+            live = {t.ident for t in threading.enumerate()}
+            for dead in [i for i in self.connections if i not in live]:
+                self.connections.pop(dead)[1].close()
+        return conn
+
+    def execute(self, sql, params=()):
+        return self.connection().execute(sql, params)
+
+    def close(self):
+        with self.lock:
+            for _, conn in self.connections.values():
+                conn.close()
+            self.connections.clear()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(path, functions=()):
+    """Process-wide pool for a database file; MORTGAGE_DB_IMMUTABLE=1 opens catalogs as immutable
+
+    functions only apply when the pool is first created, so pass the same list on every call.
+    """
+    key = os.path.abspath(path)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                immutable = os.getenv("MORTGAGE_DB_IMMUTABLE", "0") in ('1', 'true')
+                pool = _pools[key] = ReadPool(path, immutable=immutable, functions=functions)
+    return pool
@@ -0,0 +1,369 @@
+"""Stream CSV/JSONL market feeds into property_market.db.
+
+Feeds are read chunk by chunk, so memory stays flat whatever the file size. Each chunk is
+validated and coerced column-wise with NumPy. Suburbs are resolved to suburbs.id through
+an in-memory dictionary, and the rows are upserted in one transaction per chunk.
+Re-ingesting a feed leaves the database unchanged:
+
+    python ingest_market_data.py sales_2024-06-30.csv --table recent_sales
+    python ingest_market_data.py trends.jsonl.gz --table market_trends --db property_market.db
+
+Rows identify their suburb with suburb_id, or with suburb (name) and/or postcode. Sales
+upsert on the feed's id column. Without one, an id is derived from the sale's fields, so
+a re-delivered sale lands on the same row. Trends upsert on (suburb_id, month).
+
+After a sales feed, the suburb_sales_stats partitions it touched are recomputed (see
+market_stats.py). A run that fails part way is repaired by running the same feed again.
+"""
+import argparse
+import csv
+import gzip
+import json
+import sqlite3
+import time
+import zlib
+from collections import Counter
+from itertools import islice
+
+import numpy as np
+
+import market_stats
+from setup_market_database import create_schema, ensure_index
+
+# Feed column -> coercion; only these columns are read
+FIELDS = {
+    'recent_sales': {
+        'id': 'int',
+        'property_type': 'text',
+        'bedrooms': 'int',
+        'bathrooms': 'int',
+        'parking': 'int',
+        'sale_price': 'float',
+        'sale_date': 'date',
+        'days_on_market': 'int'
+    },
+    'market_trends': {
+        'month': 'month',
+        'avg_interest_rate': 'float',
+        'clearance_rate': 'float',
+        'new_listings': 'int'
+    }
+}
+
+# Rows missing any of these (or a resolvable suburb) are rejected
+REQUIRED = {
+    'recent_sales': ('sale_price', 'sale_date'),
+    'market_trends': ('month',)
+}
+
+# Inclusive bounds; values outside them reject the row
+RANGES = {
+    'bedrooms': (0, 20),
+    'bathrooms': (0, 20),
+    'parking': (0, 20),
+    'sale_price': (10000, 1e9),
+    'days_on_market': (0, 3650),
+    'avg_interest_rate': (0, 25),
+    'clearance_rate': (0, 1),
+    'new_listings': (0, 1e6)
+}
+
+PROPERTY_TYPE_ALIASES = {'Unit': 'Apartment', 'Flat': 'Apartment', 'Villa': 'Townhouse'}
+
+# Derived sale ids live in [2**62, 2**63), clear of sequential ids
+DERIVED_ID_BASE = np.uint64(1 << 62)
+
+
+# Feed columns that identify the suburb, in lookup order
+SUBURB_FIELDS = ('suburb_id', 'suburb', 'postcode')
+
+
+def read_chunks(path, names, chunk_size, fmt=None):
+    """Yield (columns, rows, malformed) per chunk, columns mapping each name in the feed to its string values
+
+    Malformed lines (bad JSON, or CSV rows with the wrong number of fields) are dropped and counted.
+    """
+    opener = gzip.open if path.endswith('.gz') else open
+    fmt = fmt or ('jsonl' if any(ext in path for ext in ('.jsonl', '.ndjson')) else 'csv')
+    with opener(path, 'rt', newline='', encoding='utf-8') as f:
+        if fmt == 'csv':
+            reader = csv.reader(f)
+            header = [h.strip() for h in next(reader, [])]
+            wanted = [(name, header.index(name)) for name in names if name in header]
+            while True:
+                chunk = list(islice(reader, chunk_size))
+                if not chunk:
+                    break
+                rows = [r for r in chunk if len(r) == len(header)]
+                fields = list(zip(*rows))
+                columns = {name: fields[i] if rows else () for name, i in wanted}
+                yield columns, len(rows), len(chunk) - len(rows)
+        else:
+            lines = (line for line in f if line.strip())
+            while True:
+                chunk = [parse_line(line) for line in islice(lines, chunk_size)]
+                if not chunk:
+                    break
+                rows = [r for r in chunk if r is not None]
+                columns = {name: ['' if r.get(name) is None else str(r.get(name)) for r in rows] for name in names}
+                yield columns, len(rows), len(chunk) - len(rows)
+
+
+def parse_line(line):
+    try:
+        row = json.loads(line)
+    except json.JSONDecodeError:
+        return None
+    return row if isinstance(row, dict) else None
+
+
+def text_column(columns, name, rows):
+    """Stripped strings, '' where the field is missing"""
+    if name not in columns:
+        return np.full(rows, '')
+    return np.char.strip(np.array(columns[name], dtype=str))
+
+
+def to_number(text):
+    """float array; blanks and unparseable values become NaN"""
+    text = np.char.replace(np.char.replace(text, ',', ''), '$', '')
+    text = np.where(text == '', 'nan', text)
+    try:
+        return text.astype(float)
+    except ValueError:
+        # Only chunks with a bad value pay for the per-value path
+        return np.array([parse_float(t) for t in text])
+
+
+def parse_float(text):
+    try:
+        return float(text)
+    except ValueError:
+        return np.nan
+
+
+def to_date(text, unit='D'):
+    """datetime64[D] array (first of the month for unit='M'); unparseable values become NaT"""
+    # Keeps YYYY-MM-DD (or YYYY-MM) and drops any time of day
+    text = text.astype('U10')
+    try:
+        dates = text.astype('datetime64[D]')
+    except ValueError:
+        dates = np.array([parse_date(t) for t in text], dtype='datetime64[D]')
+    return dates.astype(f'datetime64[{unit}]').astype('datetime64[D]')
+
+
+def parse_date(text):
+    try:
+        return np.datetime64(text, 'D')
+    except ValueError:
+        return np.datetime64('NaT')
+
+
+def normalise_name(name):
+    return ' '.join(str(name).split()).lower()
+
+
+def normalise_postcode(postcode):
+    postcode = str(postcode).strip()
+    if postcode.endswith('.0'):
+        postcode = postcode[:-2]
+    return postcode.zfill(4) if postcode.isdigit() else postcode
+
+
+class SuburbIndex:
+    """suburbs.id by id, (name, postcode), and name or postcode alone where that is unambiguous"""
+
+    def __init__(self, conn):
+        self.ids = set()
+        self.by_name_postcode = {}
+        names = {}
+        postcodes = {}
+        for suburb_id, name, postcode in conn.execute('SELECT id, name, postcode FROM suburbs'):
+            name = normalise_name(name)
+            postcode = normalise_postcode(postcode)
+            self.ids.add(suburb_id)
+            self.by_name_postcode[(name, postcode)] = suburb_id
+            names.setdefault(name, set()).add(suburb_id)
+            postcodes.setdefault(postcode, set()).add(suburb_id)
+        self.by_name = {name: ids.pop() for name, ids in names.items() if len(ids) == 1}
+        self.by_postcode = {postcode: ids.pop() for postcode, ids in postcodes.items() if len(ids) == 1}
+
+    def lookup(self, suburb_id, name, postcode):
+        if suburb_id:
+            try:
+                suburb_id = int(float(suburb_id))
+            except ValueError:
+                return 0
+            return suburb_id if suburb_id in self.ids else 0
+        name = normalise_name(name) if name else ''
+        postcode = normalise_postcode(postcode) if postcode else ''
+        if name and postcode:
+            return self.by_name_postcode.get((name, postcode), 0)
+        return self.by_name.get(name, 0) if name else self.by_postcode.get(postcode, 0)
+
+    def resolve(self, columns, rows):
+        """suburbs.id per row, 0 where the suburb is unknown or ambiguous"""
+        keys = list(zip(*(columns.get(name, [''] * rows) for name in SUBURB_FIELDS)))
+        # A feed names few distinct suburbs, so look each one up once per chunk
+        found = {key: self.lookup(*key) for key in set(keys)}
+        return np.fromiter((found[key] for key in keys), dtype=np.int64, count=rows)
+
+
+def coerce(raw, rows, table, suburbs):
+    """Validated columns for the rows that pass, plus a Counter of rejection reasons"""
+    rejected = Counter()
+    suburb_ids = suburbs.resolve(raw, rows)
+    columns = {}
+    valid = suburb_ids > 0
+    rejected['unknown suburb'] = int((~valid).sum())
+    for name, kind in FIELDS[table].items():
+        text = text_column(raw, name, rows)
+        if kind == 'text':
+            values = np.char.title(text)
+            for alias, canonical in PROPERTY_TYPE_ALIASES.items():
+                values = np.where(values == alias, canonical, values)
+            missing = values == ''
+            bad = np.zeros(rows, dtype=bool)
+        elif kind in ('date', 'month'):
+            values = to_date(text, 'M' if kind == 'month' else 'D')
+            missing = text == ''
+            bad = np.isnat(values) & ~missing
+        else:
+            values = to_number(text)
+            missing = text == ''
+            bad = np.isnan(values) & ~missing
+            if kind == 'int':
+                bad |= ~missing & ~bad & (values != np.round(values))
+            if name in RANGES:
+                low, high = RANGES[name]
+                bad |= ~missing & ~bad & ((values < low) | (values > high))
+        if name in REQUIRED[table]:
+            bad |= missing
+        rejected[f'bad {name}'] = int((bad & valid).sum())
+        valid &= ~bad
+        columns[name] = (values, missing, kind)
+
+    rejected = Counter({reason: n for reason, n in rejected.items() if n})
+    columns = {name: nullable(*column, valid) for name, column in columns.items() if name != 'suburb_id'}
+    return {'suburb_id': suburb_ids[valid], **columns}, rejected
+
+
+def nullable(values, missing, kind, valid):
+    """The valid rows as an object array of Python values, None where the field was blank"""
+    values, missing = values[valid], missing[valid]
+    if kind in ('date', 'month'):
+        values = values.astype(str)
+    elif kind == 'int':
+        values = np.where(missing, 0, values).astype(np.int64)
+    # astype(object) yields Python ints, floats and strs, which sqlite3 binds directly
+    return np.where(missing, None, values.astype(object))
+
+
+def mix(h):
+    """splitmix64 finaliser on a uint64 array"""
+    h = (h ^ (h >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    h = (h ^ (h >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return h ^ (h >> np.uint64(31))
+
+
+def derived_sale_ids(columns):
+    """Stable ids from the fields that identify a sale, so re-delivered rows land on the same row"""
+    h = columns['suburb_id'].astype(np.uint64)
+    date = np.array(columns['sale_date'], dtype='datetime64[D]').astype(np.int64)
+    price = np.round(columns['sale_price'].astype(float) * 100).astype(np.int64)
+    types = columns['property_type']
+    kinds, inverse = np.unique(types.astype(str), return_inverse=True)
+    type_code = np.array([zlib.crc32(k.encode()) for k in kinds], dtype=np.int64)[inverse]
+    fields = [date, price, type_code] + [np.where(columns[n] == None, -1, columns[n]).astype(np.int64)  # noqa: E711
+                                         for n in ('bedrooms', 'bathrooms', 'parking')]
+    with np.errstate(over='ignore'):
+        for field in fields:
+            h = mix(h ^ field.astype(np.uint64))
+    return (h >> np.uint64(2)) | DERIVED_ID_BASE
+
+
+def assign_sale_ids(columns):
+    """Fill in derived ids where the feed had none; returns the ids that came from the feed"""
+    ids = columns['id']
+    missing = ids == None  # noqa: E711
+    if missing.any():
+        ids[missing] = derived_sale_ids(columns)[missing].astype(np.int64).tolist()
+    return ids[~missing].tolist()
+
+
+def upsert(conn, table, columns):
+    """INSERT ... ON CONFLICT DO UPDATE for the chunk; returns the number of rows written"""
+    key = ('id',) if table == 'recent_sales' else ('suburb_id', 'month')
+    names = list(columns)
+    updates = ', '.join(f"{n} = excluded.{n}" for n in names if n not in key)
+    sql = (f"INSERT INTO {table} ({', '.join(names)}) VALUES ({', '.join('?' * len(names))}) "
+           f"ON CONFLICT ({', '.join(key)}) DO UPDATE SET {updates}")
+    conn.executemany(sql, zip(*(columns[n].tolist() for n in names)))
+    return len(columns[names[0]])
+
+
+def ingest(path, table, db_path='property_market.db', chunk_size=100000, fmt=None):
+    """Load one feed file; returns (rows written, Counter of rejection reasons)"""
+    start = time.perf_counter()
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA cache_size=-262144')
+    create_schema(conn)
+    with conn:
+        # The trends upsert needs its unique key and the stats refresh reads through the sales type index
+        ensure_index(conn, 'idx_trends_suburb_month')
+        ensure_index(conn, 'idx_sales_suburb_type_beds')
+    suburbs = SuburbIndex(conn)
+
+    written = 0
+    read = 0
+    rejected = Counter()
+    names = SUBURB_FIELDS + tuple(FIELDS[table])
+    touched = set()
+    for raw, rows, malformed in read_chunks(path, names, chunk_size, fmt):
+        # A chunk of nothing but malformed lines has no columns to coerce
+        if rows:
+            columns, chunk_rejected = coerce(raw, rows, table, suburbs)
+            with conn:
+                if table == 'recent_sales':
+                    # Derived ids are a function of the partition, so only feed ids can move a sale between partitions
+                    touched |= market_stats.previous_partitions(conn, assign_sale_ids(columns))
+                    touched |= market_stats.sale_partitions(columns['suburb_id'], columns['property_type'],
+                                                            columns['sale_date'])
+                written += upsert(conn, table, columns)
+            rejected.update(chunk_rejected)
+        read += rows + malformed
+        if malformed:
+            rejected['malformed'] += malformed
+        elapsed = time.perf_counter() - start
+        print(f"{read:,} rows read, {written:,} written ({read / max(elapsed, 1e-9):,.0f} rows/s)", flush=True)
+
+    if touched:
+        refresh_start = time.perf_counter()
+        with conn:
+            refreshed = market_stats.refresh(conn, touched)
+        print(f"Refreshed {refreshed:,} of {len(touched):,} touched suburb_sales_stats partitions "
+              f"in {time.perf_counter() - refresh_start:.1f}s")
+
+    conn.execute('PRAGMA optimize')
+    conn.close()
+    elapsed = time.perf_counter() - start
+    print(f"Ingested {path} into {table}: {written:,} of {read:,} rows in {elapsed:.1f}s "
+          f"({read / max(elapsed, 1e-9):,.0f} rows/s)")
+    for reason, n in rejected.most_common():
+        print(f"  rejected {n:,}: {reason}")
+    return written, rejected
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load a CSV/JSONL market feed into the property market database")
+    parser.add_argument('feed', help="CSV or JSONL file, optionally .gz")
+    parser.add_argument('--table', choices=sorted(FIELDS), required=True)
+    parser.add_argument('--db', default='property_market.db')
+    parser.add_argument('--format', choices=['csv', 'jsonl'], help="Default: from the file extension")
+    parser.add_argument('--chunk-size', type=int, default=100000, help="Rows per validation batch and transaction")
+    args = parser.parse_args()
+
+    ingest(args.feed, args.table, args.db, args.chunk_size, args.format)
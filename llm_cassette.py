@@ -0,0 +1,120 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+from collections import defaultdict, deque
+from types import SimpleNamespace
+
+
+class CassetteMiss(KeyError):
+    """Raised in replay mode when no recorded response matches a request"""
+
+
+def request_key(kwargs):
+    """Stable hash of the create() arguments used to match recordings"""
+    payload = json.dumps(kwargs, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()[:20]
+
+
+def to_namespace(value):
+    """Turn recorded JSON back into attribute-style objects like the SDK returns"""
+    if isinstance(value, dict):
+        return SimpleNamespace(**{k: to_namespace(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return [to_namespace(v) for v in value]
+    return value
+
+
+def to_plain(response):
+    """Convert an SDK response object into plain JSON data"""
+    if hasattr(response, 'model_dump'):
+        return response.model_dump()
+    if isinstance(response, SimpleNamespace):
+        return {k: to_plain(v) for k, v in vars(response).items()}
+    if isinstance(response, list):
+        return [to_plain(v) for v in response]
+    return response
+
+
+class CassetteClient:
+    """Drop-in stand-in for an OpenAI client that records or replays chat completions
+
+    Recordings are gzipped JSON lines of {"key", "response"} (or {"key", "stream"}
+    for streamed calls), keyed by a hash of the request. Identical requests are
+    replayed in the order they were recorded; the last one repeats once exhausted.
+    """
+
+    def __init__(self, client, path, mode='replay'):
+        if mode not in ('record', 'replay'):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        if mode == 'record' and client is None:
+            raise ValueError("Record mode needs a real client to forward calls to")
+        self.client = client
+        self.path = path
+        self.mode = mode
+        self.lock = threading.Lock()
+        self.recordings = defaultdict(deque)
+        self.last_played = {}
+        if mode == 'replay':
+            self.load()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def load(self):
+        """Read every recording into per-key queues"""
+        with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self.recordings[entry['key']].append(entry)
+
+    def create(self, **kwargs):
+        key = request_key(kwargs)
+        if self.mode == 'replay':
+            return self.replay(key)
+        response = self.client.chat.completions.create(**kwargs)
+        if kwargs.get('stream'):
+            return self.record_stream(key, response)
+        self.append({'key': key, 'response': to_plain(response)})
+        return response
+
+    def replay(self, key):
+        with self.lock:
+            queue = self.recordings.get(key)
+            if queue:
+                entry = queue.popleft()
+                self.last_played[key] = entry
+            elif key in self.last_played:
+                entry = self.last_played[key]
+            else:
+                raise CassetteMiss(f"No recorded response for request {key} in {self.path}")
+        if 'stream' in entry:
+            return iter(to_namespace(entry['stream']))
+        return to_namespace(entry['response'])
+
+    def record_stream(self, key, stream):
+        """Pass chunks through to the caller and record them once the stream ends"""
+        chunks = []
+        for chunk in stream:
+            chunks.append(to_plain(chunk))
+            yield chunk
+        self.append({'key': key, 'stream': chunks})
+
+    def append(self, entry):
+        line = json.dumps(entry, separators=(',', ':')) + '\n'
+        with self.lock:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            # Each append adds a gzip member, which gzip.open reads back as one stream
+            with gzip.open(self.path, 'at', encoding='utf-8') as f:
+                f.write(line)
+
+
+def wrap_client(client_factory):
+    """Apply LLM_CASSETTE / LLM_CASSETTE_MODE to a client, creating the real one only when needed"""
+    path = os.getenv("LLM_CASSETTE")
+    if not path:
+        return client_factory()
+    mode = os.getenv("LLM_CASSETTE_MODE", "replay")
+    if mode == 'replay':
+        return CassetteClient(None, path, mode)
+    return CassetteClient(client_factory(), path, mode)
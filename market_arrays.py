@@ -0,0 +1,205 @@
+"""In-memory NumPy views of each suburb's sales, and the percentile engine built on them.
+
+A suburb's sales are loaded once into column arrays sorted by price and cached until
+suburb_versions says they changed. Any filter (type, bedrooms, date window, ...) is then a
+boolean mask over already-sorted prices, so exact percentiles need no sort and no SQL.
+
+For large selections (many suburbs, or above exact_limit rows) the engine can answer from
+a fixed 1/16 subset chosen by hashing each sale id. A hash sample is uniform whatever
+filter is applied afterwards, so the Dvoretzky-Kiefer-Wolfowitz bound holds: with m
+sampled matches, every reported percentile is within eps = sqrt(ln(2/delta) / 2m) of the
+true rank, with probability 1 - delta.
+
+    python market_arrays.py --suburb Bondi --type House --bedrooms 3 --percentiles 25 50 75
+"""
+import argparse
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+import db_pool
+from market_queries import MarketData
+from market_stats import group_percentiles
+
+SUBURB_SALES_QUERY = '''
+    SELECT id, sale_date, sale_price, property_type, bedrooms, bathrooms, parking, days_on_market
+    FROM recent_sales
+    WHERE suburb_id = :suburb_id AND sale_price IS NOT NULL AND sale_date IS NOT NULL
+'''
+
+VERSION_QUERY = 'SELECT version FROM suburb_versions WHERE suburb_id = :suburb_id'
+
+# Sales whose hashed id falls below this fraction of the hash range form the approximate-mode sample
+SAMPLE_RATE = 1 / 16
+
+# percentiles() modes; 'auto' picks exact or approx from the number of matching sales
+MODES = ('auto', 'exact', 'approx')
+
+EPOCH = np.datetime64('1970-01-01', 'D')
+
+
+def day_number(value):
+    """Days since 1970-01-01 for an ISO date (or datetime64)"""
+    return int((np.datetime64(value, 'D') - EPOCH).astype(np.int64))
+
+
+def sampled(ids):
+    """Stable pseudo-random selection of SAMPLE_RATE of the ids (splitmix64 of the id)"""
+    h = np.asarray(ids, dtype=np.int64).astype(np.uint64)
+    with np.errstate(over='ignore'):
+        h = (h ^ (h >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        h = (h ^ (h >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        h ^= h >> np.uint64(31)
+    return h < np.uint64(int(SAMPLE_RATE * 2 ** 64))
+
+
+class SuburbSales:
+    """Column arrays of one suburb's sales, sorted by price; missing integers are -1"""
+
+    def __init__(self, rows):
+        ids, dates, prices, types, bedrooms, bathrooms, parking, days = zip(*rows) if rows else ([],) * 8
+        prices = np.array(prices, dtype=float)
+        order = np.argsort(prices, kind='stable')
+        self.price = prices[order]
+        self.id = np.array(ids, dtype=np.int64)[order]
+        self.day = (np.array(dates, dtype='U10').astype('datetime64[D]') - EPOCH).astype(np.int64)[order]
+        type_names = ['' if t is None else t for t in types]
+        self.type_names, codes = np.unique(np.array(type_names, dtype=str), return_inverse=True)
+        self.type_code = codes.astype(np.int16)[order]
+        self.bedrooms = self.integers(bedrooms)[order]
+        self.bathrooms = self.integers(bathrooms)[order]
+        self.parking = self.integers(parking)[order]
+        self.days_on_market = self.integers(days)[order]
+        self.sampled = sampled(self.id)
+
+    @staticmethod
+    def integers(values):
+        return np.array([-1 if v is None else v for v in values], dtype=np.int64)
+
+    def __len__(self):
+        return len(self.price)
+
+    def mask(self, property_type=None, bedrooms=None, bathrooms=None, parking=None, since=None, until=None):
+        """Boolean mask of the sales matching every given filter
+
+        bedrooms, bathrooms and parking take a number or an inclusive (low, high) pair.
+        """
+        keep = np.ones(len(self), dtype=bool)
+        if property_type is not None:
+            wanted = [property_type] if isinstance(property_type, str) else list(property_type)
+            codes = [i for i, name in enumerate(self.type_names) if name in wanted]
+            keep &= np.isin(self.type_code, codes)
+        for column, wanted in ((self.bedrooms, bedrooms), (self.bathrooms, bathrooms), (self.parking, parking)):
+            if wanted is None:
+                continue
+            low, high = wanted if isinstance(wanted, (tuple, list)) else (wanted, wanted)
+            keep &= (column >= low) & (column <= high)
+        if since is not None:
+            keep &= self.day >= day_number(since)
+        if until is not None:
+            keep &= self.day <= day_number(until)
+        return keep
+
+
+class MarketArrays:
+    """Per-suburb SuburbSales, cached (LRU) and reloaded when the suburb's version changes"""
+
+    def __init__(self, db_path='property_market.db', max_suburbs=512, exact_limit=200000):
+        self.db_path = db_path
+        self.max_suburbs = max_suburbs
+        self.exact_limit = exact_limit
+        self.cache = OrderedDict()  # suburb_id -> (version, SuburbSales)
+        self.identity = None
+        self.lock = threading.Lock()
+
+    def pool(self):
+        return db_pool.get_pool(self.db_path)
+
+    def suburb(self, suburb_id):
+        """SuburbSales for a suburb, loading it when it is new or its sales have changed"""
+        stat = os.stat(self.db_path)
+        identity = (stat.st_dev, stat.st_ino)
+        row = self.pool().execute(VERSION_QUERY, {'suburb_id': suburb_id}).fetchone()
+        version = row[0] if row else 0
+        with self.lock:
+            if identity != self.identity:
+                # A replaced database file restarts its version numbers
+                self.cache.clear()
+                self.identity = identity
+            entry = self.cache.get(suburb_id)
+            if entry is not None and entry[0] == version:
+                self.cache.move_to_end(suburb_id)
+                return entry[1]
+
+        sales = SuburbSales(self.pool().execute(SUBURB_SALES_QUERY, {'suburb_id': suburb_id}).fetchall())
+        with self.lock:
+            self.cache[suburb_id] = (version, sales)
+            self.cache.move_to_end(suburb_id)
+            while len(self.cache) > self.max_suburbs:
+                self.cache.popitem(last=False)
+        return sales
+
+    def percentiles(self, suburb_ids, percentiles=(50,), mode='auto', confidence=0.95, **filters):
+        """Sale price percentiles over one or more suburbs, after filters (see SuburbSales.mask)
+
+        mode is 'exact', 'approx' (hash sample) or 'auto', which is exact up to exact_limit sales
+        matching the filters. Returns count (estimated in approx mode), values {percentile: price},
+        exact, and rank_error: the DKW bound on how far each value's rank may be off, as a fraction.
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown percentile mode {mode!r} (expected one of {MODES})")
+        if isinstance(suburb_ids, int):
+            suburb_ids = [suburb_ids]
+        suburbs = [self.suburb(suburb_id) for suburb_id in suburb_ids]
+        masks = [sales.mask(**filters) for sales in suburbs]
+        if mode == 'auto':
+            mode = 'exact' if sum(int(keep.sum()) for keep in masks) <= self.exact_limit else 'approx'
+
+        selected = []
+        for sales, keep in zip(suburbs, masks):
+            if mode == 'approx':
+                keep &= sales.sampled
+            selected.append(sales.price[keep])
+        # Each suburb's selection is already sorted; only a multi-suburb union needs a merge
+        prices = selected[0] if len(selected) == 1 else np.sort(np.concatenate(selected or [np.empty(0)]))
+
+        m = len(prices)
+        result = {'count': m, 'values': {}, 'exact': mode == 'exact', 'rank_error': 0.0}
+        if mode == 'approx':
+            result['count'] = int(round(m / SAMPLE_RATE))
+            result['rank_error'] = math.sqrt(math.log(2 / (1 - confidence)) / (2 * m)) if m else 1.0
+        if m:
+            values = group_percentiles(prices, np.array([0]), np.array([m]), percentiles)[0]
+            result['values'] = dict(zip(percentiles, values.tolist()))
+        return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sale price percentiles for a suburb from the in-memory engine")
+    parser.add_argument('--db', default='property_market.db')
+    parser.add_argument('--suburb', required=True, help="Suburb name")
+    parser.add_argument('--postcode')
+    parser.add_argument('--type', help="Property type, e.g. House")
+    parser.add_argument('--bedrooms', type=int)
+    parser.add_argument('--since', help="Earliest sale date, YYYY-MM-DD")
+    parser.add_argument('--percentiles', type=float, nargs='+', default=[10, 25, 50, 75, 90])
+    parser.add_argument('--mode', choices=['auto', 'exact', 'approx'], default='auto')
+    args = parser.parse_args()
+
+    suburb = MarketData(args.db).find_suburb(args.suburb, args.postcode)
+    if suburb is None:
+        raise SystemExit(f"Unknown suburb {args.suburb}")
+    engine = MarketArrays(args.db)
+    for label in ('cold', 'warm'):
+        start = time.perf_counter()
+        result = engine.percentiles(suburb['id'], args.percentiles, args.mode, property_type=args.type,
+                                    bedrooms=args.bedrooms, since=args.since)
+        print(f"{label}: {(time.perf_counter() - start) * 1e3:.2f} ms")
+    print(f"{suburb['name']}: {result['count']:,} sales ({'exact' if result['exact'] else 'approximate'}, "
+          f"rank error {result['rank_error']:.3f})")
+    for p, value in result['values'].items():
+        print(f"  p{p:g}: ${value:,.0f}")
@@ -0,0 +1,262 @@
+"""Read-side queries over property_market.db.
+
+Every query here is answered from one of setup_market_database.INDEXES: an index seek on
+the suburb, then a range or equality scan. None of them scan a table. check_plans runs
+EXPLAIN QUERY PLAN on each query and reports any that has stopped using its index, so a
+schema or query change that loses an index fails loudly instead of getting slow:
+
+    python market_queries.py --db property_market.db
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import date, timedelta
+
+import db_pool
+from setup_market_database import create_indexes, create_schema
+
+# Read whole (once per database version) by suburb_names, so it is not in EXPECTED_PLANS
+SUBURB_NAMES_QUERY = 'SELECT id, name, postcode FROM suburbs ORDER BY id'
+
+SUBURB_QUERY = '''
+    SELECT id, name, postcode, state, median_price, price_growth_ytd, avg_days_on_market
+    FROM suburbs
+    WHERE name = :name COLLATE NOCASE AND (:postcode IS NULL OR postcode = :postcode)
+    LIMIT 1
+'''
+
+RECENT_SALES_QUERY = '''
+    SELECT id, property_type, bedrooms, bathrooms, parking, sale_price, sale_date, days_on_market
+    FROM recent_sales
+    WHERE suburb_id = :suburb_id AND sale_date BETWEEN :since AND :until
+    ORDER BY sale_date DESC
+    LIMIT :limit
+'''
+
+SALES_SUMMARY_QUERY = '''
+    SELECT COUNT(*) AS sales, AVG(sale_price) AS avg_price, MIN(sale_price) AS min_price,
+           MAX(sale_price) AS max_price, AVG(days_on_market) AS avg_days_on_market
+    FROM recent_sales
+    WHERE suburb_id = :suburb_id AND sale_date BETWEEN :since AND :until
+'''
+
+COMPARABLE_SALES_QUERY = '''
+    SELECT id, sale_price, sale_date, days_on_market
+    FROM recent_sales
+    WHERE suburb_id = :suburb_id AND property_type = :property_type AND bedrooms = :bedrooms
+      AND sale_date >= :since
+    ORDER BY sale_date DESC
+    LIMIT :limit
+'''
+
+TRENDS_QUERY = '''
+    SELECT month, avg_interest_rate, clearance_rate, new_listings
+    FROM market_trends
+    WHERE suburb_id = :suburb_id AND month >= :since
+    ORDER BY month
+'''
+
+COMPETITOR_RATES_QUERY = '''
+    SELECT lender_name, interest_rate, comparison_rate, last_updated
+    FROM competitor_rates
+    WHERE product_type = :product_type
+    ORDER BY interest_rate
+    LIMIT :limit
+'''
+
+LATEST_SALE_QUERY = '''
+    SELECT MAX(sale_date) AS latest FROM recent_sales WHERE suburb_id = :suburb_id
+'''
+
+LATEST_TREND_QUERY = '''
+    SELECT MAX(month) AS latest FROM market_trends WHERE suburb_id = :suburb_id
+'''
+
+SUBURB_STATS_QUERY = '''
+    SELECT property_type, month, sales, median_price, p25_price, p75_price, avg_days_on_market
+    FROM suburb_sales_stats
+    WHERE suburb_id = :suburb_id AND month BETWEEN :since AND :until
+    ORDER BY property_type, month
+'''
+
+# query -> (sql, sample parameters, index the plan must use, whether the index must cover it)
+EXPECTED_PLANS = {
+    'suburb': (SUBURB_QUERY, {'name': 'Bondi', 'postcode': None}, 'idx_suburbs_name', False),
+    'recent_sales': (RECENT_SALES_QUERY, {'suburb_id': 1, 'since': '2024-01-01', 'until': '2024-06-30', 'limit': 20},
+                     'idx_sales_suburb_date', False),
+    'sales_summary': (SALES_SUMMARY_QUERY, {'suburb_id': 1, 'since': '2024-01-01', 'until': '2024-06-30'},
+                      'idx_sales_suburb_date', True),
+    'comparable_sales': (COMPARABLE_SALES_QUERY, {'suburb_id': 1, 'property_type': 'House', 'bedrooms': 3,
+                                                  'since': '2024-01-01', 'limit': 20},
+                         'idx_sales_suburb_type_beds', True),
+    'trends': (TRENDS_QUERY, {'suburb_id': 1, 'since': '2023-07-01'}, 'idx_trends_suburb_month', False),
+    'competitor_rates': (COMPETITOR_RATES_QUERY, {'product_type': 'variable', 'limit': 5},
+                         'idx_competitor_product_rate', False),
+    'latest_sale': (LATEST_SALE_QUERY, {'suburb_id': 1}, 'idx_sales_suburb_date', True),
+    'latest_trend': (LATEST_TREND_QUERY, {'suburb_id': 1}, 'idx_trends_suburb_month', True),
+    'suburb_stats': (SUBURB_STATS_QUERY, {'suburb_id': 1, 'since': '2024-01-01', 'until': '2024-06-30'},
+                     'PRIMARY KEY', False)
+}
+
+
+class MarketData:
+    """Suburb, sales and trend lookups for the agent, over the shared read-only connection pool
+
+    Windows that are not given end at the suburb's latest sale (or trend month), not today,
+    so a database loaded up to some date keeps answering with its most recent data.
+    """
+
+    def __init__(self, db_path='property_market.db'):
+        self.db_path = db_path
+
+    def query(self, sql, params):
+        return db_pool.get_pool(self.db_path).execute(sql, params).fetchall()
+
+    def suburb_names(self):
+        """{lowercased name: suburb row} for every suburb, cached per database version"""
+        return suburb_names(self.db_path)
+
+    def find_suburb(self, name, postcode=None):
+        rows = self.query(SUBURB_QUERY, {'name': name.strip(), 'postcode': postcode})
+        return dict(rows[0]) if rows else None
+
+    def latest_sale_date(self, suburb_id):
+        """The suburb's most recent sale_date, or None when it has no sales"""
+        return self.query(LATEST_SALE_QUERY, {'suburb_id': suburb_id})[0]['latest']
+
+    def latest_trend_month(self, suburb_id):
+        return self.query(LATEST_TREND_QUERY, {'suburb_id': suburb_id})[0]['latest']
+
+    def recent_sales(self, suburb_id, since=None, until=None, limit=20):
+        """Latest sales in a suburb, newest first; the window defaults to the six months to its latest sale"""
+        since, until = sale_window(since, until or self.latest_sale_date(suburb_id))
+        return self.query(RECENT_SALES_QUERY, {'suburb_id': suburb_id, 'since': since, 'until': until,
+                                               'limit': limit})
+
+    def sales_summary(self, suburb_id, since=None, until=None):
+        since, until = sale_window(since, until or self.latest_sale_date(suburb_id))
+        return dict(self.query(SALES_SUMMARY_QUERY, {'suburb_id': suburb_id, 'since': since, 'until': until})[0])
+
+    def comparable_sales(self, suburb_id, property_type, bedrooms, since=None, limit=20):
+        """Latest sales of the same type and bedroom count in a suburb"""
+        if since is None:
+            since, _ = sale_window(None, self.latest_sale_date(suburb_id))
+        return self.query(COMPARABLE_SALES_QUERY, {'suburb_id': suburb_id, 'property_type': property_type,
+                                                   'bedrooms': bedrooms, 'since': since, 'limit': limit})
+
+    def trends(self, suburb_id, months=12, until=None):
+        """Monthly trends for the months months up to until (default the latest trend month), oldest first"""
+        since, _ = month_window(months, until or self.latest_trend_month(suburb_id))
+        return self.query(TRENDS_QUERY, {'suburb_id': suburb_id, 'since': since})
+
+    def suburb_stats(self, suburb_id, months=12, until=None):
+        """Monthly price percentiles and days on market per property type, from suburb_sales_stats
+
+        The months end at until, by default the month of the suburb's latest sale.
+        """
+        since, until = month_window(months, until or self.latest_sale_date(suburb_id))
+        return self.query(SUBURB_STATS_QUERY, {'suburb_id': suburb_id, 'since': since, 'until': until})
+
+    def competitor_rates(self, product_type, limit=5):
+        """Cheapest competitor offers for a product type"""
+        return self.query(COMPETITOR_RATES_QUERY, {'product_type': product_type, 'limit': limit})
+
+
+_suburb_names = {}
+_suburb_names_lock = threading.Lock()
+
+
+def suburb_names(db_path):
+    """Process-wide {lowercased name: {'id', 'name', 'postcode'}}, reloaded when the database
+    (or its WAL) has been written since; a name shared by several suburbs maps to the first"""
+    key = os.path.abspath(db_path)
+    version = tuple(os.stat(p).st_mtime_ns for p in (key, key + '-wal') if os.path.exists(p))
+    with _suburb_names_lock:
+        cached = _suburb_names.get(key)
+        if cached is None or cached[0] != version:
+            names = {}
+            for row in db_pool.get_pool(db_path).execute(SUBURB_NAMES_QUERY, {}):
+                names.setdefault(row['name'].lower(), dict(row))
+            cached = _suburb_names[key] = (version, names)
+    return cached[1]
+
+
+def sale_window(since, until, days=183):
+    """(since, until) ISO dates; until defaults to today (callers pass the data's latest date)"""
+    until = until or date.today().isoformat()
+    since = since or (date.fromisoformat(until) - timedelta(days=days)).isoformat()
+    return since, until
+
+
+def month_window(months, until=None):
+    """First days of the earliest and latest of the months months ending at until (default today)
+
+    until may be a date or a month as stored in the database (YYYY-MM-DD).
+    """
+    last = date.fromisoformat(until or date.today().isoformat()).replace(day=1)
+    first = last
+    for _ in range(months - 1):
+        first = (first - timedelta(days=1)).replace(day=1)
+    return first.isoformat(), last.isoformat()
+
+
+def query_plan(conn, sql, params):
+    return [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params)]
+
+
+def check_plans(conn):
+    """Names of the queries whose plan does not use the expected index (or scans a table)"""
+    failures = []
+    for name, (sql, params, index, covering) in EXPECTED_PLANS.items():
+        plan = query_plan(conn, sql, params)
+        if index == 'PRIMARY KEY':
+            # WITHOUT ROWID tables are searched through their primary key
+            expected = "USING PRIMARY KEY"
+        else:
+            expected = f"USING {'COVERING ' if covering else ''}INDEX {index}"
+        if not any(expected in step for step in plan) or any(step.startswith('SCAN') for step in plan):
+            failures.append(name)
+        print(f"{name:<18} {' | '.join(plan)}", file=sys.stderr)
+    return failures
+
+
+def time_queries(conn, repeat=20):
+    """Median milliseconds per query against the busiest suburb"""
+    busiest = conn.execute('SELECT suburb_id FROM recent_sales GROUP BY suburb_id ORDER BY COUNT(*) DESC LIMIT 1') \
+        .fetchone()
+    timings = {}
+    for name, (sql, params, _, _) in EXPECTED_PLANS.items():
+        params = dict(params, suburb_id=busiest[0]) if busiest and 'suburb_id' in params else params
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            conn.execute(sql, params).fetchall()
+            samples.append((time.perf_counter() - start) * 1e3)
+        timings[name] = sorted(samples)[len(samples) // 2]
+    return timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that the market queries use their indexes")
+    parser.add_argument('--db', default='property_market.db')
+    parser.add_argument('--create-indexes', action='store_true',
+                        help="Create missing tables and create or upgrade the indexes (and ANALYZE) before checking")
+    parser.add_argument('--time', action='store_true', help="Also report median query times")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    if args.create_indexes:
+        with conn:
+            create_schema(conn)
+            create_indexes(conn)
+    failures = check_plans(conn)
+    if args.time:
+        for name, ms in time_queries(conn).items():
+            print(f"{name:<18} {ms:8.2f} ms")
+    conn.close()
+    if failures:
+        print(f"Queries not using their index: {', '.join(failures)}", file=sys.stderr)
+        sys.exit(1)
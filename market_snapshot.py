@@ -0,0 +1,382 @@
+"""Columnar, memory-mapped snapshots of recent_sales and market_trends for analytics.
+
+export writes every column of each table to its own .npy file, sorted by suburb (then
+date), under a new generation directory, then atomically replaces manifest.json to point
+at it. Readers np.load the columns with mmap_mode='r': nothing is copied into the process,
+and every process (API workers, a ProcessPoolExecutor, notebooks) reading the same
+snapshot shares the OS page cache. Hand workers the snapshot path, never the arrays, or
+pickling copies them. The previous generation is kept so readers mid-refresh stay valid.
+
+Encodings: integers are int64 with -1 for NULL, REAL is float64 with NaN, dates are
+datetime64[D] with NaT, and text columns are int16 codes into the manifest's categories
+(-1 for NULL).
+
+    python market_snapshot.py --refresh            # re-export only if the database changed
+    python market_snapshot.py --report             # median price growth by suburb
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+import numpy as np
+
+from market_stats import group_percentiles
+
+# table -> (column -> encoding, sort order; both follow an index, so the export streams without a sort)
+SNAPSHOT_TABLES = {
+    'recent_sales': ({
+        'id': 'int', 'suburb_id': 'int', 'property_type': 'category', 'bedrooms': 'int', 'bathrooms': 'int',
+        'parking': 'int', 'sale_price': 'float', 'sale_date': 'date', 'days_on_market': 'int'
+    }, ('suburb_id', 'sale_date')),
+    'market_trends': ({
+        'id': 'int', 'suburb_id': 'int', 'month': 'date', 'avg_interest_rate': 'float', 'clearance_rate': 'float',
+        'new_listings': 'int'
+    }, ('suburb_id', 'month'))
+}
+
+DTYPES = {'int': np.int64, 'float': np.float64, 'date': 'datetime64[D]', 'category': np.int16}
+AGGREGATES = ('count', 'sum', 'mean', 'min', 'max', 'median')
+# Aggregates answered as percentiles of each group's sorted values
+ORDER_STATISTICS = {'min': 0, 'median': 50, 'max': 100}
+KEEP_GENERATIONS = 2
+
+
+def source_version(db_path):
+    """(mtime_ns, size) of the database and its WAL, which any committed write changes
+
+    An empty WAL is left out: merely opening a WAL database creates one.
+    """
+    paths = [p for p in (db_path, db_path + '-wal') if os.path.exists(p) and os.stat(p).st_size]
+    return [[os.stat(p).st_mtime_ns, os.stat(p).st_size] for p in paths]
+
+
+def encode(values, encoding, categories):
+    """One chunk of a column as its snapshot dtype; categories (name -> code) grows as new text appears"""
+    if encoding == 'int':
+        values = np.array(values, dtype=float)
+        return np.where(np.isnan(values), -1, values).astype(np.int64)
+    if encoding == 'float':
+        return np.array(values, dtype=float)
+    if encoding == 'date':
+        return np.array([value or 'NaT' for value in values], dtype='datetime64[D]')
+    return np.array([-1 if value is None else categories.setdefault(value, len(categories)) for value in values],
+                    dtype=np.int16)
+
+
+def export_table(conn, directory, table, chunk_size):
+    columns, order = SNAPSHOT_TABLES[table]
+    rows = conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+    os.makedirs(os.path.join(directory, table))
+    arrays = {name: np.lib.format.open_memmap(os.path.join(directory, table, f'{name}.npy'), mode='w+',
+                                              dtype=DTYPES[encoding], shape=(rows,))
+              for name, encoding in columns.items()}
+    categories = {name: {} for name, encoding in columns.items() if encoding == 'category'}
+
+    cursor = conn.execute(f"SELECT {', '.join(columns)} FROM {table} ORDER BY {', '.join(order)}")
+    written = 0
+    while True:
+        chunk = cursor.fetchmany(chunk_size)
+        if not chunk:
+            break
+        for (name, encoding), values in zip(columns.items(), zip(*chunk)):
+            arrays[name][written:written + len(chunk)] = encode(values, encoding, categories.get(name))
+        written += len(chunk)
+    for array in arrays.values():
+        array.flush()
+    return {'rows': rows, 'order': list(order),
+            'columns': {name: {'encoding': encoding, 'categories': list(categories.get(name, {}))}
+                        for name, encoding in columns.items()}}
+
+
+def export(db_path='property_market.db', path='market_snapshot', chunk_size=100000):
+    """Write a new snapshot generation of every table and make it current; returns the manifest"""
+    source = source_version(db_path)
+    generation = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%fZ')
+    directory = os.path.join(path, generation)
+    os.makedirs(path, exist_ok=True)
+    conn = sqlite3.connect(f"file:{quote(os.path.abspath(db_path))}?mode=ro", uri=True)
+    try:
+        # One read transaction, so both tables come from the same database state
+        conn.execute('BEGIN')
+        tables = {table: export_table(conn, directory, table, chunk_size) for table in SNAPSHOT_TABLES}
+        conn.rollback()
+    except BaseException:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+    finally:
+        conn.close()
+
+    manifest = {'generation': generation, 'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'source': {'db': os.path.abspath(db_path), 'version': source}, 'tables': tables}
+    with open(os.path.join(path, 'manifest.json.tmp'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(os.path.join(path, 'manifest.json.tmp'), os.path.join(path, 'manifest.json'))
+
+    generations = sorted(name for name in os.listdir(path) if os.path.isdir(os.path.join(path, name)))
+    for stale in generations[:-KEEP_GENERATIONS]:
+        shutil.rmtree(os.path.join(path, stale), ignore_errors=True)
+    return manifest
+
+
+def read_manifest(path):
+    manifest_path = os.path.join(path, 'manifest.json')
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def refresh(db_path='property_market.db', path='market_snapshot', chunk_size=100000):
+    """Export only if the database has been written since the current snapshot; returns True if it did"""
+    manifest = read_manifest(path)
+    if manifest and manifest['source'] == {'db': os.path.abspath(db_path), 'version': source_version(db_path)}:
+        return False
+    export(db_path, path, chunk_size)
+    return True
+
+
+class SnapshotTable:
+    """One table of a snapshot: memory-mapped columns plus filter and group-by/aggregate helpers
+
+    Filters (keyword arguments) take a value, an inclusive (low, high) tuple or a list of values.
+    Text columns are filtered by name and dates by ISO string.
+    """
+
+    def __init__(self, directory, spec):
+        self.directory = directory
+        self.rows = spec['rows']
+        self.order = spec['order']
+        self.encodings = {name: column['encoding'] for name, column in spec['columns'].items()}
+        self.categories = {name: np.array(column['categories'], dtype=str) for name, column in spec['columns'].items()
+                           if column['encoding'] == 'category'}
+        self.arrays = {}
+
+    def __len__(self):
+        return self.rows
+
+    def column(self, name):
+        """The raw, read-only memory-mapped column"""
+        array = self.arrays.get(name)
+        if array is None:
+            array = self.arrays[name] = np.load(os.path.join(self.directory, f'{name}.npy'), mmap_mode='r')
+        return array
+
+    def missing(self, name, values):
+        encoding = self.encodings[name]
+        if encoding == 'float':
+            return np.isnan(values)
+        if encoding == 'date':
+            return np.isnat(values)
+        return values == -1
+
+    def decode(self, name, values):
+        """Column values as plain arrays: text columns become strings ('' for NULL)"""
+        if self.encodings[name] != 'category':
+            return np.asarray(values)
+        names = np.append(self.categories[name], '')
+        return names[values]
+
+    def raw_value(self, name, value):
+        """A filter value in the column's encoding"""
+        encoding = self.encodings[name]
+        if encoding == 'category':
+            found = np.flatnonzero(self.categories[name] == value)
+            return found[0] if len(found) else -2  # matches nothing
+        if encoding == 'date':
+            return np.datetime64(value, 'D')
+        return value
+
+    def select(self, **filters):
+        """Indices of the rows matching every filter, in snapshot order
+
+        A filter on the leading sort column (suburb_id) is a binary search, so only that
+        suburb's pages are read.
+        """
+        start, stop = 0, self.rows
+        lead = self.order[0]
+        if lead in filters and not isinstance(filters[lead], (list, set)):
+            wanted = filters.pop(lead)
+            low, high = wanted if isinstance(wanted, tuple) else (wanted, wanted)
+            keys = self.column(lead)
+            start = int(np.searchsorted(keys, self.raw_value(lead, low), 'left'))
+            stop = int(np.searchsorted(keys, self.raw_value(lead, high), 'right'))
+
+        keep = np.ones(max(stop - start, 0), dtype=bool)
+        for name, wanted in filters.items():
+            values = self.column(name)[start:stop]
+            if isinstance(wanted, tuple):
+                low, high = (self.raw_value(name, bound) for bound in wanted)
+                keep &= (values >= low) & (values <= high)
+            elif isinstance(wanted, (list, set)):
+                keep &= np.isin(values, [self.raw_value(name, value) for value in wanted])
+            else:
+                keep &= values == self.raw_value(name, wanted)
+        return start + np.flatnonzero(keep)
+
+    def key(self, name, rows):
+        """Group key values; 'column:month' and 'column:year' truncate a date column"""
+        column, _, unit = name.partition(':')
+        values = self.column(column)[rows]
+        if unit:
+            values = values.astype({'month': 'datetime64[M]', 'year': 'datetime64[Y]'}[unit])
+        return values
+
+    def aggregate(self, by=(), aggregates=None, **filters):
+        """Group the filtered rows by the by keys and aggregate columns within each group
+
+        aggregates maps an output name to (column, function), function being one of
+        AGGREGATES or 'pNN' for the NNth percentile; NULLs are ignored. Returns a dict of
+        equal-length arrays: one per key (decoded), one per aggregate. Without by, there is
+        one group holding every matching row.
+        """
+        aggregates = aggregates or {'rows': (self.order[0], 'count')}
+        percentiles = {}
+        for output, (column, function) in aggregates.items():
+            if function in ORDER_STATISTICS:
+                percentiles[output] = ORDER_STATISTICS[function]
+            elif function.startswith('p') and function[1:].replace('.', '', 1).isdigit():
+                percentiles[output] = float(function[1:])
+            elif function not in AGGREGATES:
+                raise ValueError(f"Unknown aggregate {function!r} (expected one of {AGGREGATES} or pNN)")
+
+        rows = self.select(**filters)
+        keys = [self.key(name, rows) for name in by]
+        # Rows come back in snapshot order, so keys that are a prefix of it need no sort
+        if keys and [name.partition(':')[0] for name in by] != self.order[:len(by)]:
+            order = np.lexsort(keys[::-1])
+            rows, keys = rows[order], [values[order] for values in keys]
+        boundary = np.zeros(len(rows), dtype=bool)
+        boundary[:1] = True
+        for values in keys:
+            # Compare dates as integers, so that NaT == NaT and missing dates form one group
+            values = values.view(np.int64) if values.dtype.kind == 'M' else values
+            boundary[1:] |= values[1:] != values[:-1]
+        starts = np.flatnonzero(boundary)
+        groups = len(starts) if keys else 1
+        group = np.cumsum(boundary) - 1
+
+        result = {name: self.decode(name.partition(':')[0], values[starts]) for name, values in zip(by, keys)}
+        columns = {}
+        for output, (column, function) in aggregates.items():
+            if column not in columns:
+                values = self.column(column)[rows]
+                known = ~self.missing(column, values)
+                columns[column] = [group[known], values[known].astype(float), None]
+            ids, values, ordered = columns[column]
+            counts = np.bincount(ids, minlength=groups)
+            if function == 'count':
+                result[output] = counts
+            elif function in ('sum', 'mean'):
+                sums = np.bincount(ids, weights=values, minlength=groups)
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    result[output] = sums if function == 'sum' else np.where(counts > 0, sums / counts, np.nan)
+            else:
+                if ordered is None:
+                    ordered = columns[column][2] = sorted_within(values, ids)
+                firsts = np.cumsum(counts) - counts
+                result[output] = group_percentiles(ordered, firsts, counts, (percentiles[output],))[:, 0]
+        return result
+
+
+def sorted_within(values, ids):
+    """values sorted by group id (ids are ascending), then by value, padded with one NaN
+
+    The padding keeps empty groups past the last value inside the array for group_percentiles.
+    """
+    n = len(values)
+    by_value = np.argsort(values)
+    rank = np.empty(n, dtype=np.int64)
+    rank[by_value] = np.arange(n)
+    # One integer sort of (group, rank of value) instead of a two-key lexsort
+    order = np.sort(ids.astype(np.int64) * n + rank) % max(n, 1)
+    return np.append(values[by_value][order], np.nan)
+
+
+class MarketSnapshot:
+    """The current snapshot generation under path"""
+
+    def __init__(self, path='market_snapshot'):
+        self.path = path
+        self.manifest = read_manifest(path)
+        if self.manifest is None:
+            raise FileNotFoundError(f"No snapshot in {path}; run market_snapshot.py --export")
+        directory = os.path.join(path, self.manifest['generation'])
+        self.tables = {name: SnapshotTable(os.path.join(directory, name), spec)
+                       for name, spec in self.manifest['tables'].items()}
+
+    def __getitem__(self, table):
+        return self.tables[table]
+
+
+_snapshots = {}
+_snapshots_lock = threading.Lock()
+
+
+def get_snapshot(path='market_snapshot'):
+    """Process-wide MarketSnapshot, reopened when a refresh has replaced the manifest"""
+    key = os.path.abspath(path)
+    version = os.stat(os.path.join(key, 'manifest.json')).st_mtime_ns
+    with _snapshots_lock:
+        cached = _snapshots.get(key)
+        if cached is None or cached[0] != version:
+            cached = _snapshots[key] = (version, MarketSnapshot(path))
+    return cached[1]
+
+
+def price_growth(snapshot, since, until, property_type=None, days=365, min_sales=20):
+    """Median sale price growth per suburb between the days before since and the days to until
+
+    Returns (suburb_ids, growth as a fraction) for suburbs with min_sales in both periods.
+    """
+    periods = []
+    for end in (np.datetime64(since, 'D') - 1, np.datetime64(until, 'D')):
+        filters = {'sale_date': (end - (days - 1), end)}
+        if property_type:
+            filters['property_type'] = property_type
+        stats = snapshot['recent_sales'].aggregate(
+            ('suburb_id',), {'median': ('sale_price', 'median'), 'sales': ('sale_price', 'count')}, **filters)
+        keep = stats['sales'] >= min_sales
+        periods.append((stats['suburb_id'][keep], stats['median'][keep]))
+    (before_ids, before), (after_ids, after) = periods
+    suburbs, before_at, after_at = np.intersect1d(before_ids, after_ids, return_indices=True)
+    return suburbs, after[after_at] / before[before_at] - 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export or query the columnar market data snapshot")
+    parser.add_argument('--db', default='property_market.db')
+    parser.add_argument('--path', default='market_snapshot', help="Snapshot directory")
+    parser.add_argument('--export', action='store_true', help="Write a new snapshot")
+    parser.add_argument('--refresh', action='store_true', help="Write a new snapshot if the database changed")
+    parser.add_argument('--report', action='store_true', help="Print the suburbs with the fastest price growth")
+    parser.add_argument('--until', help="End of the report's second period, YYYY-MM-DD (default: latest sale)")
+    parser.add_argument('--days', type=int, default=365, help="Length of each report period")
+    parser.add_argument('--type', help="Property type for the report, e.g. House")
+    args = parser.parse_args()
+
+    if args.export or args.refresh:
+        start = time.perf_counter()
+        changed = export(args.db, args.path) if args.export else refresh(args.db, args.path)
+        if changed:
+            manifest = read_manifest(args.path)
+            counts = ', '.join(f"{table} {spec['rows']:,}" for table, spec in manifest['tables'].items())
+            print(f"Exported {counts} rows to {args.path}/{manifest['generation']} "
+                  f"in {time.perf_counter() - start:.1f}s")
+        else:
+            print(f"{args.path} is up to date")
+    if args.report:
+        snapshot = get_snapshot(args.path)
+        start = time.perf_counter()
+        sale_dates = snapshot['recent_sales'].column('sale_date')
+        until = np.datetime64(args.until, 'D') if args.until else sale_dates[~np.isnat(sale_dates)].max()
+        suburbs, growth = price_growth(snapshot, until - (args.days - 1), until, args.type, args.days)
+        print(f"Median price growth to {until} for {len(suburbs):,} suburbs "
+              f"in {(time.perf_counter() - start) * 1e3:.0f} ms")
+        for i in np.argsort(-growth)[:10]:
+            print(f"  suburb {suburbs[i]:>6}  {growth[i]:+.1%}")
@@ -0,0 +1,170 @@
+"""Materialized sales statistics per (suburb, property type, month).
+
+suburb_sales_stats holds each partition's count, total, price percentiles and
+days-on-market figures. It is kept current incrementally: ingest_market_data.py collects
+the partitions its rows land in (and the ones updated rows move out of), and refresh
+recomputes only those. It reads them through the covering
+idx_sales_suburb_type_beds index, so a refresh costs time in the sales it touches rather
+than in the table. Each refresh also bumps suburb_versions for its suburbs, which is how
+in-memory caches of a suburb's sales (market_arrays.py) notice changes. rebuild recomputes
+everything:
+
+    python market_stats.py --db property_market.db --rebuild
+"""
+import argparse
+import json
+import sqlite3
+import time
+from collections import defaultdict
+
+import numpy as np
+
+PERCENTILES = (10, 25, 50, 75, 90)
+
+PARTITION_SALES_QUERY = '''
+    SELECT sale_date, sale_price, days_on_market
+    FROM recent_sales INDEXED BY idx_sales_suburb_type_beds
+    WHERE suburb_id = :suburb_id AND property_type IS :property_type AND sale_date BETWEEN :since AND :until
+'''
+
+PREVIOUS_PARTITIONS_QUERY = '''
+    SELECT suburb_id, COALESCE(property_type, ''), substr(sale_date, 1, 7) || '-01'
+    FROM recent_sales
+    WHERE id IN (SELECT value FROM json_each(:ids))
+'''
+
+SERIES_QUERY = '''
+    SELECT DISTINCT suburb_id, COALESCE(property_type, '')
+    FROM recent_sales INDEXED BY idx_sales_suburb_type_beds
+    WHERE suburb_id IS NOT NULL
+'''
+
+# Every refresh marks its suburbs as changed, so caches of their sales know to reload
+BUMP_VERSION = '''
+    INSERT INTO suburb_versions (suburb_id, version) VALUES (?, 1)
+    ON CONFLICT (suburb_id) DO UPDATE SET version = version + 1
+'''
+
+STATS_COLUMNS = ['suburb_id', 'property_type', 'month', 'sales', 'total_price', 'p10_price', 'p25_price',
+                 'median_price', 'p75_price', 'p90_price', 'avg_days_on_market', 'median_days_on_market']
+
+
+def sale_partitions(suburb_ids, property_types, sale_dates):
+    """(suburb_id, property_type, month) of each sale, as a set; property_type None becomes ''"""
+    months = np.char.add(np.array(sale_dates, dtype='U7'), '-01')
+    types = ['' if t is None else t for t in property_types]
+    return set(zip(np.asarray(suburb_ids).tolist(), types, months.tolist()))
+
+
+def previous_partitions(conn, ids):
+    """Partitions the given sale ids are in now, before an upsert moves them"""
+    return set(conn.execute(PREVIOUS_PARTITIONS_QUERY, {'ids': json.dumps(ids)}))
+
+
+def month_end(month):
+    return f"{month[:7]}-31"
+
+
+def group_percentiles(values, starts, counts, percentiles):
+    """Linearly interpolated percentiles (numpy's default method) of the sorted runs values[start:start + count]
+
+    Returns one row per run; runs without values give NaN.
+    """
+    last = np.maximum(counts, 1)[:, None] - 1
+    positions = last * (np.array(percentiles) / 100.0)
+    low = np.floor(positions).astype(np.int64)
+    high = np.minimum(low + 1, last)
+    fraction = positions - low
+    result = values[starts[:, None] + low] * (1 - fraction) + values[starts[:, None] + high] * fraction
+    result[counts == 0] = np.nan
+    return result
+
+
+def series_stats(suburb_id, property_type, sales, months=None):
+    """Stats rows for every month of one suburb and property type, or only for the given months"""
+    sale_dates, prices, days = zip(*sales)
+    sale_months = np.array(sale_dates, dtype='U7')
+    prices = np.array(prices, dtype=float)
+    days = np.array(days, dtype=float)
+
+    # Sort by month, then value, so each month is a sorted run; missing days sort to the end of their run
+    by_price = np.lexsort((prices, sale_months))
+    by_days = np.lexsort((days, sale_months))
+    prices, days, sale_months = prices[by_price], days[by_days], sale_months[by_price]
+    found, starts, counts = np.unique(sale_months, return_index=True, return_counts=True)
+
+    price_percentiles = group_percentiles(prices, starts, counts, PERCENTILES)
+    totals = np.add.reduceat(prices, starts)
+    known_days = np.add.reduceat((~np.isnan(days)).astype(np.int64), starts)
+    days_total = np.add.reduceat(np.nan_to_num(days), starts)
+    days_median = group_percentiles(days, starts, known_days, (50,))[:, 0]
+
+    rows = []
+    for i, month in enumerate(np.char.add(found, '-01').tolist()):
+        if months is not None and month not in months:
+            continue
+        p10, p25, median, p75, p90 = price_percentiles[i].tolist()
+        has_days = known_days[i] > 0
+        rows.append((suburb_id, property_type, month, int(counts[i]), float(totals[i]), p10, p25, median, p75, p90,
+                     float(days_total[i] / known_days[i]) if has_days else None,
+                     float(days_median[i]) if has_days else None))
+    return rows
+
+
+def refresh_series(conn, series):
+    """Recompute {(suburb_id, property_type): months} partitions (months None for all of them)"""
+    rows = []
+    for (suburb_id, property_type), months in series.items():
+        sales = conn.execute(PARTITION_SALES_QUERY, {
+            'suburb_id': suburb_id,
+            'property_type': property_type or None,
+            'since': min(months) if months else '',
+            'until': month_end(max(months)) if months else '9999-12-31'
+        }).fetchall()
+        if months:
+            conn.executemany('DELETE FROM suburb_sales_stats WHERE suburb_id = ? AND property_type = ? AND month = ?',
+                             [(suburb_id, property_type, month) for month in months])
+        else:
+            conn.execute('DELETE FROM suburb_sales_stats WHERE suburb_id = ? AND property_type = ?',
+                         (suburb_id, property_type))
+        if sales:
+            rows.extend(series_stats(suburb_id, property_type, sales, months))
+
+    conn.executemany(f"INSERT INTO suburb_sales_stats ({', '.join(STATS_COLUMNS)}) "
+                     f"VALUES ({', '.join('?' * len(STATS_COLUMNS))})", rows)
+    conn.executemany(BUMP_VERSION, [(suburb_id,) for suburb_id in {suburb_id for suburb_id, _ in series}])
+    return len(rows)
+
+
+def refresh(conn, partitions):
+    """Recompute the given (suburb_id, property_type, month) partitions; returns how many were written
+
+    Partitions left without sales are deleted. Run inside the caller's transaction.
+    """
+    series = defaultdict(set)
+    for suburb_id, property_type, month in partitions:
+        series[(suburb_id, property_type)].add(month)
+    return refresh_series(conn, series)
+
+
+def rebuild(conn):
+    """Recompute every partition from recent_sales"""
+    conn.execute('DELETE FROM suburb_sales_stats')
+    return refresh_series(conn, dict.fromkeys(conn.execute(SERIES_QUERY).fetchall()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the suburb sales statistics table")
+    parser.add_argument('--db', default='property_market.db')
+    parser.add_argument('--rebuild', action='store_true', help="Recompute every partition")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    if args.rebuild:
+        start = time.perf_counter()
+        with conn:
+            written = rebuild(conn)
+        print(f"Rebuilt {written:,} partitions in {time.perf_counter() - start:.1f}s")
+    count, latest = conn.execute('SELECT COUNT(*), MAX(month) FROM suburb_sales_stats').fetchone()
+    print(f"{args.db}: {count:,} partitions, latest month {latest}")
+    conn.close()
@@ -0,0 +1,49 @@
+import sys
+
+
+class MessageLog:
+    """Append-only conversation log shared by the prompt builder and the UI
+
+    Each message is stored once as a (role, content) tuple. Views hand out small
+    dicts that reference the same strings, so no message body is ever copied.
+    """
+
+    __slots__ = ('entries',)
+
+    def __init__(self, messages=()):
+        self.entries = [(m['role'], m['content']) for m in messages]
+
+    def append(self, role, content):
+        self.entries.append((role, content))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        """Prompt view: chat-completions message dicts in order"""
+        for role, content in self.entries:
+            yield {"role": role, "content": content}
+
+    def for_ui(self, greeting=None):
+        """UI view: the transcript, optionally led by a greeting that is never sent to the LLM"""
+        if greeting is not None:
+            yield {"role": "assistant", "content": greeting}
+        yield from self
+
+    def to_list(self):
+        """Plain list of message dicts for serialisation"""
+        return list(self)
+
+    def replace_content(self, index, content):
+        """Swap a message body in place (used only when compacting)"""
+        role, _ = self.entries[index]
+        self.entries[index] = (role, content)
+
+    def drop_oldest(self, count):
+        del self.entries[:count]
+
+    def nbytes(self):
+        """Approximate memory held by the log (list, tuples and strings)"""
+        return sys.getsizeof(self.entries) + sum(
+            sys.getsizeof(entry) + sys.getsizeof(entry[0]) + sys.getsizeof(entry[1]) for entry in self.entries
+        )
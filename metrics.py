@@ -0,0 +1,211 @@
+import os
+import threading
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """A named metric family; each distinct label set is one series"""
+
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            for values, value in sorted(self.series.items()):
+                lines.extend(self.render_series(values, value))
+        return lines
+
+    def render_series(self, values, value):
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(value)}"]
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.series[key] = self.series.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self.series.get(self.key(labels), 0)
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.series[key] = self.series.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.series[key] = value
+
+    def value(self, **labels):
+        return self.series.get(self.key(labels), 0)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['counts'][i] += 1
+                    break
+            series['sum'] += value
+            series['count'] += 1
+
+    def render_series(self, values, series):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, series['counts']):
+            cumulative += count
+            le = f'le="{_format_value(bound)}"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}")
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(series['sum'])}")
+        lines.append(f"{self.name}_count{labels} {series['count']}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+LLM_LATENCY = REGISTRY.register(Histogram(
+    'mortgage_llm_request_duration_seconds', 'Latency of chat completion calls by pipeline stage', ['stage']))
+LLM_TOKENS = REGISTRY.register(Counter(
+    'mortgage_llm_tokens_total', 'Tokens consumed by chat completion calls', ['stage', 'kind']))
+LLM_ERRORS = REGISTRY.register(Counter(
+    'mortgage_llm_errors_total', 'Chat completion calls that raised, by stage and exception type', ['stage', 'error']))
+LLM_RETRIES = REGISTRY.register(Counter(
+    'mortgage_llm_retries_total', 'Retries performed inside the OpenAI client'))
+TURN_LATENCY = REGISTRY.register(Histogram(
+    'mortgage_turn_duration_seconds', 'End-to-end latency of get_next_response'))
+ACTIVE_SESSIONS = REGISTRY.register(Gauge(
+    'mortgage_active_sessions', 'Live ConversationalMortgageAgent instances in this process'))
+SESSION_MEMORY = REGISTRY.register(Gauge(
+    'mortgage_session_memory_bytes', 'Approximate memory held by live sessions in this process'))
+SESSIONS_EVICTED = REGISTRY.register(Counter(
+    'mortgage_sessions_evicted_total', 'Sessions dropped from memory after going idle'))
+SESSIONS_TRIMMED = REGISTRY.register(Counter(
+    'mortgage_sessions_trimmed_total', 'Times a session history was compacted to fit the memory cap'))
+CATALOG_CACHE = REGISTRY.register(Counter(
+    'mortgage_catalog_cache_requests_total', 'Product catalog lookups by cache result', ['result']))
+
+
+def count_retry(request):
+    """httpx request hook: counts the requests the OpenAI client sends as retries
+
+    The client marks every attempt with x-stainless-retry-count, so no logger levels need changing.
+    """
+    if request.headers.get('x-stainless-retry-count', '0') != '0':
+        LLM_RETRIES.inc()
+
+
+def make_metrics_handler(registry=REGISTRY):
+    """Request handler class serving registry; http.server is only imported when serving"""
+    from http.server import BaseHTTPRequestHandler
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            data = registry.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return MetricsHandler
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port=None, host='127.0.0.1'):
+    """Serve /metrics on its own port in a daemon thread, once per process
+
+    The port comes from MORTGAGE_METRICS_PORT when not given; returns None when neither is set.
+    Only the local interface is served unless host says otherwise (MORTGAGE_METRICS_HOST).
+    """
+    global _server
+    port = port if port is not None else os.getenv("MORTGAGE_METRICS_PORT")
+    host = os.getenv("MORTGAGE_METRICS_HOST", host)
+    if port in (None, ''):
+        return None
+    with _server_lock:
+        if _server is None:
+            from http.server import ThreadingHTTPServer
+            _server = ThreadingHTTPServer((host, int(port)), make_metrics_handler())
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, daemon=True).start()
+    return _server
@@ -0,0 +1,150 @@
+"""Versioned schema migrations for the product catalog database.
+
+The schema version lives in SQLite's PRAGMA user_version. Each migration runs in its own
+transaction together with the version bump, so an interrupted upgrade leaves the database
+at the last completed version. Run from the command line to upgrade a file in place:
+
+    python migrations.py mortgage_products.db
+    python migrations.py mortgage_products.db --status
+"""
+import argparse
+import os
+import sqlite3
+import threading
+from urllib.parse import quote
+
+PRODUCTS_TABLE = '''
+    CREATE TABLE {name} (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        product_type TEXT,  -- fixed, variable, split; NULL when unknown (converted legacy rows)
+        min_income REAL NOT NULL DEFAULT 0,
+        max_loan REAL,
+        property_value_min REAL NOT NULL DEFAULT 0,
+        base_rate REAL NOT NULL,  -- annual percentage, e.g. 3.5
+        comparison_rate REAL,
+        max_lvr REAL,  -- percentage of property value
+        term_years INTEGER NOT NULL DEFAULT 30,
+        first_home_buyer_eligible INTEGER NOT NULL DEFAULT 0,
+        features TEXT NOT NULL DEFAULT '{{}}',  -- JSON object of features
+        early_repayment_allowed INTEGER,  -- NULL when unknown (converted legacy rows)
+        offset_account INTEGER NOT NULL DEFAULT 0
+    )
+'''
+
+
+def table_columns(conn, table):
+    return [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+
+
+def typed_products(conn):
+    """Create the typed product table, converting the legacy interest_rate TEXT ("3.5%") layout
+
+    The legacy layout has no product type or repayment terms, so converted rows leave them NULL.
+    """
+    columns = table_columns(conn, 'mortgage_products')
+    if not columns:
+        conn.execute(PRODUCTS_TABLE.format(name='mortgage_products'))
+    elif 'base_rate' not in columns:
+        conn.execute(PRODUCTS_TABLE.format(name='mortgage_products_typed'))
+        conn.execute('''
+            INSERT INTO mortgage_products_typed (id, name, min_income, max_loan, property_value_min, base_rate)
+            SELECT id, name, COALESCE(min_income, 0), max_loan, COALESCE(property_value_min, 0),
+                   CAST(REPLACE(TRIM(interest_rate), '%', '') AS REAL)
+            FROM mortgage_products
+        ''')
+        conn.execute('DROP TABLE mortgage_products')
+        conn.execute('ALTER TABLE mortgage_products_typed RENAME TO mortgage_products')
+    # A table already created by setup_database.py has the typed columns
+
+
+def eligibility_index(conn):
+    """Covering index for the eligibility predicates and the columns scenarios read"""
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_products_eligibility ON mortgage_products (
+            min_income, max_loan, property_value_min, max_lvr, base_rate, term_years, product_type, name,
+            early_repayment_allowed
+        )
+    ''')
+
+
+# Version N is reached by applying MIGRATIONS[N - 1]; only ever append to this list
+MIGRATIONS = [
+    typed_products,
+    eligibility_index
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn, target=SCHEMA_VERSION):
+    """Apply pending migrations on an open connection; returns the versions applied"""
+    applied = []
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None
+    try:
+        while True:
+            conn.execute('BEGIN IMMEDIATE')
+            # Re-read under the write lock in case another process migrated meanwhile
+            version = schema_version(conn)
+            if version >= target:
+                conn.execute('COMMIT')
+                break
+            try:
+                MIGRATIONS[version](conn)
+                conn.execute(f'PRAGMA user_version = {version + 1}')
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            applied.append(version + 1)
+    finally:
+        conn.isolation_level = isolation_level
+    return applied
+
+
+_migrated = set()
+_migrated_lock = threading.Lock()
+
+
+def ensure_schema(path):
+    """Upgrade a database file to SCHEMA_VERSION once per process
+
+    Up-to-date databases are only read, so a read-only catalog file works as long as it
+    has already been migrated.
+    """
+    key = os.path.abspath(path)
+    if key in _migrated:
+        return
+    with _migrated_lock:
+        if key in _migrated:
+            return
+        # mode=rw never creates a missing file
+        conn = sqlite3.connect(f"file:{quote(key)}?mode=rw", uri=True, timeout=30)
+        try:
+            if schema_version(conn) < SCHEMA_VERSION:
+                applied = migrate(conn)
+                if applied:
+                    print(f"Migrated {path} to schema version {applied[-1]}")
+        finally:
+            conn.close()
+        _migrated.add(key)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Upgrade a product catalog database to the current schema")
+    parser.add_argument('db', nargs='?', default='mortgage_products.db')
+    parser.add_argument('--status', action='store_true', help="Only print the current and latest versions")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    if args.status:
+        print(f"{args.db}: schema version {schema_version(conn)} (latest {SCHEMA_VERSION})")
+    else:
+        applied = migrate(conn)
+        print(f"{args.db}: applied {applied or 'nothing'}, now at version {schema_version(conn)}")
+    conn.close()
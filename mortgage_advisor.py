@@ -1,20 +1,63 @@
 import streamlit as st
-from mortgage_assistant import ConversationalMortgageAgent
+import os
+import time
+import uuid
+import metrics
+from session_manager import SessionManager
+from session_profiler import SessionProfiler, profiling_requested
+from session_store import create_store
+from traffic_capture import record_turn
+from dotenv import load_dotenv
 
-def initialize_chat():
-    """Initialize chat session and welcome message"""
-    if 'mortgage_agent' not in st.session_state:
-        st.session_state['mortgage_agent'] = ConversationalMortgageAgent()
-        welcome_msg = "Hello! I'm your mortgage advisor. I'm here to help you find the right mortgage solution. What brings you in today?"
-        st.session_state['messages'] = [{"role": "assistant", "content": welcome_msg}]
+# Load environment variables
+load_dotenv()
 
-def main():
-    st.set_page_config(
-        page_title="AI Mortgage Advisor",
-        page_icon="🏠",
-        layout="centered"
-    )
+WELCOME_MSG = "Hello! I'm your mortgage advisor. I'm here to help you find the right mortgage solution. What brings you in today?"
+
+@st.cache_resource
+def get_session_manager():
+    """Process-wide registry of live agents, backed by the session store"""
+    store = create_store(os.getenv("MORTGAGE_SESSION_STORE", "sqlite:///sessions.db"))
+    return SessionManager.from_env(store)
 
+def get_session_id():
+    """This browser session's id, issued by the server and kept only in st.session_state
+
+    Ids are never taken from the request, so a conversation can't be claimed by guessing
+    or sharing a URL; an agent evicted while idle is restored from the store by this id.
+    """
+    if 'session_id' not in st.session_state:
+        st.session_state['session_id'] = uuid.uuid4().hex
+    return st.session_state['session_id']
+
+def get_session_profiler():
+    """Return this session's profiler when profiling is switched on, else None"""
+    if not profiling_requested(st.query_params):
+        return None
+    if 'session_profiler' not in st.session_state:
+        st.session_state['session_profiler'] = SessionProfiler(get_session_id())
+    return st.session_state['session_profiler']
+
+def render_profiling_panel(profiler):
+    """Show the latest profiled run in the sidebar"""
+    with st.sidebar.expander("🔬 Session profile", expanded=True):
+        if not profiler.summaries:
+            st.caption("No runs profiled yet.")
+            return
+        summary = profiler.summaries[-1]
+        st.caption(f"Session `{profiler.session_id}` · run {summary['run']}"
+                   + (f" · {profiler.skipped} skipped (another rerun was being profiled)" if profiler.skipped else ""))
+        st.metric("Rerun wall time", f"{summary['wall_ms']:,.1f} ms")
+        for label, ms in summary['timings_ms'].items():
+            st.metric(label, f"{ms:,.1f} ms")
+        st.metric("Peak traced memory (process)", f"{summary['process_peak_memory_kib']:,.0f} KiB")
+        st.markdown("**Top functions (cumulative)**")
+        st.dataframe(summary['top_functions'], hide_index=True)
+        st.markdown("**Top allocations**")
+        st.dataframe(summary['top_allocations'], hide_index=True)
+        st.caption(f"Profile saved to `{summary['profile_path']}`")
+
+def render_chat(profiler=None):
     st.markdown("""
         <style>
         .stApp {background-color: #f5f7f9;}
@@ -35,34 +78,54 @@ def main():
     """, unsafe_allow_html=True)
 
     st.title("🏠 AI Mortgage Advisor")
-    initialize_chat()  # Add this line
-    
-    if 'mortgage_agent' not in st.session_state:
-        st.session_state['mortgage_agent'] = ConversationalMortgageAgent()
-        welcome_msg = "Hello! I'm your mortgage advisor. How can I help you today?"
-        st.session_state['messages'] = [{"role": "assistant", "content": welcome_msg}]
-
-    for message in st.session_state['messages']:
+    session_id = get_session_id()
+    # Hold the agent for the whole rerun so the sweeper never saves it mid-turn
+    with get_session_manager().session(session_id) as agent:
+        render_conversation(agent, session_id, profiler)
+
+def render_conversation(agent, session_id, profiler=None):
+    # The agent's message log is the only copy of the transcript; the UI reads a view of it
+    for message in agent.state['conversation_history'].for_ui(WELCOME_MSG):
         with st.chat_message(message["role"]):
-            st.markdown(f"<div class='{message['role']}-message'>{message['content']}</div>", 
+            st.markdown(f"<div class='{message['role']}-message'>{message['content']}</div>",
                        unsafe_allow_html=True)
 
     if user_input := st.chat_input("Type your message here..."):
         with st.chat_message("user"):
-            st.markdown(f"<div class='user-message'>{user_input}</div>", 
+            st.markdown(f"<div class='user-message'>{user_input}</div>",
                        unsafe_allow_html=True)
-        
-        agent = st.session_state['mortgage_agent']
-        response = agent.get_next_response(user_input)
-        
+
+        start = time.perf_counter()
+        if profiler:
+            response = profiler.call('get_next_response', agent.get_next_response, user_input)
+        else:
+            response = agent.get_next_response(user_input)
+        record_turn(session_id, agent, user_input, time.perf_counter() - start)
+
         with st.chat_message("assistant"):
-            st.markdown(f"<div class='assistant-message'>{response}</div>", 
+            st.markdown(f"<div class='assistant-message'>{response}</div>",
                        unsafe_allow_html=True)
-        
-        st.session_state['messages'].extend([
-            {"role": "user", "content": user_input},
-            {"role": "assistant", "content": response}
-        ])
+
+        get_session_manager().save(session_id, agent)
+
+def main():
+    st.set_page_config(
+        page_title="AI Mortgage Advisor",
+        page_icon="🏠",
+        layout="centered"
+    )
+
+    # Prometheus endpoint on MORTGAGE_METRICS_PORT, separate from the Streamlit port
+    metrics.start_metrics_server()
+
+    profiler = get_session_profiler()
+    if profiler is None:
+        render_chat()
+        return
+
+    with profiler.profile_rerun():
+        render_chat(profiler)
+    render_profiling_panel(profiler)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,34 +1,188 @@
-import streamlit as st
-from openai import OpenAI
-import sqlite3
-from dotenv import load_dotenv
+import db_pool
+from llm_cassette import wrap_client
+from message_log import MessageLog
+import metrics
+import migrations
+import mortgage_finance
+from mortgage_finance import SCENARIO_HEADING
+import tracing
+import json
 import os
+import re
+import sqlite3
+import threading
+import time
+import weakref
+
+# The OpenAI SDK (and .env loading) is imported on first use, so the finance core and
+# short-lived scripts never pay for it
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """Process-wide LLM client, created on first use
+
+    OPENAI_BASE_URL points the agent at any OpenAI-compatible server (e.g. stub_llm_server.py);
+    LLM_CASSETTE / LLM_CASSETTE_MODE record or replay every completion (see llm_cassette.py)
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from dotenv import load_dotenv
+                from openai import DefaultHttpxClient, OpenAI
+                load_dotenv()
+                _client = wrap_client(lambda: OpenAI(
+                    api_key=os.getenv("OPENAI_API_KEY"), base_url=os.getenv("OPENAI_BASE_URL") or None,
+                    http_client=DefaultHttpxClient(event_hooks={'request': [metrics.count_retry]})))
+    return _client
+
+# Products the customer's income qualifies for, priced over each product's own term with the
+# registered SQL functions (see mortgage_finance.SQL_FUNCTIONS), cheapest first. Identical
+# listings are shown once so they don't fill every slot.
+# Every predicate reads columns of idx_products_eligibility, so products are filtered without
+# touching the table. An unknown property value (or a NULL limit) excludes nothing, and a DSR
+# that can't be computed (no income) is not held against the customer.
+SCENARIO_QUERY = '''
+    SELECT DISTINCT name, product_type, base_rate, term_years, early_repayment_allowed,
+           annuity_payment(:loan_amount, base_rate / 100.0, term_years) AS payment,
+           lvr(:loan_amount, :property_value) AS lvr,
+           dsr(annuity_payment(:loan_amount, base_rate / 100.0, term_years), :other_debts, :income) AS dsr
+    FROM mortgage_products
+    WHERE min_income <= :income
+      AND (max_loan IS NULL OR max_loan >= :loan_amount)
+      AND (:property_value IS NULL OR property_value_min <= :property_value)
+      AND (max_lvr IS NULL OR :property_value IS NULL OR :loan_amount <= max_lvr / 100.0 * :property_value)
+      AND IFNULL(dsr(annuity_payment(:loan_amount, base_rate / 100.0, term_years), :other_debts, :income), 0)
+          <= :max_dsr
+    ORDER BY payment, name
+    LIMIT :limit
+'''
+
+# Scenario tables shown per reply
+MAX_SCENARIOS = 5
+
+# Months of suburb_sales_stats summarised for the prompt, ending at the suburb's latest sale
+LOCAL_MARKET_MONTHS = 6
+
+# Longest run of words tried as a suburb name when scanning a message
+MAX_SUBURB_WORDS = 3
+
+# Property descriptions in messages ("3 bed house", "two bathrooms", "1 car space"), with
+# types named as in the market data
+PROPERTY_TYPE_WORDS = {'house': 'House', 'townhouse': 'Townhouse', 'apartment': 'Apartment', 'unit': 'Apartment',
+                       'flat': 'Apartment'}
+PROPERTY_TYPE_PATTERN = re.compile(r"\b(" + '|'.join(PROPERTY_TYPE_WORDS) + r")s?\b", re.IGNORECASE)
+COUNT_WORDS = {'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6}
+_COUNT = r"\b(\d{1,2}|" + '|'.join(COUNT_WORDS) + r")[\s-]*"
+FEATURE_PATTERNS = {
+    'bedrooms': re.compile(_COUNT + r"(?:bed(?:room)?s?|br)\b", re.IGNORECASE),
+    'bathrooms': re.compile(_COUNT + r"bath(?:room)?s?\b", re.IGNORECASE),
+    'parking': re.compile(_COUNT + r"(?:car|parking|garage)s?\b", re.IGNORECASE)
+}
+
+
+def parse_property_features(text):
+    """property_type, bedrooms, bathrooms and parking described in text; only the ones found"""
+    features = {}
+    match = PROPERTY_TYPE_PATTERN.search(text)
+    if match:
+        features['property_type'] = PROPERTY_TYPE_WORDS[match.group(1).lower()]
+    for name, pattern in FEATURE_PATTERNS.items():
+        match = pattern.search(text)
+        if match:
+            count = match.group(1).lower()
+            features[name] = COUNT_WORDS[count] if count in COUNT_WORDS else int(count)
+    return features
+
 
-# Load environment variables
-load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+def summarise_suburb_stats(stats):
+    """Per property type: sales over the stats rows' months, the latest month's median and
+    quartile prices, and the sales-weighted days on market"""
+    summary = {}
+    for row in stats:  # ordered by property_type, month
+        entry = summary.setdefault(row['property_type'], {'sales': 0, '_days': 0.0, '_days_sales': 0})
+        entry['sales'] += row['sales']
+        entry.update(median_price=round(row['median_price']), p25_price=round(row['p25_price']),
+                     p75_price=round(row['p75_price']), latest_month=row['month'][:7])
+        if row['avg_days_on_market'] is not None:
+            entry['_days'] += row['avg_days_on_market'] * row['sales']
+            entry['_days_sales'] += row['sales']
+    for entry in summary.values():
+        days, days_sales = entry.pop('_days'), entry.pop('_days_sales')
+        if days_sales:
+            entry['avg_days_on_market'] = round(days / days_sales)
+    return summary
+
+# Product catalogs shared by every agent in the process: db_path -> ((mtime_ns, size), products)
+_catalog_cache = {}
+_catalog_lock = threading.Lock()
 
 class ConversationalMortgageAgent:
-    def __init__(self):
+    def __init__(self, llm_client=None, db_path='mortgage_products.db', market_db_path='property_market.db'):
         """Initialize the mortgage agent with empty state"""
-        self.db_path = 'mortgage_products.db'  # Define this first
+        self.llm_client = llm_client
+        self.db_path = db_path  # Define this first
+        self.market_db_path = market_db_path
+        self.market = None  # MarketData, created once the market database is needed
+        migrations.ensure_schema(db_path)
         self.state = {
-            'conversation_history': [],
+            'conversation_history': MessageLog(),
             'collected_info': {},
             'current_step': 'initial',
             'products': self.get_products_from_db(),
             'serviceability_metrics': {}
         }
+        metrics.ACTIVE_SESSIONS.inc()
+        weakref.finalize(self, metrics.ACTIVE_SESSIONS.dec)
     
+    @property
+    def client(self):
+        return self.llm_client or get_client()
+
     def get_products_from_db(self):
-        """Fetch mortgage products from SQLite database"""
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        c.execute('SELECT * FROM mortgage_products')
-        columns = [description[0] for description in c.description]
-        products = [dict(zip(columns, row)) for row in c.fetchall()]
-        conn.close()
-        return products
+        """Fetch mortgage products from SQLite, reusing the process-wide copy while the file is unchanged"""
+        stat = os.stat(self.db_path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        with tracing.span("db.load_catalog", {"db.system": "sqlite", "db.name": self.db_path}) as span:
+            with _catalog_lock:
+                cached = _catalog_cache.get(self.db_path)
+                if cached and cached[0] == version:
+                    metrics.CATALOG_CACHE.inc(result='hit')
+                    span.set_attribute("cache.hit", True)
+                    return cached[1]
+
+                metrics.CATALOG_CACHE.inc(result='miss')
+                span.set_attribute("cache.hit", False)
+                c = self.catalog().execute('SELECT * FROM mortgage_products')
+                columns = [description[0] for description in c.description]
+                products = [dict(zip(columns, row)) for row in c.fetchall()]
+                _catalog_cache[self.db_path] = (version, products)
+                return products
+
+    def create_completion(self, stage, **kwargs):
+        """Call the chat completions API, tracing latency and token usage for the stage"""
+        with tracing.span(f"llm.{stage}", {"llm.model": kwargs.get('model')}) as span:
+            start = time.perf_counter()
+            try:
+                response = self.client.chat.completions.create(**kwargs)
+            except Exception as e:
+                metrics.LLM_ERRORS.inc(stage=stage, error=type(e).__name__)
+                raise
+            finally:
+                metrics.LLM_LATENCY.observe(time.perf_counter() - start, stage=stage)
+
+            usage = getattr(response, 'usage', None)
+            if usage is not None:
+                metrics.LLM_TOKENS.inc(usage.prompt_tokens, stage=stage, kind='prompt')
+                metrics.LLM_TOKENS.inc(usage.completion_tokens, stage=stage, kind='completion')
+                if span.recording:
+                    span.set_attributes({
+                        "llm.usage.prompt_tokens": usage.prompt_tokens,
+                        "llm.usage.completion_tokens": usage.completion_tokens,
+                        "llm.usage.total_tokens": usage.total_tokens
+                    })
+            return response
 
     def get_system_prompt(self):
         """Generate system prompt based on current conversation state"""
@@ -78,13 +232,20 @@ class ConversationalMortgageAgent:
         if 'mortgage_purpose' in self.state:
             base_prompt += f"\nCustomer Purpose: {self.state['mortgage_purpose']}"
         
+        if 'local_market' in self.state:
+            base_prompt += f"\nLocal market: {self.state['local_market']}"
+        
+        if 'property_estimate' in self.state:
+            base_prompt += (f"\nEstimated property value (valuation model, not stated by the customer): "
+                            f"{self.state['property_estimate']:,.0f} for {self.state.get('property_details', {})}")
+        
         if 'serviceability_metrics' in self.state:
-            metrics = self.state['serviceability_metrics']
+            serviceability = self.state['serviceability_metrics']
             base_prompt += f"""
             | Metric | Value |
             |--------|-------|
-            | DSR | **{metrics.get('dsr', 0):.2%}** |
-            | LVR | **{metrics.get('lvr', 0):.2%}** |
+            | DSR | **{serviceability.get('dsr', 0):.2%}** |
+            | LVR | **{serviceability.get('lvr', 0):.2%}** |
             """
         
         return base_prompt
@@ -132,7 +293,8 @@ class ConversationalMortgageAgent:
             }}
             """
             
-            response = client.chat.completions.create(
+            response = self.create_completion(
+                "enhanced_extraction",
                 model="gpt-3.5-turbo",
                 messages=[{"role": "system", "content": analysis_prompt}],
                 temperature=0.1
@@ -144,6 +306,23 @@ class ConversationalMortgageAgent:
         except Exception as e:
             print(f"Error extracting info: {e}")
             return {}
+
+    def update_state_with_info(self, extracted_info):
+        """Merge the non-empty fields of an enhanced extraction into state
+
+        Dollar amounts are converted to numbers; one that doesn't convert is left out rather
+        than stored, so it can't break scenario pricing on every later turn.
+        """
+        def known(section):
+            return {k: v for k, v in (extracted_info.get(section) or {}).items() if v not in (None, '', [])}
+
+        self.state['collected_info'].update(mortgage_finance.parse_amounts(known('financial')))
+        preferences = known('preferences')
+        if preferences:
+            self.state.setdefault('customer_preferences', {}).update(preferences)
+        life_events = known('life_events')
+        if life_events:
+            self.state.setdefault('customer_goals', {}).update(life_events)
     def extract_purpose(self, message):
         """Extract mortgage purpose from user message"""
         try:
@@ -158,7 +337,8 @@ class ConversationalMortgageAgent:
             Message: {message}
             """
             
-            response = client.chat.completions.create(
+            response = self.create_completion(
+                "purpose",
                 model="gpt-3.5-turbo",
                 messages=[{"role": "system", "content": purpose_prompt}],
                 temperature=0.1
@@ -178,7 +358,8 @@ class ConversationalMortgageAgent:
     def extract_financial_info(self, message):
         """Extract financial information from user message"""
         try:
-            response = client.chat.completions.create(
+            response = self.create_completion(
+                "financial_extraction",
                 model="gpt-3.5-turbo",
                 messages=[
                     {"role": "system", "content": """Extract financial information from the message. 
@@ -190,9 +371,8 @@ class ConversationalMortgageAgent:
                 temperature=0.1
             )
             
-            import json
             try:
-                extracted_info = json.loads(response.choices[0].message.content)
+                extracted_info = mortgage_finance.parse_amounts(json.loads(response.choices[0].message.content))
                 self.state['collected_info'].update(extracted_info)
                 
                 # Only calculate serviceability if we have all required info
@@ -216,127 +396,161 @@ class ConversationalMortgageAgent:
 
     def analyze_rate_impact(self, loan_amount, current_rate, term_years=30):
         """Analyze impact of rate changes on monthly payments"""
-        if loan_amount is None or current_rate is None:
-            return {}
-            
-        rate_changes = [-0.5, 0, 0.5, 1.0, 1.5]
-        analysis = {}
-        
-        for change in rate_changes:
-            new_rate = float(current_rate) + change
-            monthly_payment = self.estimate_monthly_payment(float(loan_amount), new_rate/100, term_years)
-            analysis[f"{new_rate:.1f}%"] = monthly_payment
-        
-        return analysis
+        return mortgage_finance.analyze_rate_impact(loan_amount, current_rate, term_years)
 
     def format_rate_impact_message(self, analysis):
         """Format rate impact analysis for user"""
-        message = "Here's how your monthly payments would change with different rates:\n\n"
-        base_payment = None
-        
-        for rate, payment in analysis.items():
-            if base_payment is None:
-                base_payment = payment
-                message += f"At current rate ({rate}): ${payment:,.2f}/month\n"
-            else:
-                diff = payment - base_payment
-                message += f"At {rate}: ${payment:,.2f}/month (${diff:,.2f} change)\n"
-        
-        return message
+        return mortgage_finance.format_rate_impact_message(analysis)
 
     def estimate_monthly_payment(self, loan_amount, annual_rate, years):
         """Calculate monthly mortgage payment"""
-        if loan_amount is None or annual_rate is None:
-            return 0
-        
-        monthly_rate = float(annual_rate) / 12
-        num_payments = int(years) * 12
-        monthly_payment = float(loan_amount) * (monthly_rate * (1 + monthly_rate)**num_payments) / ((1 + monthly_rate)**num_payments - 1)
-        return monthly_payment
+        return mortgage_finance.estimate_monthly_payment(loan_amount, annual_rate, years)
 
     def calculate_serviceability(self, income, expenses, loan_amount, property_value, other_debts=0):
         """Calculate key serviceability metrics"""
-        monthly_income = income / 12
-        monthly_loan_payment = self.estimate_monthly_payment(loan_amount, 0.035, 30)
-        
-        dsr = (monthly_loan_payment + other_debts) / monthly_income
-        lvr = loan_amount / property_value
-        nsr = (monthly_income - expenses) / monthly_loan_payment
-        
+        return mortgage_finance.calculate_serviceability(income, expenses, loan_amount, property_value, other_debts)
+    
+    def catalog(self):
+        """Shared read-only connections to the product database, with the pricing SQL functions"""
+        return db_pool.get_pool(self.db_path, mortgage_finance.SQL_FUNCTIONS)
+
+    def market_data(self):
+        """Query layer over the property market database, or None when there is no database"""
+        if not os.path.exists(self.market_db_path):
+            return None
+        if self.market is None:
+            from market_queries import MarketData  # Loads numpy, so only once a message is scanned
+            self.market = MarketData(self.market_db_path)
+        return self.market
+
+    def find_suburb(self, market, message):
+        """The suburb (id, name, postcode) of the first (longest) run of words in message that names
+        a known suburb
+
+        Runs are matched against the cached name set, not queried one by one. A single word only
+        counts when capitalised, so "manly" or "epping" in passing don't select a suburb.
+        """
+        names = market.suburb_names()
+        words = re.findall(r"[A-Za-z][A-Za-z'-]*", message)
+        for size in range(MAX_SUBURB_WORDS, 0, -1):
+            for start in range(len(words) - size + 1):
+                if size == 1 and not words[start][0].isupper():
+                    continue
+                suburb = names.get(' '.join(words[start:start + size]).lower())
+                if suburb is not None:
+                    return suburb
+        return None
+
+    def extract_property_details(self, message):
+        """Record the property the message describes (suburb, postcode, property_type, bedrooms,
+        bathrooms, parking) in state['property_details']
+
+        A suburb is looked up in the market database and its recent sales statistics (from
+        suburb_sales_stats) are kept in state['local_market'] for the prompt. The extracted
+        property preferences are scanned too.
+        """
+        text = f"{message}\n{self.state.get('customer_goals', {}).get('property_preferences') or ''}"
+        details = parse_property_features(text)
+        market = self.market_data()
+        try:
+            suburb = self.find_suburb(market, text) if market is not None else None
+            stats = market.suburb_stats(suburb['id'], LOCAL_MARKET_MONTHS) if suburb is not None else None
+        except sqlite3.Error as e:
+            print(f"Error looking up market data: {e}")
+            suburb = None
+        if details or suburb is not None:
+            if suburb is not None:
+                details.update(suburb=suburb['name'], postcode=suburb['postcode'], suburb_id=suburb['id'])
+            self.state.setdefault('property_details', {}).update(details)
+        if suburb is None:
+            return details
+        by_type = summarise_suburb_stats(stats)
+        self.state['local_market'] = {
+            'suburb': suburb['name'],
+            f'sales_last_{LOCAL_MARKET_MONTHS}_months': sum(entry['sales'] for entry in by_type.values()),
+            'by_property_type': by_type
+        }
+        return details
+
+    def estimate_property_value(self, property_details):
+        """Valuation model estimate for a described property (suburb, postcode, property_type,
+        bedrooms, bathrooms, parking), or None when it cannot be valued"""
+        if not property_details.get('suburb') or not os.path.exists(self.market_db_path):
+            return None
+        import valuation_model  # Loads numpy, so only once a property needs valuing
+        with tracing.span("agent.estimate_property_value") as span:
+            try:
+                # The id resolved from the message; sessions saved before it was kept fall back to the name
+                value = valuation_model.estimate_property(
+                    self.market_db_path, property_details['suburb'], property_details.get('postcode'),
+                    property_details.get('property_type'), property_details.get('bedrooms'),
+                    property_details.get('bathrooms'), property_details.get('parking'),
+                    suburb_id=property_details.get('suburb_id'))
+            except sqlite3.Error as e:
+                print(f"Error estimating property value: {e}")
+                value = None
+            span.set_attribute("agent.valued", value is not None)
+        return value['estimate'] if value else None
+
+    def update_property_estimate(self):
+        """Value the described property while the customer has not given a property value
+
+        The estimate is kept in state['property_estimate'], apart from collected_info, so it is
+        refreshed as the description changes and a value the customer states always wins.
+        """
+        details = self.state.get('property_details')
+        estimate = None
+        if details and 'property_value' not in self.state['collected_info']:
+            estimate = self.estimate_property_value(details)
+        if estimate is None:
+            self.state.pop('property_estimate', None)
+            return None
+        self.state['property_estimate'] = round(estimate, -3)
+        return self.state['property_estimate']
+
+    def customer_profile(self):
+        """Profile for scenario generation; an estimated property value stands in for a missing one"""
+        financial = dict(self.state['collected_info'])
+        if 'property_value' not in financial and 'property_estimate' in self.state:
+            financial['property_value'] = self.state['property_estimate']
         return {
-            'dsr': dsr,
-            'lvr': lvr,
-            'nsr': nsr,
-            'monthly_payment': monthly_loan_payment
+            'financial': financial,
+            'property': self.state.get('property_details', {}),
+            'preferences': self.state.get('customer_preferences', {}),
+            'goals': self.state.get('customer_goals', {})
         }
-    
-    def generate_loan_scenarios(self, customer_profile):
-        """Generate personalized loan scenarios based on customer profile"""
-        scenarios = []
+
+    def generate_loan_scenarios(self, customer_profile, limit=MAX_SCENARIOS):
+        """Generate personalized loan scenarios based on customer profile
+
+        Eligibility, pricing and ranking run in one SQLite query; only the cheapest
+        limit products come back to Python. A profile with a described 'property' but no
+        property_value is priced at the valuation model's estimate.
+        """
         financial = customer_profile.get('financial', {})
-        life_events = customer_profile.get('life_events', {})
-        preferences = customer_profile.get('preferences', {})
-        
-        # Get base loan details
-        property_value = financial.get('property_value', 0)
-        income = financial.get('income', 0)
-        loan_amount = financial.get('loan_amount', 0)
-        
-        # Analyze customer needs
-        needs_flexibility = 'marriage' in str(life_events.get('upcoming_changes', []))
-        risk_tolerance = preferences.get('risk_tolerance', 'moderate')
+        property_value = financial.get('property_value')
+        if property_value is None and isinstance(customer_profile.get('property'), dict):
+            property_value = self.estimate_property_value(customer_profile['property'])
+        # Amounts are bound as numbers (or NULL) so the SQL pricing functions never see text
+        parse = mortgage_finance.parse_amount
+        params = {
+            'income': parse(financial.get('income')) or 0,
+            'loan_amount': parse(financial.get('loan_amount')) or 0,
+            'property_value': parse(property_value) or None,
+            'other_debts': parse(financial.get('other_debts')) or 0,
+            'max_dsr': mortgage_finance.MAX_DSR,
+            'limit': limit
+        }
         
-        # Fetch matching products from database
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        c.execute('SELECT * FROM mortgage_products WHERE min_income <= ?', (income,))
-        eligible_products = c.fetchall()
-        conn.close()
+        # Filter, price and rank matching products in the database
+        with tracing.span("db.query", {"db.system": "sqlite", "db.name": self.db_path}) as span:
+            eligible_products = self.catalog().execute(SCENARIO_QUERY, params).fetchall()
+            span.set_attribute("db.rows", len(eligible_products))
         
-        for product in eligible_products:
-            monthly_payment = self.estimate_monthly_payment(loan_amount, float(product[5].strip('%'))/100, 30)
-            
-            scenario = {
-                'product_name': product[1],
-                'loan_amount': loan_amount,
-                'interest_rate': float(product[5].strip('%')),
-                'monthly_payment': monthly_payment,
-                'features': [],
-                'suitability_reasons': [],
-                'considerations': []
-            }
-            
-            # Add personalized recommendations
-            if needs_flexibility and product[2] == 'variable':
-                scenario['suitability_reasons'].append("Provides flexibility for post-marriage expenses")
-                scenario['features'].extend(["Extra repayments", "Redraw facility"])
-            
-            scenarios.append(scenario)
-        
-        return scenarios
+        return mortgage_finance.build_loan_scenarios(eligible_products, customer_profile)
     def format_scenario_message(self, scenarios):
         """Format loan scenarios into clear, structured output"""
-        message = "## Based on your circumstances and preference here are recommended Loan Options\n\n"
-        
-        for i, scenario in enumerate(scenarios, 1):
-            message += f"### Option {i}: {scenario['product_name']}\n"
-            message += "| Category | Details |\n|----------|----------|\n"
-            message += f"| Interest Rate | **{scenario['interest_rate']}%** |\n"
-            message += f"| Monthly Payment | **${scenario['monthly_payment']:,.2f}** |\n"
-            
-            if scenario['features']:
-                message += "\n**Key Features:**\n"
-                for feature in scenario['features']:
-                    message += f"• {feature}\n"
-                    
-            if scenario['suitability_reasons']:
-                message += "\n**Why This Suits You:**\n"
-                for reason in scenario['suitability_reasons']:
-                    message += f"• {reason}\n"
-            
-            message += "\n---\n\n"
-        
-        return message
+        return mortgage_finance.format_scenario_message(scenarios)
     def update_conversation_stage(self):
         """Update the conversation stage based on collected information"""
         info = self.state['collected_info']
@@ -350,53 +564,153 @@ class ConversationalMortgageAgent:
         else:
             self.state['current_stage'] = 'data_collection'
 
+    def build_messages(self, user_message):
+        """Assemble the reply prompt: system prompt, history and the new user message"""
+        return [
+            {"role": "system", "content": self.get_system_prompt()},
+            *self.state['conversation_history'],
+            {"role": "user", "content": user_message}
+        ]
+
     def get_next_response(self, user_message):
         """Process user message and generate next response"""
+        start = time.perf_counter()
+        try:
+            return self._next_response(user_message)
+        finally:
+            metrics.TURN_LATENCY.observe(time.perf_counter() - start)
+
+    def _next_response(self, user_message):
+        with tracing.span("agent.turn", {"agent.history_messages": len(self.state['conversation_history'])}) as turn:
+            self.prepare_turn(user_message, turn)
+            
+            try:
+                with tracing.span("agent.reply"):
+                    with tracing.span("agent.build_prompt"):
+                        messages = self.build_messages(user_message)
+                    response = self.create_completion(
+                        "reply",
+                        model="gpt-3.5-turbo",
+                        messages=messages,
+                        temperature=0.7
+                    )
+                
+                assistant_message = response.choices[0].message.content
+                return self.complete_turn(user_message, assistant_message)
+                    
+            except Exception as e:
+                turn.record_exception(e)
+                return f"I apologize, but I encountered an error: {str(e)}"
+
+    def stream_next_response(self, user_message):
+        """Like get_next_response, but yield the reply in pieces as the LLM streams it"""
+        start = time.perf_counter()
+        with tracing.span("agent.turn", {"agent.history_messages": len(self.state['conversation_history']),
+                                         "agent.streamed": True}) as turn:
+            self.prepare_turn(user_message, turn)
+            
+            try:
+                parts = []
+                with tracing.span("agent.reply"):
+                    with tracing.span("agent.build_prompt"):
+                        messages = self.build_messages(user_message)
+                    stream = self.create_completion(
+                        "reply",
+                        model="gpt-3.5-turbo",
+                        messages=messages,
+                        temperature=0.7,
+                        stream=True
+                    )
+                    for chunk in stream:
+                        delta = chunk.choices[0].delta.content if chunk.choices else None
+                        if delta:
+                            parts.append(delta)
+                            yield delta
+                
+                reply = ''.join(parts)
+                assistant_message = self.complete_turn(user_message, reply)
+                if len(assistant_message) > len(reply):
+                    yield assistant_message[len(reply):]
+                    
+            except Exception as e:
+                turn.record_exception(e)
+                yield f"I apologize, but I encountered an error: {str(e)}"
+            finally:
+                metrics.TURN_LATENCY.observe(time.perf_counter() - start)
+
+    def prepare_turn(self, user_message, turn=tracing.NOOP_SPAN):
+        """Run the extraction calls and stage update that precede the reply"""
         # Extract purpose if not already known
         if 'mortgage_purpose' not in self.state:
-            self.extract_purpose(user_message)
+            with tracing.span("agent.extract_purpose"):
+                self.extract_purpose(user_message)
         
         # Extract financial info
-        self.extract_enhanced_info(user_message)
+        with tracing.span("agent.extract_enhanced_info"):
+            self.extract_enhanced_info(user_message)
+        
+        # Look up the property the customer describes, if any, and value it when they haven't
+        with tracing.span("agent.extract_property_details"):
+            self.extract_property_details(user_message)
+        self.update_property_estimate()
         
         # Update stage based on collected info
-        self.update_conversation_stage()
+        with tracing.span("agent.update_conversation_stage"):
+            self.update_conversation_stage()
+        turn.set_attribute("agent.stage", self.state['current_stage'])
+
+    def complete_turn(self, user_message, assistant_message):
+        """Append scenario analysis to the reply and record the exchange in history"""
+        # Create customer profile from state
+        customer_profile = self.customer_profile()
         
-        try:
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": self.get_system_prompt()},
-                    *self.state['conversation_history'],
-                    {"role": "user", "content": user_message}
-                ],
-                temperature=0.7
-            )
-            
-            assistant_message = response.choices[0].message.content
-            
-            # Create customer profile from state
-            customer_profile = {
-                'financial': self.state['collected_info'],
-                'preferences': self.state.get('customer_preferences', {}),
-                'goals': self.state.get('customer_goals', {})
-            }
-            
-            # Add scenario analysis when we have basic financial info
-            if all(key in self.state['collected_info'] for key in ['income', 'property_value']):
+        # Add scenario analysis when we have basic financial info (the property value may be estimated)
+        if all(key in customer_profile['financial'] for key in ['income', 'property_value']):
+            with tracing.span("agent.generate_loan_scenarios") as span:
                 scenarios = self.generate_loan_scenarios(customer_profile)  # Fixed!
+                span.set_attribute("agent.scenarios", len(scenarios))
+            with tracing.span("agent.format_scenario_message"):
                 scenario_message = self.format_scenario_message(scenarios)
-                assistant_message += f"\n\n{scenario_message}"
-            
-            self.state['conversation_history'].extend([
-                {"role": "user", "content": user_message},
-                {"role": "assistant", "content": assistant_message}
-            ])
-            
-            return assistant_message
-                
-        except Exception as e:
-            return f"I apologize, but I encountered an error: {str(e)}"
+            assistant_message += f"\n\n{scenario_message}"
+        
+        history = self.state['conversation_history']
+        history.append("user", user_message)
+        history.append("assistant", assistant_message)
+        
+        return assistant_message
+
+    def trim_history(self, max_bytes):
+        """Shrink history below max_bytes: drop old scenario tables first, then the oldest turns
+
+        The latest exchange is always kept whole. Returns True when anything was removed.
+        """
+        history = self.state['conversation_history']
+        if history.nbytes() <= max_bytes:
+            return False
+
+        for index, (role, content) in enumerate(history.entries[:-2]):
+            if role == 'assistant' and SCENARIO_HEADING in content:
+                history.replace_content(index, content.split(f"\n\n{SCENARIO_HEADING}", 1)[0])
+
+        while len(history) > 2 and history.nbytes() > max_bytes:
+            history.drop_oldest(2)
+        return True
+
+    def export_state(self):
+        """Conversation state without the product catalog, safe to serialise"""
+        state = {key: value for key, value in self.state.items() if key != 'products'}
+        state['conversation_history'] = self.state['conversation_history'].to_list()
+        return state
+
+    @classmethod
+    def from_state(cls, state, **kwargs):
+        """Rebuild an agent from export_state() output"""
+        agent = cls(**kwargs)
+        agent.state.update(state)
+        agent.state['conversation_history'] = MessageLog(state.get('conversation_history', []))
+        # Sessions saved before amounts were converted may hold strings such as "500k"
+        agent.state['collected_info'] = mortgage_finance.parse_amounts(state.get('collected_info', {}))
+        return agent
 '''
 def initialize_chat():
     """Initialize chat session and welcome message"""
@@ -0,0 +1,213 @@
+"""Finance and product-matching core of the mortgage agent.
+
+Plain functions with no UI, LLM or database dependencies, so batch jobs and CLIs can
+import them without paying for streamlit or openai. SQL_FUNCTIONS exposes the pricing
+functions to SQLite so scenarios can be filtered, priced and ranked in one query.
+"""
+
+# Heading of the scenario tables appended to replies; older copies are dropped first when history is trimmed
+SCENARIO_HEADING = "## Based on your circumstances and preference here are recommended Loan Options"
+
+
+# Highest debt service ratio (repayments over gross monthly income) a product is offered at
+MAX_DSR = 0.35
+
+# Collected fields holding dollar amounts; extracted values are converted with parse_amount
+AMOUNT_FIELDS = ('income', 'expenses', 'loan_amount', 'property_value', 'deposit', 'other_debts')
+AMOUNT_SUFFIXES = {'k': 1e3, 'm': 1e6, 'mil': 1e6, 'million': 1e6, 'b': 1e9}
+
+
+def parse_amount(value):
+    """A dollar amount as a float ("$150,000", "500k", "1.2m", 80000), or None if it isn't one"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value) if value == value and abs(value) != float('inf') else None
+    if not isinstance(value, str):
+        return None
+    text = value.strip().lower().replace(',', '').replace('$', '').replace('aud', '').strip()
+    number = text.rstrip('abcdefghijklmnopqrstuvwxyz ').strip()
+    suffix = text[len(number):].strip()
+    if suffix and suffix not in AMOUNT_SUFFIXES:
+        return None
+    try:
+        amount = float(number)
+    except ValueError:
+        return None
+    return amount * AMOUNT_SUFFIXES.get(suffix, 1)
+
+
+def parse_amounts(info):
+    """info with its AMOUNT_FIELDS converted to numbers; values that don't convert are dropped"""
+    parsed = {}
+    for key, value in info.items():
+        if key in AMOUNT_FIELDS:
+            value = parse_amount(value)
+            if value is None:
+                continue
+        parsed[key] = value
+    return parsed
+
+
+def estimate_monthly_payment(loan_amount, annual_rate, years):
+    """Calculate monthly mortgage payment"""
+    if loan_amount is None or annual_rate is None:
+        return 0
+
+    monthly_rate = float(annual_rate) / 12
+    num_payments = int(years) * 12
+    if monthly_rate == 0:
+        return float(loan_amount) / num_payments
+    monthly_payment = float(loan_amount) * (monthly_rate * (1 + monthly_rate)**num_payments) / ((1 + monthly_rate)**num_payments - 1)
+    return monthly_payment
+
+
+def calculate_serviceability(income, expenses, loan_amount, property_value, other_debts=0):
+    """Calculate key serviceability metrics"""
+    monthly_income = income / 12
+    monthly_loan_payment = estimate_monthly_payment(loan_amount, 0.035, 30)
+
+    dsr = (monthly_loan_payment + other_debts) / monthly_income
+    lvr = loan_amount / property_value
+    nsr = (monthly_income - expenses) / monthly_loan_payment
+
+    return {
+        'dsr': dsr,
+        'lvr': lvr,
+        'nsr': nsr,
+        'monthly_payment': monthly_loan_payment
+    }
+
+
+def loan_to_value(loan_amount, property_value):
+    """LVR as a fraction; None when either side is unknown"""
+    if not loan_amount or not property_value:
+        return None
+    return float(loan_amount) / float(property_value)
+
+
+def debt_service_ratio(monthly_payment, other_debts, income):
+    """DSR as a fraction of gross monthly income; None without an income"""
+    if monthly_payment is None or not income:
+        return None
+    return (float(monthly_payment) + float(other_debts or 0)) / (float(income) / 12)
+
+
+def null_on_error(fn):
+    """fn for SQLite: bad arguments give NULL instead of aborting the whole query"""
+    def sql_function(*args):
+        try:
+            return fn(*args)
+        except (TypeError, ValueError, ArithmeticError):
+            return None
+    sql_function.__name__ = fn.__name__
+    return sql_function
+
+
+# (name, argument count, function) registered on catalog connections; all are deterministic
+SQL_FUNCTIONS = [
+    ('annuity_payment', 3, null_on_error(estimate_monthly_payment)),
+    ('lvr', 2, null_on_error(loan_to_value)),
+    ('dsr', 3, null_on_error(debt_service_ratio))
+]
+
+
+def analyze_rate_impact(loan_amount, current_rate, term_years=30):
+    """Analyze impact of rate changes on monthly payments"""
+    if loan_amount is None or current_rate is None:
+        return {}
+
+    rate_changes = [-0.5, 0, 0.5, 1.0, 1.5]
+    analysis = {}
+
+    for change in rate_changes:
+        new_rate = float(current_rate) + change
+        monthly_payment = estimate_monthly_payment(float(loan_amount), new_rate/100, term_years)
+        analysis[f"{new_rate:.1f}%"] = monthly_payment
+
+    return analysis
+
+
+def format_rate_impact_message(analysis):
+    """Format rate impact analysis for user"""
+    message = "Here's how your monthly payments would change with different rates:\n\n"
+    base_payment = None
+
+    for rate, payment in analysis.items():
+        if base_payment is None:
+            base_payment = payment
+            message += f"At current rate ({rate}): ${payment:,.2f}/month\n"
+        else:
+            diff = payment - base_payment
+            message += f"At {rate}: ${payment:,.2f}/month (${diff:,.2f} change)\n"
+
+    return message
+
+
+def build_loan_scenarios(eligible_products, customer_profile):
+    """Turn priced product rows (name, product_type, base_rate, early_repayment_allowed, payment, lvr, dsr)
+    into personalised loan scenarios
+
+    A NULL product_type or early_repayment_allowed means the catalog does not know, so
+    nothing is claimed for it.
+    """
+    scenarios = []
+    financial = customer_profile.get('financial', {})
+    life_events = customer_profile.get('life_events', {})
+
+    loan_amount = financial.get('loan_amount', 0)
+
+    # Analyze customer needs
+    needs_flexibility = 'marriage' in str(life_events.get('upcoming_changes', []))
+
+    for product in eligible_products:
+        scenario = {
+            'product_name': product['name'],
+            'loan_amount': loan_amount,
+            'interest_rate': product['base_rate'],
+            'monthly_payment': product['payment'],
+            'lvr': product['lvr'],
+            'dsr': product['dsr'],
+            'features': [],
+            'suitability_reasons': [],
+            'considerations': []
+        }
+
+        # Add personalized recommendations
+        if needs_flexibility and product['product_type'] == 'variable':
+            scenario['suitability_reasons'].append("Provides flexibility for post-marriage expenses")
+            if product['early_repayment_allowed']:
+                scenario['features'].extend(["Extra repayments", "Redraw facility"])
+            elif product['early_repayment_allowed'] is None:
+                scenario['considerations'].append("Extra repayment terms not recorded; confirm with the lender")
+
+        scenarios.append(scenario)
+
+    return scenarios
+
+
+def format_scenario_message(scenarios):
+    """Format loan scenarios into clear, structured output"""
+    message = f"{SCENARIO_HEADING}\n\n"
+    if not scenarios:
+        message += "No products in our catalog match your income, loan size and property value yet.\n"
+
+    for i, scenario in enumerate(scenarios, 1):
+        message += f"### Option {i}: {scenario['product_name']}\n"
+        message += "| Category | Details |\n|----------|----------|\n"
+        message += f"| Interest Rate | **{scenario['interest_rate']}%** |\n"
+        message += f"| Monthly Payment | **${scenario['monthly_payment']:,.2f}** |\n"
+
+        if scenario['features']:
+            message += "\n**Key Features:**\n"
+            for feature in scenario['features']:
+                message += f"• {feature}\n"
+
+        if scenario['suitability_reasons']:
+            message += "\n**Why This Suits You:**\n"
+            for reason in scenario['suitability_reasons']:
+                message += f"• {reason}\n"
+
+        message += "\n---\n\n"
+
+    return message
@@ -0,0 +1,143 @@
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+from mortgage_assistant import ConversationalMortgageAgent
+
+
+class SessionManager:
+    """Live agents of this process with memory caps, idle eviction and restore from a store
+
+    An agent untouched for idle_ttl seconds is saved to the store and dropped; the next
+    get_agent() for that session rebuilds it from the store. After every turn the
+    session's history is compacted to stay under max_session_bytes.
+
+    Agents are not thread-safe, so each has a lock: turns run inside session(), and the
+    sweeper and close() export an agent's state only while holding its lock.
+    """
+
+    def __init__(self, store, idle_ttl=1800, max_session_bytes=512 * 1024, sweep_interval=60, agent_kwargs=None):
+        self.store = store
+        self.agent_kwargs = agent_kwargs or {}
+        self.idle_ttl = float(idle_ttl)
+        self.max_session_bytes = int(max_session_bytes)
+        self.agents = {}  # session_id -> [agent, last_access, size, lock]
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        if sweep_interval:
+            threading.Thread(target=self.run_sweeper, args=(sweep_interval,), daemon=True,
+                             name='session-sweeper').start()
+
+    @classmethod
+    def from_env(cls, store):
+        return cls(
+            store,
+            idle_ttl=os.getenv("MORTGAGE_SESSION_IDLE_TTL", 1800),
+            max_session_bytes=os.getenv("MORTGAGE_SESSION_MAX_BYTES", 512 * 1024)
+        )
+
+    def get_agent(self, session_id):
+        """Return the live agent, restoring it from the store or starting a new one"""
+        return self.entry(session_id)[0]
+
+    def entry(self, session_id):
+        with self.lock:
+            entry = self.agents.get(session_id)
+            if entry is not None:
+                entry[1] = time.monotonic()
+                return entry
+
+        state = self.store.get(session_id)
+        if state:
+            agent = ConversationalMortgageAgent.from_state(state, **self.agent_kwargs)
+        else:
+            agent = ConversationalMortgageAgent(**self.agent_kwargs)
+        with self.lock:
+            return self.agents.setdefault(session_id, [agent, time.monotonic(), self.session_bytes(agent),
+                                                       threading.Lock()])
+
+    @contextmanager
+    def session(self, session_id):
+        """The session's agent, held exclusively for a turn (or for reading its history)"""
+        entry = self.entry(session_id)
+        with entry[3]:
+            entry[1] = time.monotonic()
+            yield entry[0]
+
+    def is_live(self, session_id):
+        with self.lock:
+            return session_id in self.agents
+
+    def save(self, session_id, agent):
+        """Enforce the memory cap and persist the session after a turn; True if history was compacted"""
+        trimmed = agent.trim_history(self.max_session_bytes)
+        if trimmed:
+            metrics.SESSIONS_TRIMMED.inc()
+        self.store.put(session_id, agent.export_state())
+        with self.lock:
+            entry = self.agents.get(session_id)
+            lock = entry[3] if entry is not None and entry[0] is agent else threading.Lock()
+            self.agents[session_id] = [agent, time.monotonic(), self.session_bytes(agent), lock]
+        self.update_memory_gauge()
+        return trimmed
+
+    def session_bytes(self, agent):
+        """Approximate per-session memory: history plus the small state dicts (the catalog is shared)"""
+        state = agent.state
+        size = state['conversation_history'].nbytes()
+        for key in ('collected_info', 'customer_preferences', 'customer_goals', 'serviceability_metrics'):
+            value = state.get(key)
+            if value:
+                size += sys.getsizeof(value) + sum(sys.getsizeof(v) for v in value.values())
+        return size
+
+    def memory_usage(self):
+        """session_id -> approximate bytes for every live session"""
+        with self.lock:
+            return {session_id: entry[2] for session_id, entry in self.agents.items()}
+
+    def update_memory_gauge(self):
+        with self.lock:
+            metrics.SESSION_MEMORY.set(sum(entry[2] for entry in self.agents.values()))
+
+    def sweep(self):
+        """Save and drop agents idle for longer than idle_ttl; returns how many were dropped"""
+        cutoff = time.monotonic() - self.idle_ttl
+        with self.lock:
+            idle = [(sid, entry) for sid, entry in self.agents.items() if entry[1] < cutoff]
+        evicted = 0
+        for session_id, entry in idle:
+            # An agent in the middle of a turn is not idle; never snapshot it half-updated
+            if not entry[3].acquire(blocking=False):
+                continue
+            try:
+                self.store.put(session_id, entry[0].export_state())
+                with self.lock:
+                    # Skip sessions that became active again while we were saving
+                    if self.agents.get(session_id) is entry and entry[1] < cutoff:
+                        del self.agents[session_id]
+                        metrics.SESSIONS_EVICTED.inc()
+                        evicted += 1
+            finally:
+                entry[3].release()
+        self.update_memory_gauge()
+        return evicted
+
+    def run_sweeper(self, interval):
+        while not self.stopped.wait(interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Error sweeping idle sessions: {e}")
+
+    def close(self):
+        self.stopped.set()
+        with self.lock:
+            live = list(self.agents.items())
+        for session_id, entry in live:
+            with entry[3]:
+                self.store.put(session_id, entry[0].export_state())
+        self.store.close()
@@ -0,0 +1,152 @@
+import cProfile
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# tracemalloc is process wide; concurrent profiled sessions share one start/stop, and tracing
+# that was already running before the first profiled rerun is left running
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+_tracemalloc_owned = False
+
+# Python 3.12+ allows one active cProfile profiler per process, so profiled reruns take turns;
+# a rerun that finds the profiler busy runs unprofiled
+_profiler_lock = threading.Lock()
+
+
+def _start_tracemalloc():
+    global _tracemalloc_users, _tracemalloc_owned
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracemalloc_owned = True
+        _tracemalloc_users += 1
+
+
+def _stop_tracemalloc():
+    global _tracemalloc_users, _tracemalloc_owned
+    with _tracemalloc_lock:
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0 and _tracemalloc_owned:
+            tracemalloc.stop()
+            _tracemalloc_owned = False
+
+
+def profiling_requested(query_params):
+    """Profiling is on for a session via ?profile=1 or MORTGAGE_PROFILE=1 for the whole process"""
+    if os.getenv("MORTGAGE_PROFILE", "").lower() in ("1", "true", "yes"):
+        return True
+    return str(query_params.get("profile", "")).lower() in ("1", "true", "yes")
+
+
+class SessionProfiler:
+    """Profiles each Streamlit rerun of one session with cProfile and tracemalloc
+
+    Every rerun writes <output_dir>/<session_id>/<run>.prof (load with pstats or
+    snakeviz) and <run>.json holding the timings and top-N allocation sites. The peak
+    is process wide: it covers every allocation since tracing started, including those of
+    other sessions running at the same time. Only one rerun in the process is profiled at a
+    time; reruns that overlap another profiled one (or another active profiling tool) run
+    unprofiled and are counted in skipped.
+    """
+
+    def __init__(self, session_id, output_dir='profiles', top_n=15):
+        self.session_id = session_id
+        self.directory = os.path.join(output_dir, session_id)
+        self.top_n = top_n
+        self.runs = 0
+        self.skipped = 0
+        self.timings = {}
+        self.summaries = []
+
+    @contextmanager
+    def profile_rerun(self):
+        """Profile everything executed inside the block as one rerun"""
+        if not _profiler_lock.acquire(blocking=False):
+            self.skipped += 1
+            yield self
+            return
+        try:
+            profiler = cProfile.Profile()
+            _start_tracemalloc()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Another profiling tool is active in this process
+                _stop_tracemalloc()
+                profiler = None
+            if profiler is None:
+                self.skipped += 1
+                yield self
+                return
+
+            self.runs += 1
+            self.timings = {}
+            start = time.perf_counter()
+            try:
+                yield self
+            finally:
+                profiler.disable()
+                wall = time.perf_counter() - start
+                snapshot = tracemalloc.take_snapshot()
+                _, peak = tracemalloc.get_traced_memory()
+                _stop_tracemalloc()
+                self.save(profiler, snapshot, wall, peak)
+        finally:
+            _profiler_lock.release()
+
+    def call(self, label, fn, *args, **kwargs):
+        """Run fn inside the current rerun and record its wall time under label"""
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.timings[label] = time.perf_counter() - start
+
+    def save(self, profiler, snapshot, wall, peak):
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"{self.runs:04d}-{'turn' if self.timings else 'rerun'}"
+        profile_path = os.path.join(self.directory, f"{name}.prof")
+        profiler.dump_stats(profile_path)
+
+        stats = pstats.Stats(profiler)
+        functions = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:self.top_n]
+        snapshot = snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>")
+        ])
+
+        summary = {
+            'run': self.runs,
+            'session_id': self.session_id,
+            'wall_ms': wall * 1000,
+            'timings_ms': {label: t * 1000 for label, t in self.timings.items()},
+            'process_peak_memory_kib': peak / 1024,
+            'top_functions': [
+                {
+                    'function': f"{os.path.basename(filename)}:{line}({func})",
+                    'calls': calls,
+                    'tottime_ms': tottime * 1000,
+                    'cumtime_ms': cumtime * 1000
+                }
+                for (filename, line, func), (_, calls, tottime, cumtime, _) in functions
+            ],
+            'top_allocations': [
+                {
+                    'location': f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                    'size_kib': stat.size / 1024,
+                    'count': stat.count
+                }
+                for stat in snapshot.statistics('lineno')[:self.top_n]
+            ],
+            'profile_path': profile_path
+        }
+        with open(os.path.join(self.directory, f"{name}.json"), 'w') as f:
+            json.dump(summary, f, indent=2)
+        self.summaries.append(summary)
+        # Keep only recent summaries in memory; the files hold the full history
+        del self.summaries[:-20]
@@ -0,0 +1,322 @@
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from urllib.parse import parse_qs
+
+# Encoded state is one format byte followed by zlib-compressed compact JSON
+FORMAT_VERSION = 1
+
+
+def encode_state(state):
+    payload = json.dumps(state, separators=(',', ':'), ensure_ascii=False).encode()
+    return bytes([FORMAT_VERSION]) + zlib.compress(payload, 6)
+
+
+def decode_state(data):
+    version = data[0]
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported session state format {version}")
+    return json.loads(zlib.decompress(data[1:]))
+
+
+class SessionConflict(Exception):
+    """Raised by put(..., expected_version=...) when the session changed since it was read"""
+
+
+class SessionStore(ABC):
+    """Backend interface: subclasses store encoded blobs, get/put handle the codec
+
+    Every save bumps a per-session version. load returns (blob, version) or None, and
+    compare_and_save writes only if the stored version is still the one that was read.
+    """
+
+    @abstractmethod
+    def load(self, session_id):
+        pass
+
+    @abstractmethod
+    def save_many(self, items):
+        pass
+
+    @abstractmethod
+    def compare_and_save(self, session_id, data, expected_version):
+        pass
+
+    @abstractmethod
+    def delete(self, session_id):
+        pass
+
+    def get(self, session_id):
+        return self.get_versioned(session_id)[0]
+
+    def get_versioned(self, session_id):
+        """(state, version), or (None, None) for an unknown session"""
+        loaded = self.load(session_id)
+        return (decode_state(loaded[0]), loaded[1]) if loaded is not None else (None, None)
+
+    def put(self, session_id, state, expected_version=None):
+        """Save state; with expected_version, raise SessionConflict if another writer saved first"""
+        data = encode_state(state)
+        if expected_version is None:
+            self.save_many([(session_id, data)])
+        elif not self.compare_and_save(session_id, data, expected_version):
+            raise SessionConflict(f"Session {session_id} was modified concurrently")
+
+    def close(self):
+        pass
+
+
+class MemorySessionStore(SessionStore):
+    """Keeps session state in this process only; for tests and single-worker runs"""
+
+    def __init__(self):
+        self.sessions = {}  # session_id -> (blob, version)
+        self.lock = threading.Lock()
+
+    def load(self, session_id):
+        with self.lock:
+            return self.sessions.get(session_id)
+
+    def save_many(self, items):
+        with self.lock:
+            for session_id, data in items:
+                self.sessions[session_id] = (data, self.sessions.get(session_id, (None, 0))[1] + 1)
+
+    def compare_and_save(self, session_id, data, expected_version):
+        with self.lock:
+            current = self.sessions.get(session_id)
+            if current is None or current[1] != expected_version:
+                return False
+            self.sessions[session_id] = (data, expected_version + 1)
+            return True
+
+    def delete(self, session_id):
+        with self.lock:
+            self.sessions.pop(session_id, None)
+
+
+class SQLiteSessionStore(SessionStore):
+    """Session state in a SQLite database shared by every worker process on the host"""
+
+    def __init__(self, path='sessions.db'):
+        self.path = path
+        self.local = threading.local()
+        conn = self.connection()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS session_state (
+                session_id TEXT PRIMARY KEY,
+                state BLOB NOT NULL,
+                updated_at REAL NOT NULL,
+                version INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        if 'version' not in [row[1] for row in conn.execute('PRAGMA table_info(session_state)')]:
+            conn.execute('ALTER TABLE session_state ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+        conn.commit()
+
+    def connection(self):
+        """One connection per thread; WAL lets readers run alongside a writer"""
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self.local.conn = conn
+        return conn
+
+    def load(self, session_id):
+        row = self.connection().execute('SELECT state, version FROM session_state WHERE session_id = ?',
+                                        (session_id,)).fetchone()
+        return tuple(row) if row else None
+
+    def save_many(self, items):
+        """Write a batch of (session_id, blob) in a single transaction"""
+        now = time.time()
+        conn = self.connection()
+        with conn:
+            conn.executemany(
+                'INSERT INTO session_state (session_id, state, updated_at, version) VALUES (?, ?, ?, 1) '
+                'ON CONFLICT(session_id) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at, '
+                'version = version + 1',
+                [(session_id, data, now) for session_id, data in items]
+            )
+
+    def compare_and_save(self, session_id, data, expected_version):
+        """Update the session only if nobody (in any process) has saved it since expected_version"""
+        conn = self.connection()
+        with conn:
+            cursor = conn.execute(
+                'UPDATE session_state SET state = ?, updated_at = ?, version = version + 1 '
+                'WHERE session_id = ? AND version = ?',
+                (data, time.time(), session_id, expected_version)
+            )
+        return cursor.rowcount == 1
+
+    def delete(self, session_id):
+        conn = self.connection()
+        with conn:
+            conn.execute('DELETE FROM session_state WHERE session_id = ?', (session_id,))
+
+    def close(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self.local.conn = None
+
+
+class CachedSessionStore(SessionStore):
+    """In-memory front for a backend: lazy load, write-behind batching and idle eviction
+
+    Sessions are loaded from the backend on first access and kept encoded, so a cached
+    session costs its compressed size. Writes are buffered and flushed together every
+    write_behind seconds (0 writes through). Sessions untouched for idle_ttl seconds, or
+    beyond max_sessions, are flushed and dropped from memory. Because another process
+    cannot see buffered writes, use this only with session affinity (or one process);
+    versions are then checked against this process's copy.
+    """
+
+    def __init__(self, backend, write_behind=1.0, idle_ttl=900, max_sessions=10000):
+        self.backend = backend
+        self.write_behind = float(write_behind)
+        self.idle_ttl = float(idle_ttl)
+        self.max_sessions = int(max_sessions)
+        self.entries = OrderedDict()  # session_id -> [blob, last_access, version]
+        self.dirty = {}
+        self.lock = threading.RLock()
+        self.flush_lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.worker = threading.Thread(target=self.run_maintenance, daemon=True, name='session-store')
+        self.worker.start()
+
+    def load(self, session_id):
+        with self.lock:
+            entry = self.entries.get(session_id)
+            if entry is not None:
+                entry[1] = time.monotonic()
+                self.entries.move_to_end(session_id)
+                return entry[0], entry[2]
+        loaded = self.backend.load(session_id)
+        if loaded is not None:
+            with self.lock:
+                # A write may have landed while we were reading; it wins
+                if session_id not in self.entries:
+                    self.entries[session_id] = [loaded[0], time.monotonic(), loaded[1]]
+                entry = self.entries[session_id]
+                loaded = entry[0], entry[2]
+            self.evict_overflow()
+        return loaded
+
+    def save_many(self, items):
+        now = time.monotonic()
+        with self.lock:
+            for session_id, data in items:
+                entry = self.entries.get(session_id)
+                self.entries[session_id] = [data, now, entry[2] + 1 if entry else 1]
+                self.entries.move_to_end(session_id)
+                self.dirty[session_id] = data
+        if self.write_behind <= 0:
+            self.flush()
+        self.evict_overflow()
+
+    def compare_and_save(self, session_id, data, expected_version):
+        self.load(session_id)
+        with self.lock:
+            entry = self.entries.get(session_id)
+            if entry is None or entry[2] != expected_version:
+                return False
+            self.entries[session_id] = [data, time.monotonic(), expected_version + 1]
+            self.entries.move_to_end(session_id)
+            self.dirty[session_id] = data
+        if self.write_behind <= 0:
+            self.flush()
+        return True
+
+    def delete(self, session_id):
+        with self.lock:
+            self.entries.pop(session_id, None)
+            self.dirty.pop(session_id, None)
+        self.backend.delete(session_id)
+
+    def flush(self):
+        """Write every buffered session to the backend in one batch"""
+        with self.flush_lock:
+            with self.lock:
+                batch, self.dirty = self.dirty, {}
+            if not batch:
+                return
+            try:
+                self.backend.save_many(list(batch.items()))
+            except Exception:
+                with self.lock:
+                    for session_id, data in batch.items():
+                        self.dirty.setdefault(session_id, data)
+                raise
+
+    def evict_idle(self):
+        cutoff = time.monotonic() - self.idle_ttl
+        with self.lock:
+            idle = [sid for sid, (_, last_access, _) in self.entries.items() if last_access < cutoff]
+        self.evict(idle)
+
+    def evict_overflow(self):
+        with self.lock:
+            overflow = len(self.entries) - self.max_sessions
+            oldest = list(self.entries)[:overflow] if overflow > 0 else []
+        self.evict(oldest)
+
+    def evict(self, session_ids):
+        if not session_ids:
+            return
+        # Flush first so an evicted session is never lost
+        self.flush()
+        with self.lock:
+            for session_id in session_ids:
+                if session_id not in self.dirty:
+                    self.entries.pop(session_id, None)
+
+    def run_maintenance(self):
+        interval = self.write_behind if self.write_behind > 0 else 5.0
+        while not self.stopped.wait(interval):
+            try:
+                self.flush()
+                self.evict_idle()
+            except Exception as e:
+                print(f"Error in session store maintenance: {e}")
+
+    def close(self):
+        self.stopped.set()
+        self.flush()
+        self.backend.close()
+
+
+# Query parameters accepted by CachedSessionStore
+CACHE_OPTIONS = {'write_behind', 'idle_ttl', 'max_sessions'}
+
+
+def create_store(url):
+    """Build a store from a URL
+
+    'memory' or 'sqlite:///path/to/sessions.db', optionally with
+    ?cache=1&write_behind=1.0&idle_ttl=900&max_sessions=10000 to add the caching layer.
+    """
+    base, _, query = url.partition('?')
+    options = {k: v[-1] for k, v in parse_qs(query).items()}
+    unknown = set(options) - {'cache'} - (CACHE_OPTIONS if options.get('cache', '0') in ('1', 'true') else set())
+    if unknown:
+        known = ', '.join(sorted({'cache'} | CACHE_OPTIONS))
+        raise ValueError(f"Unknown session store option(s) {', '.join(sorted(unknown))} in {url} "
+                         f"(known: {known}; all but cache need cache=1)")
+    if base == 'memory':
+        store = MemorySessionStore()
+    elif base.startswith('sqlite:///'):
+        store = SQLiteSessionStore(base[len('sqlite:///'):])
+    else:
+        raise ValueError(f"Unknown session store: {url}")
+
+    if options.pop('cache', '0') in ('1', 'true'):
+        store = CachedSessionStore(store, **options)
+    return store
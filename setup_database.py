@@ -1,29 +1,13 @@
 import sqlite3
 
+from migrations import migrate
+
 def setup_database():
     conn = sqlite3.connect('mortgage_products.db')
+    # Creates (or upgrades) the typed products table and its indexes; see migrations.py
+    migrate(conn)
     c = conn.cursor()
     
-    # Enhanced products table with more realistic attributes
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS mortgage_products (
-            id INTEGER PRIMARY KEY,
-            name TEXT NOT NULL,
-            product_type TEXT NOT NULL,  # fixed, variable, split
-            min_income REAL,
-            max_loan REAL,
-            property_value_min REAL,
-            base_rate REAL,
-            comparison_rate REAL,
-            max_lvr REAL,
-            term_years INTEGER,
-            first_home_buyer_eligible BOOLEAN,
-            features TEXT,  # JSON string of features
-            early_repayment_allowed BOOLEAN,
-            offset_account BOOLEAN
-        )
-    ''')
-    
     # More diverse sample products
     products = [
         ('Standard Variable', 'variable', 50000, 1000000, 200000, 4.5, 4.7, 80, 30, True, 
@@ -50,4 +34,4 @@ def setup_database():
     conn.close()
 
 if __name__ == "__main__":
-    setup_database()
\ No newline at end of file
+    setup_database()
@@ -1,118 +1,501 @@
+"""Generate a synthetic Sydney property market database.
+
+Columns are drawn with NumPy from a seed, so the same arguments always produce the same
+database. Sales are generated in blocks of suburbs (each block has its own random stream
+and a precomputed id range), inserted with batched executemany under bulk-load pragmas,
+and indexed once loading is done. With --workers, runs of blocks are generated in parallel
+into shard databases and merged with ATTACH. Scales from the sample dataset to tens of
+millions of sales. An existing output file is only replaced with --force, and sale dates end
+at a fixed --as-of date unless another is given:
+
+    python setup_market_database.py
+    python setup_market_database.py --suburbs 5000 --sales-per-suburb 2000 --as-of 2024-06-30
+    python setup_market_database.py --suburbs 25000 --sales-per-suburb 2000 --as-of 2024-06-30 --workers 0
+"""
+import argparse
+import os
 import sqlite3
-import random
-from datetime import datetime, timedelta
-
-def setup_market_database():
-    """Create and populate market data database with synthetic Sydney property data"""
-    conn = sqlite3.connect('property_market.db')
-    c = conn.cursor()
-    
-    # Create tables
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS suburbs (
-            id INTEGER PRIMARY KEY,
-            name TEXT NOT NULL,
-            postcode TEXT NOT NULL,
-            state TEXT NOT NULL,
-            median_price REAL,
-            price_growth_ytd REAL,
-            avg_days_on_market INTEGER
-        )
-    ''')
-    
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS recent_sales (
-            id INTEGER PRIMARY KEY,
-            suburb_id INTEGER,
-            property_type TEXT,
-            bedrooms INTEGER,
-            bathrooms INTEGER,
-            parking INTEGER,
-            sale_price REAL,
-            sale_date DATE,
-            days_on_market INTEGER,
-            FOREIGN KEY (suburb_id) REFERENCES suburbs (id)
-        )
-    ''')
-
-    # Add these new tables here
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS market_trends (
-            id INTEGER PRIMARY KEY,
-            suburb_id INTEGER,
-            month DATE,
-            avg_interest_rate REAL,
-            clearance_rate REAL,
-            new_listings INTEGER,
-            FOREIGN KEY (suburb_id) REFERENCES suburbs (id)
-        )
-    ''')
-
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS competitor_rates (
-            id INTEGER PRIMARY KEY,
-            lender_name TEXT,
-            product_type TEXT,
-            interest_rate REAL,
-            comparison_rate REAL,
-            last_updated DATE
-        )
-    ''')
-
-    # Then add some sample data for these new tables
-    competitor_data = [
-        ('Commonwealth Bank', 'variable', 4.29, 4.45, '2024-02-07'),
-        ('Westpac', 'variable', 4.35, 4.52, '2024-02-07'),
-        ('NAB', 'fixed_3yr', 4.79, 4.95, '2024-02-07'),
-        ('ANZ', 'variable', 4.32, 4.48, '2024-02-07'),
-        ('ING', 'variable', 4.15, 4.30, '2024-02-07'),
-        ('Macquarie', 'fixed_2yr', 4.55, 4.72, '2024-02-07')
-    ]
-    
-    c.executemany('''
-        INSERT OR REPLACE INTO competitor_rates 
-        (lender_name, product_type, interest_rate, comparison_rate, last_updated)
-        VALUES (?, ?, ?, ?, ?)
-    ''', competitor_data)
-    
-    # Generate recent sales for each suburb
-    for suburb_id in range(1, len(suburbs_data) + 1):
-        # Get suburb median price
-        c.execute('SELECT median_price FROM suburbs WHERE id = ?', (suburb_id,))
-        median_price = c.fetchone()[0]
-        
-        # Generate 10 recent sales per suburb
-        sales_data = []
-        for _ in range(10):
-            # Vary price around median
-            price_variation = random.uniform(0.85, 1.15)
-            sale_price = median_price * price_variation
-            
-            # Random date in last 6 months
-            days_ago = random.randint(1, 180)
-            sale_date = (datetime.now() - timedelta(days=days_ago)).strftime('%Y-%m-%d')
-            
-            # Property details
-            property_types = ["House", "Apartment", "Townhouse"]
-            sales_data.append((
-                suburb_id,
-                random.choice(property_types),
-                random.randint(1, 5),  # bedrooms
-                random.randint(1, 3),  # bathrooms
-                random.randint(1, 3),  # parking
-                sale_price,
-                sale_date,
-                random.randint(20, 90)  # days on market
-            ))
-    
-        c.executemany('''
-            INSERT INTO recent_sales 
-            (suburb_id, property_type, bedrooms, bathrooms, parking, sale_price, sale_date, days_on_market)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', sales_data)
-    
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+import market_stats
+
+# Latest sale date when none is given; fixed so that reruns produce the same database
+DEFAULT_AS_OF = '2024-06-30'
+
+# Seed suburbs: name, postcode, median price, price growth YTD (%), average days on market
+SUBURBS_DATA = [
+    ('Parramatta', '2150', 1150000, 4.2, 32),
+    ('Chatswood', '2067', 2650000, 5.1, 27),
+    ('Bondi', '2026', 3400000, 6.3, 24),
+    ('Newtown', '2042', 1850000, 3.8, 29),
+    ('Blacktown', '2148', 960000, 5.6, 35),
+    ('Penrith', '2750', 890000, 4.9, 38),
+    ('Liverpool', '2170', 980000, 4.4, 36),
+    ('Hornsby', '2077', 1550000, 3.9, 31),
+    ('Manly', '2095', 3900000, 5.8, 26),
+    ('Cronulla', '2230', 2350000, 4.7, 30),
+    ('Castle Hill', '2154', 1950000, 4.1, 33),
+    ('Ryde', '2112', 1900000, 3.6, 30),
+    ('Strathfield', '2135', 2800000, 3.2, 34),
+    ('Hurstville', '2220', 1450000, 3.4, 37),
+    ('Campbelltown', '2560', 820000, 6.1, 40),
+    ('Marrickville', '2204', 1800000, 4.6, 28),
+    ('Randwick', '2031', 2900000, 5.3, 27),
+    ('Epping', '2121', 2100000, 3.7, 32),
+    ('Dee Why', '2099', 2150000, 4.8, 29),
+    ('Auburn', '2144', 1050000, 3.1, 39),
+    ('Mosman', '2088', 4800000, 4.0, 35),
+    ('Kellyville', '2155', 1650000, 5.4, 31),
+    ('Bankstown', '2200', 1100000, 3.9, 38),
+    ('Sutherland', '2232', 1400000, 4.3, 33),
+    ('Rouse Hill', '2155', 1500000, 5.9, 30),
+    ('Surry Hills', '2010', 2000000, 4.5, 26),
+    ('Balmain', '2041', 2600000, 4.9, 28),
+    ('Fairfield', '2165', 920000, 3.5, 41),
+    ('Lane Cove', '2066', 2700000, 4.2, 29),
+    ('Maroubra', '2035', 2500000, 5.0, 27),
+]
+
+PROPERTY_TYPES = np.array(['House', 'Apartment', 'Townhouse'])
+PROPERTY_TYPE_SHARE = [0.55, 0.33, 0.12]
+PROPERTY_TYPE_PRICE = np.array([1.0, 0.55, 0.8])
+BEDROOMS_RANGE = np.array([[2, 5], [1, 3], [2, 4]])
+
+LENDERS = ['Commonwealth Bank', 'Westpac', 'NAB', 'ANZ', 'ING', 'Macquarie', 'Bankwest', 'Suncorp',
+           'St.George', 'Bank of Queensland', 'Great Southern Bank', 'ubank']
+COMPETITOR_PRODUCTS = [('variable', 0.0), ('fixed_2yr', 0.25), ('fixed_3yr', 0.4), ('fixed_5yr', 0.7)]
+
+# Target sales generated per block; fixes the block layout independently of anything but the scale
+ROWS_PER_BLOCK = 500000
+
+SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS suburbs (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        postcode TEXT NOT NULL,
+        state TEXT NOT NULL,
+        median_price REAL,
+        price_growth_ytd REAL,
+        avg_days_on_market INTEGER
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS recent_sales (
+        id INTEGER PRIMARY KEY,
+        suburb_id INTEGER,
+        property_type TEXT,
+        bedrooms INTEGER,
+        bathrooms INTEGER,
+        parking INTEGER,
+        sale_price REAL,
+        sale_date DATE,
+        days_on_market INTEGER,
+        FOREIGN KEY (suburb_id) REFERENCES suburbs (id)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS market_trends (
+        id INTEGER PRIMARY KEY,
+        suburb_id INTEGER,
+        month DATE,
+        avg_interest_rate REAL,
+        clearance_rate REAL,
+        new_listings INTEGER,
+        FOREIGN KEY (suburb_id) REFERENCES suburbs (id)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS suburb_sales_stats (
+        suburb_id INTEGER NOT NULL,
+        property_type TEXT NOT NULL,  -- '' for sales without a type
+        month DATE NOT NULL,  -- first of the month, like market_trends.month
+        sales INTEGER NOT NULL,
+        total_price REAL NOT NULL,
+        p10_price REAL,
+        p25_price REAL,
+        median_price REAL,
+        p75_price REAL,
+        p90_price REAL,
+        avg_days_on_market REAL,
+        median_days_on_market REAL,
+        PRIMARY KEY (suburb_id, property_type, month)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS suburb_versions (
+        suburb_id INTEGER PRIMARY KEY,
+        version INTEGER NOT NULL  -- bumped whenever the suburb's sales change; keys in-memory caches
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS valuation_models (
+        suburb_id INTEGER PRIMARY KEY,
+        version INTEGER NOT NULL,  -- suburb_versions.version the model was fitted at
+        sales INTEGER NOT NULL,
+        intercept REAL,  -- coefficients are NULL when the suburb had too few sales to fit
+        apartment REAL,
+        townhouse REAL,
+        bedrooms REAL,
+        bathrooms REAL,
+        parking REAL,
+        trend REAL,  -- log price change per year
+        residual_std REAL,
+        fitted_at TEXT NOT NULL
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS competitor_rates (
+        id INTEGER PRIMARY KEY,
+        lender_name TEXT,
+        product_type TEXT,
+        interest_rate REAL,
+        comparison_rate REAL,
+        last_updated DATE
+    )
+    '''
+]
+
+# name -> (table, columns, unique). The sales indexes carry the columns market_queries.py reads,
+# so its lookups never touch the table; the trends key is what ingest_market_data.py upserts on.
+INDEXES = {
+    'idx_sales_suburb_date': ('recent_sales', ('suburb_id', 'sale_date', 'sale_price', 'days_on_market'), False),
+    'idx_sales_suburb_type_beds': ('recent_sales', ('suburb_id', 'property_type', 'bedrooms', 'sale_date',
+                                                    'sale_price', 'days_on_market'), False),
+    'idx_trends_suburb_month': ('market_trends', ('suburb_id', 'month'), True),
+    'idx_suburbs_name': ('suburbs', ('name COLLATE NOCASE', 'postcode'), False),
+    'idx_competitor_product_rate': ('competitor_rates', ('product_type', 'interest_rate'), False)
+}
+
+COLUMNS = {
+    'suburbs': ['id', 'name', 'postcode', 'state', 'median_price', 'price_growth_ytd', 'avg_days_on_market'],
+    'recent_sales': ['id', 'suburb_id', 'property_type', 'bedrooms', 'bathrooms', 'parking', 'sale_price',
+                     'sale_date', 'days_on_market'],
+    'market_trends': ['id', 'suburb_id', 'month', 'avg_interest_rate', 'clearance_rate', 'new_listings'],
+    'competitor_rates': ['id', 'lender_name', 'product_type', 'interest_rate', 'comparison_rate', 'last_updated']
+}
+
+
+def create_schema(conn):
+    for statement in SCHEMA:
+        conn.execute(statement)
+
+
+def index_key(column):
+    """(column, collation) of an INDEXES column such as 'name COLLATE NOCASE'"""
+    parts = column.split()
+    return parts[0], parts[2].upper() if len(parts) > 2 and parts[1].upper() == 'COLLATE' else 'BINARY'
+
+
+def ensure_index(conn, name):
+    """Create one of INDEXES, rebuilding an existing index of that name whose definition has changed"""
+    table, columns, unique = INDEXES[name]
+    # index_xinfo also reports each key column's collation; key=0 rows are the trailing rowid
+    existing = [(row[2], row[4].upper()) for row in conn.execute(f'PRAGMA index_xinfo({name})') if row[5]]
+    if existing:
+        flags = {row[1]: row[2] for row in conn.execute(f'PRAGMA index_list({table})')}
+        if existing == [index_key(c) for c in columns] and flags.get(name) == int(unique):
+            return False
+        conn.execute(f'DROP INDEX {name}')
+    conn.execute(f"CREATE {'UNIQUE ' if unique else ''}INDEX {name} ON {table} ({', '.join(columns)})")
+    return True
+
+
+def create_indexes(conn):
+    """Build the read-path indexes; run after bulk loading, which is much faster than maintaining them per row"""
+    for name in INDEXES:
+        ensure_index(conn, name)
+    conn.execute('ANALYZE')
+
+
+def configure_bulk_load(conn):
+    """Pragmas for a one-off load; a crash mid-load means regenerating, so durability is traded for speed"""
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=OFF')
+    conn.execute('PRAGMA cache_size=-262144')
+    conn.execute('PRAGMA temp_store=MEMORY')
+
+
+def finish_bulk_load(conn):
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+
+def block_rng(seed, stream, block):
+    """Independent random stream per (table, block), so any block can be generated on its own"""
+    return np.random.default_rng([seed, stream, block])
+
+
+def generate_suburbs(seed, count, sales_per_suburb):
+    """Suburb columns; beyond the seed list, suburbs are noisy copies numbered by round"""
+    rng = block_rng(seed, 0, 0)
+    base = np.arange(count) % len(SUBURBS_DATA)
+    rounds = np.arange(count) // len(SUBURBS_DATA)
+    names = [SUBURBS_DATA[b][0] if r == 0 else f"{SUBURBS_DATA[b][0]} {r + 1}" for b, r in zip(base, rounds)]
+    median = np.array([s[2] for s in SUBURBS_DATA], dtype=float)[base]
+    growth = np.array([s[3] for s in SUBURBS_DATA])[base]
+    days = np.array([s[4] for s in SUBURBS_DATA])[base]
+    synthetic = rounds > 0
+    median = np.where(synthetic, median * rng.lognormal(0, 0.15, count), median).round(-3)
+    growth = np.where(synthetic, growth + rng.normal(0, 1.0, count), growth).round(1)
+    days = np.where(synthetic, days + rng.integers(-5, 6, count), days)
+    # Busier suburbs sell more; counts are fixed up front so sale ids can be assigned per block
+    popularity = rng.lognormal(0, 0.4, count)
+    sales = rng.poisson(sales_per_suburb * popularity / popularity.mean())
+    return {
+        'id': np.arange(1, count + 1),
+        'name': np.array(names),
+        'postcode': np.array([SUBURBS_DATA[b][1] for b in base]),
+        'state': np.full(count, 'NSW'),
+        'median_price': median,
+        'price_growth_ytd': growth,
+        'avg_days_on_market': days,
+        'sales_count': sales
+    }
+
+
+def sales_blocks(suburbs, sales_per_suburb):
+    """(block number, first suburb index, end suburb index, first sale id) for every sales block"""
+    per_block = max(1, ROWS_PER_BLOCK // max(1, sales_per_suburb))
+    counts = suburbs['sales_count']
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    return [(b, lo, min(lo + per_block, len(counts)), int(offsets[lo]) + 1)
+            for b, lo in enumerate(range(0, len(counts), per_block))]
+
+
+def generate_sales(seed, suburbs, block, lo, hi, first_id, as_of, history_days=180):
+    """Sale columns for suburbs[lo:hi]"""
+    rng = block_rng(seed, 1, block)
+    counts = suburbs['sales_count'][lo:hi]
+    n = int(counts.sum())
+    suburb_id = np.repeat(suburbs['id'][lo:hi], counts)
+    median = np.repeat(suburbs['median_price'][lo:hi], counts)
+    avg_days = np.repeat(suburbs['avg_days_on_market'][lo:hi], counts)
+
+    kind = rng.choice(len(PROPERTY_TYPES), size=n, p=PROPERTY_TYPE_SHARE)
+    bedrooms = rng.integers(BEDROOMS_RANGE[kind, 0], BEDROOMS_RANGE[kind, 1] + 1)
+    bathrooms = np.clip(bedrooms - rng.integers(0, 3, n), 1, 3)
+    parking = np.clip(rng.integers(0, 3, n) + (kind == 0), 0, 3)
+    price = median * PROPERTY_TYPE_PRICE[kind] * (1 + 0.12 * (bedrooms - 3)) * rng.lognormal(0, 0.12, n)
+    days_ago = rng.integers(1, history_days + 1, n)
+    sale_date = (np.datetime64(as_of, 'D') - days_ago).astype(str)
+    days_on_market = np.maximum(1, rng.gamma(2.0, avg_days / 2.0)).round().astype(np.int64)
+    return {
+        'id': np.arange(first_id, first_id + n),
+        'suburb_id': suburb_id,
+        'property_type': PROPERTY_TYPES[kind],
+        'bedrooms': bedrooms,
+        'bathrooms': bathrooms,
+        'parking': parking,
+        'sale_price': price.round(-2),
+        'sale_date': sale_date,
+        'days_on_market': days_on_market
+    }
+
+
+def national_rates(seed, months):
+    """Average mortgage rate path shared by every suburb, oldest month first"""
+    rng = block_rng(seed, 2, 0)
+    return (6.0 + np.cumsum(rng.normal(0, 0.08, months))).clip(2.0, 9.0)
+
+
+def generate_trends(seed, suburbs, block, lo, hi, as_of, months):
+    """Monthly trend columns for suburbs[lo:hi]; ids are (suburb index * months + month) + 1"""
+    rng = block_rng(seed, 3, block)
+    count = hi - lo
+    first_month = np.datetime64(as_of, 'M') - (months - 1)
+    month = np.tile((first_month + np.arange(months)).astype('datetime64[D]').astype(str), count)
+    rates = np.tile(national_rates(seed, months), count)
+    growth = np.repeat(suburbs['price_growth_ytd'][lo:hi], months)
+    clearance = (0.62 + 0.02 * growth + rng.normal(0, 0.06, count * months)).clip(0.3, 0.95)
+    listings = rng.poisson(np.repeat(suburbs['sales_count'][lo:hi] / 6.0 + 5, months))
+    return {
+        'id': np.arange(lo * months + 1, hi * months + 1),
+        'suburb_id': np.repeat(suburbs['id'][lo:hi], months),
+        'month': month,
+        'avg_interest_rate': (rates + rng.normal(0, 0.05, count * months)).round(2),
+        'clearance_rate': clearance.round(3),
+        'new_listings': listings
+    }
+
+
+def generate_competitor_rates(seed, as_of):
+    rng = block_rng(seed, 4, 0)
+    rows = [(lender, product, premium) for lender in LENDERS for product, premium in COMPETITOR_PRODUCTS]
+    base = rng.normal(6.1, 0.2, len(rows))
+    rate = (base + np.array([r[2] for r in rows])).round(2)
+    return {
+        'id': np.arange(1, len(rows) + 1),
+        'lender_name': np.array([r[0] for r in rows]),
+        'product_type': np.array([r[1] for r in rows]),
+        'interest_rate': rate,
+        'comparison_rate': (rate + rng.uniform(0.1, 0.3, len(rows))).round(2),
+        'last_updated': np.full(len(rows), str(as_of))
+    }
+
+
+def insert_columns(conn, table, columns, batch_size=50000):
+    """executemany the table's columns in batches; .tolist() hands sqlite3 native Python values"""
+    names = COLUMNS[table]
+    total = len(columns[names[0]])
+    sql = f"INSERT INTO {table} ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})"
+    for start in range(0, total, batch_size):
+        batch = [columns[n][start:start + batch_size].tolist() for n in names]
+        conn.executemany(sql, zip(*batch))
+    return total
+
+
+def reset_database(path):
+    """Delete a database file and its WAL/SHM files"""
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def load_blocks(conn, seed, suburb_columns, blocks, as_of, months, batch_size):
+    """Insert the sales and trends of each block; one transaction per block keeps the journal bounded"""
+    counts = {'recent_sales': 0, 'market_trends': 0}
+    for block, lo, hi, first_id in blocks:
+        with conn:
+            sales = generate_sales(seed, suburb_columns, block, lo, hi, first_id, as_of)
+            counts['recent_sales'] += insert_columns(conn, 'recent_sales', sales, batch_size)
+            trends = generate_trends(seed, suburb_columns, block, lo, hi, as_of, months)
+            counts['market_trends'] += insert_columns(conn, 'market_trends', trends, batch_size)
+    return counts
+
+
+def write_shard(path, seed, suburbs, sales_per_suburb, blocks, as_of, months, batch_size):
+    """Worker process: generate a run of blocks into a scratch shard database"""
+    reset_database(path)
+    conn = sqlite3.connect(path)
+    # Shards are scratch files that are thrown away on failure, so skip journaling altogether
+    conn.execute('PRAGMA journal_mode=OFF')
+    conn.execute('PRAGMA synchronous=OFF')
+    conn.execute('PRAGMA cache_size=-262144')
+    create_schema(conn)
+    # Regenerated from the seed rather than shipped from the parent; it is cheap and identical
+    suburb_columns = generate_suburbs(seed, suburbs, sales_per_suburb)
+    counts = load_blocks(conn, seed, suburb_columns, blocks, as_of, months, batch_size)
+    conn.close()
+    return counts
+
+
+def merge_shards(conn, shard_paths):
+    """Copy every shard into the main database in a single transaction
+
+    All shards are attached up front because SQLite cannot detach a database a transaction
+    has read from. Plain INSERT INTO ... SELECT * between identical tables lets SQLite copy
+    rows without decoding them; ids come from the shards, so the result matches a serial run.
+    """
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None
+    aliases = [f"shard{n}" for n in range(len(shard_paths))]
+    for alias, shard_path in zip(aliases, shard_paths):
+        conn.execute(f"ATTACH DATABASE ? AS {alias}", (shard_path,))
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for table in ('recent_sales', 'market_trends'):
+                for alias in aliases:
+                    conn.execute(f"INSERT INTO main.{table} SELECT * FROM {alias}.{table}")
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+    finally:
+        for alias in aliases:
+            conn.execute(f"DETACH DATABASE {alias}")
+        conn.isolation_level = isolation_level
+
+
+def load_parallel(conn, path, seed, suburbs, sales_per_suburb, blocks, as_of, months, batch_size, workers):
+    """Generate contiguous runs of blocks in worker processes, then merge the shards in block order"""
+    # One shard per worker, capped by how many databases a connection may attach at once
+    shards = min(workers, conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED), len(blocks))
+    if shards < workers:
+        print(f"Using {shards} shards; SQLite can attach at most {conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)}")
+    runs = [blocks[i * len(blocks) // shards:(i + 1) * len(blocks) // shards] for i in range(shards)]
+    shard_paths = [f"{path}.shard{n}" for n in range(shards)]
+    counts = {'recent_sales': 0, 'market_trends': 0}
+    try:
+        with ProcessPoolExecutor(max_workers=shards) as pool:
+            futures = [pool.submit(write_shard, shard_path, seed, suburbs, sales_per_suburb, run, as_of, months,
+                                   batch_size)
+                       for shard_path, run in zip(shard_paths, runs)]
+            for future in futures:
+                for table, n in future.result().items():
+                    counts[table] += n
+        merge_shards(conn, shard_paths)
+    finally:
+        for shard_path in shard_paths:
+            reset_database(shard_path)
+    return counts
+
+
+def setup_market_database(path='property_market.db', suburbs=len(SUBURBS_DATA), sales_per_suburb=10, months=24,
+                          seed=42, as_of=DEFAULT_AS_OF, batch_size=50000, workers=1, force=False):
+    """Create and populate market data database with synthetic Sydney property data
+
+    An existing database at path is replaced only with force, so real market data is never
+    overwritten by accident. With workers > 1, sales and trends are generated into
+    per-process shard databases and merged; the result is identical to a single-process run
+    with the same arguments.
+    """
+    if os.path.exists(path) and not force:
+        raise FileExistsError(f"{path} already exists; use --force to replace it with synthetic data")
+    start = time.perf_counter()
+    reset_database(path)
+    conn = sqlite3.connect(path)
+    configure_bulk_load(conn)
+    create_schema(conn)
+
+    suburb_columns = generate_suburbs(seed, suburbs, sales_per_suburb)
+    counts = {'suburbs': 0, 'recent_sales': 0, 'market_trends': 0, 'competitor_rates': 0}
+    with conn:
+        counts['suburbs'] = insert_columns(conn, 'suburbs', suburb_columns, batch_size)
+        counts['competitor_rates'] = insert_columns(conn, 'competitor_rates', generate_competitor_rates(seed, as_of),
+                                                    batch_size)
+
+    blocks = sales_blocks(suburb_columns, sales_per_suburb)
+    if workers > 1 and len(blocks) > 1:
+        counts.update(load_parallel(conn, path, seed, suburbs, sales_per_suburb, blocks, as_of, months, batch_size,
+                                    workers))
+    else:
+        counts.update(load_blocks(conn, seed, suburb_columns, blocks, as_of, months, batch_size))
+
+    loaded = time.perf_counter()
+    create_indexes(conn)
+    market_stats.rebuild(conn)
     conn.commit()
+    finish_bulk_load(conn)
     conn.close()
 
+    end = time.perf_counter()
+    rows = sum(counts.values())
+    print(f"Wrote {path}: " + ', '.join(f"{n} {table}" for table, n in counts.items()))
+    print(f"Loaded {rows:,} rows in {loaded - start:.1f}s ({rows / max(loaded - start, 1e-9):,.0f} rows/s), "
+          f"indexed in {end - loaded:.1f}s")
+    return counts
+
+
 if __name__ == "__main__":
-    setup_market_database()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Generate a synthetic property market database")
+    parser.add_argument('--db', default='property_market.db', help="Output file")
+    parser.add_argument('--force', action='store_true', help="Replace the output file if it already exists")
+    parser.add_argument('--suburbs', type=int, default=len(SUBURBS_DATA), help="Number of suburbs")
+    parser.add_argument('--sales-per-suburb', type=int, default=10, help="Average sales per suburb")
+    parser.add_argument('--months', type=int, default=24, help="Months of market trends per suburb")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--as-of', default=DEFAULT_AS_OF, help=f"Latest sale date, YYYY-MM-DD (default: {DEFAULT_AS_OF})")
+    parser.add_argument('--batch-size', type=int, default=50000, help="Rows per executemany call")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Generate in this many processes and merge their shards (0: one per CPU)")
+    args = parser.parse_args()
+
+    try:
+        setup_market_database(args.db, args.suburbs, args.sales_per_suburb, args.months, args.seed, args.as_of,
+                              args.batch_size, args.workers or os.cpu_count(), args.force)
+    except FileExistsError as e:
+        raise SystemExit(str(e))
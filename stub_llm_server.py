@@ -0,0 +1,275 @@
+import argparse
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Canned replies keyed by the kind of prompt the agent sends
+DEFAULT_CANNED = {
+    "purpose": "First home purchase",
+    "enhanced_extraction": {
+        "financial": {
+            "income": 120000,
+            "expenses": 3500,
+            "loan_amount": 560000,
+            "property_value": 700000,
+            "deposit": 140000
+        },
+        "life_events": {
+            "upcoming_changes": ["marriage"],
+            "timeline": "12 months",
+            "property_preferences": "3 bedroom house in western Sydney"
+        },
+        "preferences": {
+            "rate_type": "variable",
+            "risk_tolerance": "moderate",
+            "flexibility_needed": True
+        }
+    },
+    "financial_extraction": {
+        "income": 120000,
+        "expenses": 3500,
+        "loan_amount": 560000,
+        "property_value": 700000
+    },
+    "reply": (
+        "Thanks for sharing that. Based on an income of **$120,000** and a deposit of "
+        "**$140,000**, you are in a good position to borrow. Could you tell me a bit more "
+        "about your monthly expenses and whether you prefer a fixed or variable rate?"
+    )
+}
+
+
+class StubConfig:
+    """Behaviour of the stub server: latency, token rate, errors and canned content"""
+
+    def __init__(self, latency="fixed:0.2", tokens_per_second=50.0, error_rate=0.0,
+                 error_statuses=(429, 500), canned=None, seed=None):
+        self.latency = parse_latency(latency)
+        self.tokens_per_second = float(tokens_per_second)
+        self.error_rate = float(error_rate)
+        self.error_statuses = tuple(error_statuses)
+        self.canned = dict(DEFAULT_CANNED)
+        if canned:
+            self.canned.update(canned)
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def sample_latency(self):
+        """Draw a time-to-first-token delay in seconds"""
+        with self.lock:
+            return max(0.0, self.latency(self.rng))
+
+    def sample_error(self):
+        """Return an HTTP status to fail with, or None"""
+        with self.lock:
+            if self.error_rate and self.rng.random() < self.error_rate:
+                return self.rng.choice(self.error_statuses)
+        return None
+
+
+def parse_latency(spec):
+    """Parse a latency spec like 'fixed:0.2', 'uniform:0.1,0.5', 'normal:0.3,0.05' or 'lognormal:0.3,0.4'"""
+    if callable(spec):
+        return spec
+    kind, _, params = str(spec).partition(':')
+    values = [float(p) for p in params.split(',') if p]
+    if kind == 'none':
+        return lambda rng: 0.0
+    if kind == 'fixed':
+        return lambda rng: values[0]
+    if kind == 'uniform':
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == 'normal':
+        return lambda rng: rng.gauss(values[0], values[1])
+    if kind == 'lognormal':
+        # Parameterised by median and sigma so the spec reads in seconds
+        mu = math.log(values[0])
+        return lambda rng: rng.lognormvariate(mu, values[1])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+def classify_prompt(messages):
+    """Work out which agent prompt a request carries"""
+    system = next((m.get('content', '') for m in messages if m.get('role') == 'system'), '')
+    if 'determine if it indicates' in system:
+        return 'purpose'
+    if 'extract as JSON' in system:
+        return 'enhanced_extraction'
+    if 'Extract financial information' in system:
+        return 'financial_extraction'
+    return 'reply'
+
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token)"""
+    return max(1, len(text) // 4)
+
+
+def split_tokens(text):
+    """Split text into stream-sized pieces that join back to the original"""
+    return [text[i:i + 4] for i in range(0, len(text), 4)] or ['']
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    config = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.rstrip('/') in ('/healthz', '/v1/healthz'):
+            self.send_json(200, {"status": "ok"})
+        elif self.path.rstrip('/') in ('/models', '/v1/models'):
+            self.send_json(200, {"object": "list", "data": [{"id": "gpt-3.5-turbo", "object": "model"}]})
+        else:
+            self.send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+
+    def do_POST(self):
+        if self.path.rstrip('/') not in ('/chat/completions', '/v1/chat/completions'):
+            self.send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+            return
+
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+        config = self.config
+
+        time.sleep(config.sample_latency())
+        status = config.sample_error()
+        if status:
+            self.send_json(status, {"error": {"message": f"Injected error {status}", "type": "stub_error"}})
+            return
+
+        messages = body.get('messages', [])
+        content = config.canned[classify_prompt(messages)]
+        if not isinstance(content, str):
+            content = json.dumps(content)
+
+        prompt_tokens = sum(estimate_tokens(m.get('content') or '') for m in messages)
+        completion_tokens = estimate_tokens(content)
+        model = body.get('model', 'gpt-3.5-turbo')
+        completion_id = f"chatcmpl-stub-{uuid.uuid4().hex[:12]}"
+
+        if body.get('stream'):
+            self.stream_completion(completion_id, model, content)
+            return
+
+        if config.tokens_per_second > 0:
+            time.sleep(completion_tokens / config.tokens_per_second)
+        self.send_json(200, {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+        })
+
+    def stream_completion(self, completion_id, model, content):
+        """Send the reply as server-sent chat.completion.chunk events"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        created = int(time.time())
+        delay = 1 / self.config.tokens_per_second if self.config.tokens_per_second > 0 else 0
+
+        def chunk(delta, finish_reason=None):
+            return {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            }
+
+        self.write_event(chunk({"role": "assistant", "content": ""}))
+        for piece in split_tokens(content):
+            if delay:
+                time.sleep(delay)
+            self.write_event(chunk({"content": piece}))
+        self.write_event(chunk({}, "stop"))
+        self.write_chunk(b"data: [DONE]\n\n")
+        self.write_chunk(b"")
+
+    def write_event(self, payload):
+        self.write_chunk(f"data: {json.dumps(payload)}\n\n".encode())
+
+    def write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def send_json(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def create_server(config=None, host='127.0.0.1', port=8089):
+    """Build a threaded stub server bound to host:port (port 0 picks a free one)"""
+    handler = type('ConfiguredStubHandler', (StubHandler,), {'config': config or StubConfig()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_stub_server(config=None, host='127.0.0.1', port=0):
+    """Run the stub server on a background thread and return (server, base_url)"""
+    server = create_server(config, host, port)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}/v1"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stub server for offline load testing")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', default='fixed:0.2',
+                        help="none | fixed:S | uniform:LO,HI | normal:MEAN,SD | lognormal:MEDIAN,SIGMA")
+    parser.add_argument('--tokens-per-second', type=float, default=50.0,
+                        help="Completion token rate; 0 returns instantly")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of requests to fail")
+    parser.add_argument('--error-statuses', default='429,500', help="Comma separated HTTP statuses to inject")
+    parser.add_argument('--canned', help="JSON file overriding canned responses by prompt kind")
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    canned = None
+    if args.canned:
+        with open(args.canned) as f:
+            canned = json.load(f)
+
+    config = StubConfig(
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        error_rate=args.error_rate,
+        error_statuses=[int(s) for s in args.error_statuses.split(',') if s],
+        canned=canned,
+        seed=args.seed
+    )
+    server = create_server(config, args.host, args.port)
+    print(f"Stub LLM listening on http://{args.host}:{server.server_address[1]}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,36 @@
+import json
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+# The modules live at the repository root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import setup_market_database  # noqa: E402
+
+AS_OF = setup_market_database.DEFAULT_AS_OF
+PRODUCTS_DB = os.path.join(ROOT, 'mortgage_products.db')
+
+
+@pytest.fixture(scope='session')
+def market_db(tmp_path_factory):
+    """A small synthetic market database: 60 suburbs with ~400 sales each, dated up to AS_OF"""
+    path = str(tmp_path_factory.mktemp('market') / 'property_market.db')
+    setup_market_database.setup_market_database(path, suburbs=60, sales_per_suburb=400, seed=7, as_of=AS_OF)
+    return path
+
+
+class ScriptedClient:
+    """Chat completions stub: the enhanced extraction returns financial, other calls a fixed reply"""
+
+    def __init__(self, financial):
+        self.chat = SimpleNamespace(completions=self)
+        self.financial = financial
+
+    def create(self, messages, **kwargs):
+        prompt = messages[0]['content']
+        content = json.dumps({'financial': self.financial}) if 'Return exact JSON' in prompt else 'first_home'
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=None)
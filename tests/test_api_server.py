@@ -0,0 +1,83 @@
+import asyncio
+import json
+
+import pytest
+
+import api_server
+from session_store import MemorySessionStore
+
+
+def call(app, method, path, body=None, query=b'', send_error_after=None):
+    """Drive one HTTP request through the ASGI app; returns the messages it sent"""
+    sent = []
+    payload = json.dumps(body).encode() if body is not None else b''
+
+    async def receive():
+        return {'type': 'http.request', 'body': payload, 'more_body': False}
+
+    async def send(message):
+        if send_error_after is not None and len(sent) >= send_error_after:
+            raise OSError("client disconnected")
+        sent.append(message)
+
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query}
+    asyncio.run(app(scope, receive, send))
+    return sent
+
+
+def response(sent):
+    body = b''.join(m.get('body', b'') for m in sent[1:])
+    return sent[0]['status'], json.loads(body) if body else None
+
+
+@pytest.fixture
+def api():
+    api = api_server.MortgageAPI(store=MemorySessionStore(), turn_threads=2)
+    api.store.put('session1', {'collected_info': {}})
+    yield api
+    api.executor.shutdown(wait=True)
+
+
+def test_unexpected_error_is_a_json_500(api, monkeypatch, capsys):
+    def broken_turn(session_id, message, on_delta=None):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(api, 'run_turn', broken_turn)
+    status, body = response(call(api, 'POST', '/sessions/session1/turns', {'message': 'hi'}))
+    assert (status, body) == (500, {'error': "Internal server error"})
+    assert 'RuntimeError: boom' in capsys.readouterr().err
+
+
+def test_http_errors_keep_their_status(api):
+    assert response(call(api, 'GET', '/sessions/missing'))[0] == 404
+    assert response(call(api, 'POST', '/sessions/session1/turns', {'message': ''}))[0] == 400
+
+
+def test_streamed_error_becomes_an_error_event(api, monkeypatch):
+    def broken_turn(session_id, message, on_delta=None):
+        on_delta("partial")
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(api, 'run_turn', broken_turn)
+    sent = call(api, 'POST', '/sessions/session1/turns', {'message': 'hi'}, query=b'stream=1')
+    events = b''.join(m.get('body', b'') for m in sent[1:]).decode()
+    assert sent[0]['status'] == 200
+    assert 'event: delta' in events and 'event: error' in events and 'Internal server error' in events
+    assert sent[-1]['more_body'] is False
+
+
+def test_disconnect_mid_stream_waits_for_the_turn(api, monkeypatch):
+    finished = []
+
+    def slow_turn(session_id, message, on_delta=None):
+        for piece in ("one", "two", "three"):
+            on_delta(piece)
+        finished.append(session_id)
+        return {'session_id': session_id, 'reply': 'onetwothree', 'stage': None}
+
+    monkeypatch.setattr(api, 'run_turn', slow_turn)
+    # Response start and the first delta go through; the second send finds the client gone
+    sent = call(api, 'POST', '/sessions/session1/turns', {'message': 'hi'}, query=b'stream=1', send_error_after=2)
+    assert len(sent) == 2
+    assert finished == ['session1']
+    assert api.session_locks == {}
@@ -0,0 +1,70 @@
+import math
+import sqlite3
+from datetime import date
+
+import numpy as np
+import pytest
+
+from comparable_sales import FEATURE_DAYS, FEATURE_SCALES, TYPE_MISMATCH, ComparableSales
+from conftest import AS_OF
+from market_queries import MarketData
+
+
+def brute_force_neighbours(db_path, suburb_id, property_type, features, as_of, max_age_days=730):
+    """(distance, id) of every eligible sale, fully sorted, computed row by row"""
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute('SELECT id, property_type, bedrooms, bathrooms, parking, sale_date FROM recent_sales '
+                        'WHERE suburb_id = ? AND sale_price IS NOT NULL AND sale_date IS NOT NULL',
+                        (suburb_id,)).fetchall()
+    conn.close()
+    neighbours = []
+    for sale_id, sale_type, *sale_features, sale_date in rows:
+        age = (date.fromisoformat(AS_OF if as_of is None else as_of) - date.fromisoformat(sale_date)).days
+        if not 0 <= age <= max_age_days:
+            continue
+        squared = (age / FEATURE_DAYS) ** 2
+        for wanted, value, scale in zip(features, sale_features, FEATURE_SCALES.values()):
+            if wanted is not None:
+                squared += 1.0 if value is None else ((value - wanted) / scale) ** 2
+        if property_type is not None and sale_type != property_type:
+            squared += TYPE_MISMATCH ** 2
+        neighbours.append((math.sqrt(squared), sale_id))
+    return sorted(neighbours)
+
+
+@pytest.mark.parametrize('suburb_id, property_type, features, k', [
+    (1, 'House', (3, 2, 1), 10),
+    (7, 'Apartment', (2, 1, None), 25),
+    (12, None, (None, None, None), 5),
+])
+def test_search_matches_full_sort(market_db, suburb_id, property_type, features, k):
+    bedrooms, bathrooms, parking = features
+    result = ComparableSales(market_db).search(suburb_id, property_type, bedrooms, bathrooms, parking, k=k,
+                                               as_of=AS_OF)
+    expected = brute_force_neighbours(market_db, suburb_id, property_type, features, AS_OF)
+    distances = [c['distance'] for c in result['comparables']]
+    assert len(distances) == k
+    assert distances == sorted(distances)
+    np.testing.assert_allclose(distances, [d for d, _ in expected[:k]], rtol=1e-5, atol=1e-6)
+    # Any ids may be swapped among ties, but each one must sit at its brute-force distance
+    by_id = {sale_id: d for d, sale_id in expected}
+    for comparable in result['comparables']:
+        assert comparable['distance'] == pytest.approx(by_id[comparable['id']], rel=1e-5, abs=1e-6)
+
+
+def test_estimate_is_weighted_median_of_comparables(market_db):
+    result = ComparableSales(market_db).search(3, 'House', 3, 2, 1, k=15, as_of=AS_OF)
+    comparables = result['comparables']
+    total = sum(c['weight'] for c in comparables)
+    # The lowest price whose comparables at or below it carry at least half of the weight
+    median = min(c['sale_price'] for c in comparables
+                 if sum(o['weight'] for o in comparables if o['sale_price'] <= c['sale_price']) >= total / 2)
+    assert result['estimate'] == pytest.approx(median)
+
+
+def test_default_as_of_is_the_latest_sale(market_db):
+    engine = ComparableSales(market_db)
+    latest = MarketData(market_db).latest_sale_date(3)
+    result = engine.search(3, 'House', 3, 2, 1, k=5)
+    assert len(result['comparables']) == 5
+    assert result == engine.search(3, 'House', 3, 2, 1, k=5, as_of=latest)
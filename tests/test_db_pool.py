@@ -0,0 +1,57 @@
+import os
+import sqlite3
+import threading
+
+import pytest
+
+from db_pool import ReadPool, get_pool
+
+
+def make_db(path, value):
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE t (x INTEGER)')
+    conn.execute('INSERT INTO t VALUES (?)', (value,))
+    conn.commit()
+    conn.close()
+
+
+@pytest.fixture
+def pool(tmp_path):
+    path = str(tmp_path / 'catalog.db')
+    make_db(path, 1)
+    pool = ReadPool(path, functions=[('double', 1, lambda x: x * 2)])
+    yield pool
+    pool.close()
+
+
+def test_connections_are_read_only_rows_with_functions(pool):
+    row = pool.execute('SELECT x, double(x) AS doubled FROM t').fetchone()
+    assert (row['x'], row['doubled']) == (1, 2)
+    with pytest.raises(sqlite3.OperationalError):
+        pool.execute('INSERT INTO t VALUES (2)')
+
+
+def test_one_connection_per_thread(pool):
+    conn = pool.connection()
+    assert pool.connection() is conn
+
+    other = []
+    worker = threading.Thread(target=lambda: other.append(pool.connection()))
+    worker.start()
+    worker.join()
+    assert other[0] is not conn
+
+
+def test_reopens_when_the_file_is_replaced(pool, tmp_path):
+    assert pool.execute('SELECT x FROM t').fetchone()[0] == 1
+    replacement = str(tmp_path / 'new.db')
+    make_db(replacement, 7)
+    os.replace(replacement, pool.path)
+    assert pool.execute('SELECT x FROM t').fetchone()[0] == 7
+
+
+def test_get_pool_is_shared_per_file(tmp_path):
+    path = str(tmp_path / 'shared.db')
+    make_db(path, 1)
+    assert get_pool(path) is get_pool(os.path.join(str(tmp_path), '.', 'shared.db'))
+    get_pool(path).close()
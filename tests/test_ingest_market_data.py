@@ -0,0 +1,96 @@
+import sqlite3
+
+import pytest
+
+from conftest import AS_OF
+from ingest_market_data import ingest
+from setup_market_database import setup_market_database
+
+
+@pytest.fixture
+def small_db(tmp_path):
+    path = str(tmp_path / 'market.db')
+    setup_market_database(path, suburbs=5, sales_per_suburb=20, seed=3, as_of=AS_OF)
+    return path
+
+
+def first_suburb(db):
+    conn = sqlite3.connect(db)
+    row = conn.execute('SELECT id, name, postcode FROM suburbs ORDER BY id LIMIT 1').fetchone()
+    conn.close()
+    return row
+
+
+def table_snapshot(db):
+    conn = sqlite3.connect(db)
+    sales = conn.execute('SELECT * FROM recent_sales ORDER BY id').fetchall()
+    stats = conn.execute('SELECT * FROM suburb_sales_stats ORDER BY suburb_id, property_type, month').fetchall()
+    conn.close()
+    return sales, stats
+
+
+def write_feed(path, name, postcode):
+    lines = [
+        'suburb,postcode,property_type,bedrooms,bathrooms,parking,sale_price,sale_date,days_on_market',
+        f'{name},{postcode},House,3,2,1,"$1,250,000",2024-06-10,21',
+        f' {name.upper()} ,{postcode},unit,2,1,1,640000,2024-06-12,30',
+        f'{name},,Townhouse,3,2,,910000,2024-06-14T10:30:00,',
+        f'Atlantis,9999,House,3,2,1,900000,2024-06-10,20',
+        f'{name},{postcode},House,3,2,1,lots,2024-06-10,20',
+        f'{name},{postcode},House,3,2,1,5,2024-06-10,20',
+        f'{name},{postcode},House,3.5,2,1,900000,2024-06-10,20',
+        f'{name},{postcode},House,3,2,1,900000,,20',
+        f'{name},{postcode},House,3,2',
+    ]
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def test_rejects_are_counted_by_reason(small_db, tmp_path):
+    suburb_id, name, postcode = first_suburb(small_db)
+    feed = str(tmp_path / 'sales.csv')
+    write_feed(feed, name, postcode)
+
+    written, rejected = ingest(feed, 'recent_sales', small_db, chunk_size=4)
+
+    assert written == 3
+    assert rejected == {'unknown suburb': 1, 'bad sale_price': 2, 'bad bedrooms': 1, 'bad sale_date': 1,
+                        'malformed': 1}
+    conn = sqlite3.connect(small_db)
+    rows = conn.execute('''
+        SELECT property_type, sale_price, sale_date, parking, days_on_market FROM recent_sales
+        WHERE suburb_id = ? AND sale_date >= '2024-06-10' AND id >= ? ORDER BY sale_date
+    ''', (suburb_id, 1 << 62)).fetchall()
+    conn.close()
+    assert rows == [('House', 1250000.0, '2024-06-10', 1, 21), ('Apartment', 640000.0, '2024-06-12', 1, 30),
+                    ('Townhouse', 910000.0, '2024-06-14', None, None)]
+
+
+def test_reingesting_a_feed_changes_nothing(small_db, tmp_path):
+    suburb_id, name, postcode = first_suburb(small_db)
+    feed = str(tmp_path / 'sales.csv')
+    write_feed(feed, name, postcode)
+
+    ingest(feed, 'recent_sales', small_db)
+    before = table_snapshot(small_db)
+    written, _ = ingest(feed, 'recent_sales', small_db, chunk_size=2)
+    assert written == 3
+    assert table_snapshot(small_db) == before
+
+
+def test_trends_upsert_on_suburb_and_month(small_db, tmp_path):
+    suburb_id, name, postcode = first_suburb(small_db)
+    feed = str(tmp_path / 'trends.jsonl')
+    with open(feed, 'w') as f:
+        f.write(f'{{"suburb_id": {suburb_id}, "month": "2024-07", "clearance_rate": 0.7, "new_listings": 40}}\n')
+        f.write('not json\n')
+        f.write(f'{{"suburb_id": {suburb_id}, "month": "2024-07-15", "clearance_rate": 0.65}}\n')
+
+    written, rejected = ingest(feed, 'market_trends', small_db)
+
+    assert (written, rejected) == (2, {'malformed': 1})
+    conn = sqlite3.connect(small_db)
+    rows = conn.execute("SELECT month, clearance_rate, new_listings FROM market_trends "
+                        "WHERE suburb_id = ? AND month >= '2024-07'", (suburb_id,)).fetchall()
+    conn.close()
+    assert rows == [('2024-07-01', 0.65, None)]
@@ -0,0 +1,72 @@
+import sqlite3
+
+import numpy as np
+import pytest
+
+from market_arrays import MarketArrays
+
+PERCENTILES = (5, 25, 50, 75, 95)
+
+
+def reference_prices(db_path, suburb_ids, property_type=None, bedrooms=None, since=None):
+    sql = f"SELECT sale_price FROM recent_sales WHERE suburb_id IN ({', '.join('?' * len(suburb_ids))})"
+    params = list(suburb_ids)
+    if property_type is not None:
+        sql += ' AND property_type = ?'
+        params.append(property_type)
+    if bedrooms is not None:
+        sql += ' AND bedrooms BETWEEN ? AND ?'
+        params.extend(bedrooms)
+    if since is not None:
+        sql += ' AND sale_date >= ?'
+        params.append(since)
+    conn = sqlite3.connect(db_path)
+    prices = np.array([row[0] for row in conn.execute(sql, params)], dtype=float)
+    conn.close()
+    return prices
+
+
+@pytest.mark.parametrize('suburb_ids, filters', [
+    ([1], {}),
+    ([2], {'property_type': 'House', 'bedrooms': (3, 4)}),
+    ([3, 4, 5], {'property_type': 'Apartment', 'since': '2024-03-01'}),
+])
+def test_exact_percentiles_match_numpy(market_db, suburb_ids, filters):
+    result = MarketArrays(market_db).percentiles(suburb_ids, PERCENTILES, mode='exact', **filters)
+    prices = reference_prices(market_db, suburb_ids, **filters)
+    assert len(prices) > 20
+    assert result['exact'] and result['rank_error'] == 0.0
+    assert result['count'] == len(prices)
+    np.testing.assert_allclose([result['values'][p] for p in PERCENTILES], np.percentile(prices, PERCENTILES))
+
+
+def test_approximate_percentiles_within_rank_error(market_db):
+    suburb_ids = list(range(1, 61))
+    result = MarketArrays(market_db).percentiles(suburb_ids, PERCENTILES, mode='approx', confidence=0.999,
+                                                 since='2024-01-01')
+    prices = np.sort(reference_prices(market_db, suburb_ids, since='2024-01-01'))
+    assert not result['exact'] and 0 < result['rank_error'] < 0.1
+    for p in PERCENTILES:
+        value = result['values'][p]
+        # The true ranks the value could have, ties included
+        low = np.searchsorted(prices, value, 'left') / len(prices)
+        high = np.searchsorted(prices, value, 'right') / len(prices)
+        assert low - result['rank_error'] <= p / 100 <= high + result['rank_error']
+
+
+def test_auto_mode_switches_to_approximate_above_exact_limit(market_db):
+    arrays = MarketArrays(market_db, exact_limit=100)
+    assert arrays.percentiles([1, 2], mode='auto')['exact'] is False
+    assert MarketArrays(market_db).percentiles([1, 2], mode='auto')['exact'] is True
+
+
+def test_auto_mode_decides_on_the_filtered_count(market_db):
+    arrays = MarketArrays(market_db, exact_limit=100)
+    matching = arrays.percentiles([1, 2], mode='exact', property_type='House', bedrooms=3)['count']
+    assert 0 < matching <= 100
+    assert arrays.percentiles([1, 2], mode='auto', property_type='House', bedrooms=3)['exact'] is True
+
+
+def test_unknown_mode_is_rejected(market_db):
+    with pytest.raises(ValueError):
+        MarketArrays(market_db).percentiles(1, mode='fast')
@@ -0,0 +1,35 @@
+import sqlite3
+
+from conftest import AS_OF
+from market_queries import MarketData, check_plans, month_window, sale_window
+
+
+def test_every_query_uses_its_index(market_db):
+    conn = sqlite3.connect(market_db)
+    assert check_plans(conn) == []
+    conn.close()
+
+
+def test_default_windows_end_at_the_latest_data(market_db):
+    market = MarketData(market_db)
+    latest = market.latest_sale_date(1)
+    assert latest <= AS_OF
+
+    since, until = sale_window(None, latest)
+    summary = market.sales_summary(1)
+    assert summary == market.sales_summary(1, since, until)
+    assert summary['sales'] > 0
+    assert market.recent_sales(1)[0]['sale_date'] == latest
+    assert len(market.trends(1)) == 12
+    months = {row['month'] for row in market.suburb_stats(1)}
+    assert max(months) == month_window(1, latest)[1]
+    house = market.recent_sales(1, limit=1000)[0]
+    assert market.comparable_sales(1, house['property_type'], house['bedrooms'])
+
+
+def test_explicit_windows_are_kept(market_db):
+    market = MarketData(market_db)
+    assert market.sales_summary(1, '1990-01-01', '1990-06-30')['sales'] == 0
+    assert market.suburb_stats(1, until='1990-06-30') == []
+    assert month_window(3, '2024-06-30') == ('2024-04-01', '2024-06-01')
+    assert sale_window('2024-01-01', None, days=10)[0] == '2024-01-01'
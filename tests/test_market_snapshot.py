@@ -0,0 +1,72 @@
+import sqlite3
+from collections import defaultdict
+
+import numpy as np
+import pytest
+
+import market_snapshot
+
+AGGREGATES = {
+    'sales': ('sale_price', 'count'),
+    'total': ('sale_price', 'sum'),
+    'mean': ('sale_price', 'mean'),
+    'low': ('sale_price', 'min'),
+    'high': ('sale_price', 'max'),
+    'median': ('sale_price', 'median'),
+    'p90': ('sale_price', 'p90'),
+    'days': ('days_on_market', 'mean')
+}
+
+
+@pytest.fixture(scope='module')
+def sales(market_db, tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('snapshot'))
+    market_snapshot.export(market_db, path, chunk_size=1000)
+    return market_snapshot.MarketSnapshot(path)['recent_sales']
+
+
+def reference(db_path, key_sql, where='1', params=()):
+    """key -> (prices, days on market) of each GROUP BY key_sql group"""
+    conn = sqlite3.connect(db_path)
+    groups = defaultdict(lambda: ([], []))
+    for *key, price, days in conn.execute(f'SELECT {key_sql}, sale_price, days_on_market FROM recent_sales '
+                                          f'WHERE {where} ORDER BY {key_sql}', params):
+        groups[tuple(key)][0].append(price)
+        groups[tuple(key)][1].append(days)
+    conn.close()
+    return groups
+
+
+def assert_matches(result, groups):
+    assert len(result['sales']) == len(groups)
+    for i, (prices, days) in enumerate(groups.values()):
+        prices = np.array(prices)
+        assert result['sales'][i] == len(prices)
+        assert result['total'][i] == pytest.approx(prices.sum())
+        assert result['mean'][i] == pytest.approx(prices.mean())
+        assert result['low'][i] == prices.min() and result['high'][i] == prices.max()
+        assert result['median'][i] == pytest.approx(np.median(prices))
+        assert result['p90'][i] == pytest.approx(np.percentile(prices, 90))
+        assert result['days'][i] == pytest.approx(np.mean(days))
+
+
+def test_aggregate_matches_group_by(market_db, sales):
+    result = sales.aggregate(('suburb_id', 'property_type'), AGGREGATES)
+    groups = reference(market_db, 'suburb_id, property_type')
+    assert [(int(s), str(t)) for s, t in zip(result['suburb_id'], result['property_type'])] == list(groups)
+    assert_matches(result, groups)
+
+
+def test_aggregate_by_month_with_filters_matches_group_by(market_db, sales):
+    result = sales.aggregate(('sale_date:month',), AGGREGATES, suburb_id=(5, 20), property_type='House',
+                             sale_date=('2024-02-01', '2024-05-31'))
+    groups = reference(market_db, "strftime('%Y-%m', sale_date)",
+                       "suburb_id BETWEEN 5 AND 20 AND property_type = 'House' "
+                       "AND sale_date BETWEEN '2024-02-01' AND '2024-05-31'")
+    assert [(str(month),) for month in result['sale_date:month']] == list(groups)
+    assert_matches(result, groups)
+
+
+def test_aggregate_without_keys_is_one_group(market_db, sales):
+    result = sales.aggregate((), AGGREGATES, bedrooms=[2, 4])
+    assert_matches(result, reference(market_db, "'all'", 'bedrooms IN (2, 4)'))
@@ -0,0 +1,36 @@
+import sqlite3
+
+import market_stats
+from conftest import AS_OF
+from ingest_market_data import ingest
+from setup_market_database import setup_market_database
+
+
+def stats_rows(conn):
+    return conn.execute('SELECT * FROM suburb_sales_stats ORDER BY suburb_id, property_type, month').fetchall()
+
+
+def test_incremental_refresh_matches_a_rebuild(tmp_path):
+    db = str(tmp_path / 'market.db')
+    setup_market_database(db, suburbs=6, sales_per_suburb=60, seed=11, as_of=AS_OF)
+    conn = sqlite3.connect(db)
+    moved_id, suburb_id = conn.execute('SELECT id, suburb_id FROM recent_sales ORDER BY id LIMIT 1').fetchone()
+    other_suburb = conn.execute('SELECT id FROM suburbs WHERE id != ? LIMIT 1', (suburb_id,)).fetchone()[0]
+    conn.close()
+
+    # New sales in new and existing months, plus a sale re-delivered under another suburb and type
+    feed = str(tmp_path / 'sales.csv')
+    with open(feed, 'w') as f:
+        f.write('id,suburb_id,property_type,bedrooms,bathrooms,parking,sale_price,sale_date,days_on_market\n')
+        f.write(f'{moved_id},{other_suburb},Townhouse,3,2,1,990000,2024-05-03,25\n')
+        f.write(f',{suburb_id},House,4,2,2,1750000,2024-07-02,12\n')
+        f.write(f',{suburb_id},Apartment,2,1,1,720000,2024-06-11,\n')
+        f.write(f',{other_suburb},House,3,1,1,1300000,2023-01-20,40\n')
+    ingest(feed, 'recent_sales', db, chunk_size=2)
+
+    conn = sqlite3.connect(db)
+    incremental = stats_rows(conn)
+    with conn:
+        market_stats.rebuild(conn)
+    assert stats_rows(conn) == incremental
+    conn.close()
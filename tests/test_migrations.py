@@ -0,0 +1,72 @@
+import sqlite3
+
+import pytest
+
+import migrations
+
+
+@pytest.fixture
+def legacy_db(tmp_path):
+    """A version 0 catalog in the legacy layout, with rates stored as text like "3.5%" """
+    path = str(tmp_path / 'legacy.db')
+    conn = sqlite3.connect(path)
+    conn.execute('''
+        CREATE TABLE mortgage_products (
+            id INTEGER PRIMARY KEY, name TEXT, min_income REAL, max_loan REAL,
+            property_value_min REAL, interest_rate TEXT
+        )
+    ''')
+    conn.executemany('INSERT INTO mortgage_products VALUES (?, ?, ?, ?, ?, ?)', [
+        (1, 'Basic Variable', 50000, 800000, 200000, '3.5%'),
+        (2, 'Low Doc', None, 600000, None, ' 4.25% '),
+    ])
+    conn.commit()
+    conn.close()
+    return path
+
+
+def test_legacy_catalog_is_converted_to_the_typed_schema(legacy_db):
+    conn = sqlite3.connect(legacy_db)
+    assert migrations.migrate(conn) == list(range(1, migrations.SCHEMA_VERSION + 1))
+    assert migrations.schema_version(conn) == migrations.SCHEMA_VERSION
+
+    columns = migrations.table_columns(conn, 'mortgage_products')
+    assert 'base_rate' in columns and 'interest_rate' not in columns
+    rows = conn.execute('''
+        SELECT id, name, min_income, property_value_min, base_rate, typeof(base_rate),
+               product_type, early_repayment_allowed, term_years
+        FROM mortgage_products ORDER BY id
+    ''').fetchall()
+    assert rows == [
+        (1, 'Basic Variable', 50000.0, 200000.0, 3.5, 'real', None, None, 30),
+        (2, 'Low Doc', 0.0, 0.0, 4.25, 'real', None, None, 30),
+    ]
+    indexes = [row[1] for row in conn.execute('PRAGMA index_list(mortgage_products)')]
+    assert 'idx_products_eligibility' in indexes
+
+    # Already current: nothing more to apply
+    assert migrations.migrate(conn) == []
+    conn.close()
+
+
+def test_empty_database_gets_the_current_schema(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'new.db'))
+    migrations.migrate(conn)
+    assert migrations.schema_version(conn) == migrations.SCHEMA_VERSION
+    assert 'base_rate' in migrations.table_columns(conn, 'mortgage_products')
+    conn.close()
+
+
+def test_failed_migration_rolls_back_to_the_last_version(legacy_db, monkeypatch):
+    def broken(conn):
+        conn.execute('CREATE TABLE half_done (x)')
+        raise RuntimeError('boom')
+
+    monkeypatch.setattr(migrations, 'MIGRATIONS', [migrations.typed_products, broken])
+    conn = sqlite3.connect(legacy_db)
+    with pytest.raises(RuntimeError):
+        migrations.migrate(conn, target=2)
+    assert migrations.schema_version(conn) == 1
+    assert migrations.table_columns(conn, 'half_done') == []
+    assert 'base_rate' in migrations.table_columns(conn, 'mortgage_products')
+    conn.close()
@@ -0,0 +1,81 @@
+import sqlite3
+
+import pytest
+
+import migrations
+import mortgage_assistant
+import mortgage_finance
+from conftest import PRODUCTS_DB, ScriptedClient
+
+
+@pytest.mark.parametrize('value, expected', [
+    (80000, 80000.0), ('80000', 80000.0), ('$150,000', 150000.0), ('500k', 500000.0), ('1.2m', 1200000.0),
+    ('1.5 million', 1500000.0), ('about 100k', None), ('n/a', None), (True, None), (None, None), ([1], None)
+])
+def test_parse_amount(value, expected):
+    assert mortgage_finance.parse_amount(value) == expected
+
+
+def test_extracted_strings_are_converted_and_scenarios_still_price():
+    client = ScriptedClient({'income': '$150,000', 'loan_amount': '500k', 'property_value': '700k',
+                             'expenses': 'unknown'})
+    agent = mortgage_assistant.ConversationalMortgageAgent(llm_client=client, db_path=PRODUCTS_DB,
+                                                          market_db_path='missing.db')
+    reply = agent.get_next_response("I earn $150,000 and want to borrow 500k")
+
+    assert agent.state['collected_info'] == {'income': 150000.0, 'loan_amount': 500000.0, 'property_value': 700000.0}
+    assert mortgage_finance.SCENARIO_HEADING in reply
+
+
+def test_from_state_drops_unconvertible_amounts():
+    agent = mortgage_assistant.ConversationalMortgageAgent.from_state(
+        {'collected_info': {'income': '90k', 'loan_amount': 'lots'}}, db_path=PRODUCTS_DB)
+    assert agent.state['collected_info'] == {'income': 90000.0}
+
+
+def test_sql_functions_return_null_on_bad_input():
+    functions = {name: fn for name, _, fn in mortgage_finance.SQL_FUNCTIONS}
+    assert functions['annuity_payment']('lots', 0.05, 30) is None
+    assert functions['lvr'](400000, 'unknown') is None
+    assert functions['dsr'](2000, 0, 'n/a') is None
+    assert functions['lvr'](400000, 500000) == 0.8
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    path = str(tmp_path / 'catalog.db')
+    conn = sqlite3.connect(path)
+    migrations.migrate(conn)
+    conn.executemany('''
+        INSERT INTO mortgage_products (name, min_income, max_loan, property_value_min, max_lvr, base_rate)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', [
+        ('Open', 0, None, 0, None, 6.0),
+        ('Small Loans', 0, 300000, 0, None, 5.0),
+        ('Low LVR', 0, None, 0, 60, 5.5),
+        ('Premium', 100000, None, 800000, None, 4.0),
+    ])
+    conn.commit()
+    conn.close()
+    return path
+
+
+def scenario_names(catalog, **financial):
+    agent = mortgage_assistant.ConversationalMortgageAgent(llm_client=ScriptedClient({}), db_path=catalog,
+                                                          market_db_path='missing.db')
+    return [s['product_name'] for s in agent.generate_loan_scenarios({'financial': financial})]
+
+
+def test_scenarios_filter_on_loan_size_lvr_and_serviceability(catalog):
+    # 400k on a 500k property (80% LVR): too big for Small Loans, too geared for Low LVR, too cheap for Premium
+    assert scenario_names(catalog, income=150000, loan_amount=400000, property_value=500000) == ['Open']
+    # 60% LVR and a premium property
+    assert scenario_names(catalog, income=150000, loan_amount=600000, property_value=1000000) == [
+        'Premium', 'Low LVR', 'Open']
+    # Repayments on 900k are far above MAX_DSR of a 60k income
+    assert scenario_names(catalog, income=60000, loan_amount=900000, property_value=2000000) == []
+    # Unknown property value excludes nothing on value or LVR
+    assert scenario_names(catalog, income=150000, loan_amount=200000) == [
+        'Premium', 'Small Loans', 'Low LVR', 'Open']
+    # Text amounts are converted, never passed to the SQL functions
+    assert scenario_names(catalog, income='150k', loan_amount='400k', property_value='500k') == ['Open']
@@ -0,0 +1,76 @@
+import threading
+
+import pytest
+
+from conftest import PRODUCTS_DB, ScriptedClient
+from session_manager import SessionManager
+from session_store import MemorySessionStore
+
+
+@pytest.fixture
+def manager():
+    client = ScriptedClient({'income': 120000})
+    manager = SessionManager(MemorySessionStore(), idle_ttl=0, sweep_interval=0,
+                             agent_kwargs={'llm_client': client, 'db_path': PRODUCTS_DB,
+                                           'market_db_path': 'missing.db'})
+    yield manager
+    manager.close()
+
+
+def test_idle_agents_are_saved_and_restored(manager):
+    with manager.session('s1') as agent:
+        agent.get_next_response("I earn $120,000")
+        manager.save('s1', agent)
+
+    assert manager.sweep() == 1
+    assert 's1' not in manager.agents
+
+    restored = manager.get_agent('s1')
+    assert restored is not agent
+    assert restored.state['collected_info'] == {'income': 120000.0}
+    assert len(restored.state['conversation_history']) == len(agent.state['conversation_history'])
+
+
+def test_sweep_skips_an_agent_in_the_middle_of_a_turn(manager):
+    started, finish = threading.Event(), threading.Event()
+
+    def turn():
+        with manager.session('s1'):
+            started.set()
+            finish.wait(5)
+
+    worker = threading.Thread(target=turn)
+    worker.start()
+    started.wait(5)
+    try:
+        assert manager.sweep() == 0
+        assert manager.store.get('s1') is None
+    finally:
+        finish.set()
+        worker.join()
+    assert manager.sweep() == 1
+
+
+def test_turns_on_one_session_run_one_at_a_time(manager):
+    active, overlaps = [], []
+
+    def turn():
+        with manager.session('s1'):
+            active.append(1)
+            overlaps.append(len(active))
+            threading.Event().wait(0.01)
+            active.pop()
+
+    workers = [threading.Thread(target=turn) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert overlaps == [1, 1, 1, 1]
+
+
+def test_save_keeps_the_session_lock(manager):
+    with manager.session('s1') as agent:
+        lock = manager.agents['s1'][3]
+        manager.save('s1', agent)
+        assert manager.agents['s1'][3] is lock
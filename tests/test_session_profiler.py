@@ -0,0 +1,64 @@
+import cProfile
+import json
+import threading
+
+import pytest
+
+import session_profiler
+from session_profiler import SessionProfiler
+
+
+def test_rerun_writes_profile_and_summary(tmp_path):
+    profiler = SessionProfiler('abc12345', output_dir=str(tmp_path))
+    with profiler.profile_rerun():
+        profiler.call('work', sum, range(1000))
+    summary = profiler.summaries[-1]
+    assert summary['run'] == 1 and 'work' in summary['timings_ms']
+    with open(tmp_path / 'abc12345' / '0001-turn.json') as f:
+        assert json.load(f)['profile_path'] == summary['profile_path']
+
+
+def test_overlapping_rerun_runs_unprofiled(tmp_path):
+    first, second = SessionProfiler('first000', str(tmp_path)), SessionProfiler('second00', str(tmp_path))
+    inside, release = threading.Event(), threading.Event()
+
+    def long_rerun():
+        with first.profile_rerun():
+            inside.set()
+            release.wait(5)
+
+    thread = threading.Thread(target=long_rerun)
+    thread.start()
+    inside.wait(5)
+    with second.profile_rerun():
+        pass
+    release.set()
+    thread.join()
+    assert (first.runs, first.skipped) == (1, 0)
+    assert (second.runs, second.skipped) == (0, 1)
+    # The lock is free again afterwards
+    with second.profile_rerun():
+        pass
+    assert second.runs == 1
+
+
+def test_error_inside_rerun_is_raised_and_releases_the_profiler(tmp_path):
+    profiler = SessionProfiler('errors00', str(tmp_path))
+    with pytest.raises(RuntimeError):
+        with profiler.profile_rerun():
+            raise RuntimeError("boom")
+    with profiler.profile_rerun():
+        pass
+    assert profiler.runs == 2 and profiler.skipped == 0
+
+
+def test_another_active_profiler_skips_the_rerun(tmp_path, monkeypatch):
+    def busy(self):
+        raise ValueError("Another profiling tool is already active")
+
+    monkeypatch.setattr(cProfile.Profile, 'enable', busy)
+    profiler = SessionProfiler('busy0000', str(tmp_path))
+    with profiler.profile_rerun():
+        pass
+    assert profiler.runs == 0 and profiler.skipped == 1
+    assert session_profiler._tracemalloc_users == 0
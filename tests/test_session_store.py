@@ -0,0 +1,111 @@
+import sqlite3
+
+import pytest
+
+from session_store import (CachedSessionStore, MemorySessionStore, SessionConflict, SQLiteSessionStore,
+                           create_store, decode_state, encode_state)
+
+
+@pytest.fixture(params=['memory', 'sqlite', 'cached'])
+def store(request, tmp_path):
+    if request.param == 'memory':
+        store = MemorySessionStore()
+    elif request.param == 'sqlite':
+        store = SQLiteSessionStore(str(tmp_path / 'sessions.db'))
+    else:
+        store = CachedSessionStore(SQLiteSessionStore(str(tmp_path / 'sessions.db')), write_behind=60)
+    yield store
+    store.close()
+
+
+def test_round_trip_and_versions(store):
+    assert store.get_versioned('s1') == (None, None)
+    store.put('s1', {'collected_info': {'income': 90000.0}, 'note': 'é'})
+    store.put('s1', {'collected_info': {'income': 95000.0}})
+    assert store.get_versioned('s1') == ({'collected_info': {'income': 95000.0}}, 2)
+    store.delete('s1')
+    assert store.get('s1') is None
+
+
+def test_compare_and_save_rejects_a_stale_version(store):
+    store.put('s1', {'turn': 1})
+    _, version = store.get_versioned('s1')
+    store.put('s1', {'turn': 2}, expected_version=version)
+    with pytest.raises(SessionConflict):
+        store.put('s1', {'turn': 'stale'}, expected_version=version)
+    assert store.get_versioned('s1') == ({'turn': 2}, version + 1)
+    with pytest.raises(SessionConflict):
+        store.put('unknown', {'turn': 1}, expected_version=1)
+
+
+def test_sqlite_conflict_across_connections(tmp_path):
+    path = str(tmp_path / 'sessions.db')
+    first, second = SQLiteSessionStore(path), SQLiteSessionStore(path)
+    first.put('s1', {'turn': 1})
+    _, version = first.get_versioned('s1')
+    second.put('s1', {'turn': 2}, expected_version=version)
+    with pytest.raises(SessionConflict):
+        first.put('s1', {'turn': 'lost update'}, expected_version=version)
+    first.close()
+    second.close()
+
+
+def test_write_behind_buffers_until_flush(tmp_path):
+    path = str(tmp_path / 'sessions.db')
+    backend = SQLiteSessionStore(path)
+    cached = CachedSessionStore(backend, write_behind=60)
+    cached.put('s1', {'turn': 1})
+    cached.put('s2', {'turn': 1})
+    assert backend.get('s1') is None and cached.get('s1') == {'turn': 1}
+    cached.flush()
+    assert backend.get('s1') == {'turn': 1} and backend.get('s2') == {'turn': 1}
+    assert cached.dirty == {}
+    cached.close()
+
+
+def test_close_flushes_and_eviction_never_loses_writes(tmp_path):
+    path = str(tmp_path / 'sessions.db')
+    cached = CachedSessionStore(SQLiteSessionStore(path), write_behind=60, max_sessions=2)
+    for n in range(5):
+        cached.put(f's{n}', {'turn': n})
+    assert len(cached.entries) <= 2
+    cached.put('last', {'turn': 'last'})
+    cached.close()
+    reopened = SQLiteSessionStore(path)
+    assert [reopened.get(f's{n}') for n in range(5)] == [{'turn': n} for n in range(5)]
+    assert reopened.get('last') == {'turn': 'last'}
+    reopened.close()
+
+
+def test_legacy_table_gains_a_version_column(tmp_path):
+    path = str(tmp_path / 'sessions.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE session_state (session_id TEXT PRIMARY KEY, state BLOB NOT NULL, '
+                 'updated_at REAL NOT NULL)')
+    conn.execute('INSERT INTO session_state VALUES (?, ?, 0)', ('old', encode_state({'turn': 1})))
+    conn.commit()
+    conn.close()
+    store = SQLiteSessionStore(path)
+    assert store.get_versioned('old') == ({'turn': 1}, 0)
+    store.put('old', {'turn': 2}, expected_version=0)
+    assert store.get_versioned('old') == ({'turn': 2}, 1)
+    store.close()
+
+
+def test_codec_rejects_an_unknown_format():
+    data = encode_state({'a': 1})
+    assert decode_state(data) == {'a': 1}
+    with pytest.raises(ValueError):
+        decode_state(bytes([99]) + data[1:])
+
+
+@pytest.mark.parametrize('url', ['redis://localhost', 'memory?write_behind=1', 'memory?cache=1&ttl=5'])
+def test_create_store_rejects_unknown_urls_and_options(url):
+    with pytest.raises(ValueError):
+        create_store(url)
+
+
+def test_create_store_builds_a_cached_store(tmp_path):
+    store = create_store(f"sqlite:///{tmp_path / 's.db'}?cache=1&write_behind=0&idle_ttl=5")
+    assert isinstance(store, CachedSessionStore) and store.write_behind == 0 and store.idle_ttl == 5
+    store.close()
@@ -0,0 +1,111 @@
+import numpy as np
+import pytest
+
+import mortgage_assistant
+import valuation_model
+from conftest import AS_OF, PRODUCTS_DB, ScriptedClient
+from market_queries import MarketData
+from valuation_model import COEFFICIENTS, EPOCH_DAY, MIN_SALES, RIDGE, design_matrix, fit
+
+# intercept, apartment, townhouse, bedrooms, bathrooms, parking, yearly trend (log price)
+TRUE_COEFFICIENTS = np.array([13.2, -0.35, -0.15, 0.12, 0.06, 0.04, 0.05])
+
+
+def synthetic_sales(n, noise=0.05, seed=3):
+    rng = np.random.default_rng(seed)
+    types = rng.choice(['House', 'Apartment', 'Townhouse'], n)
+    bedrooms = rng.integers(1, 6, n)
+    bathrooms = rng.integers(1, 4, n)
+    parking = rng.integers(0, 3, n)
+    # Ten years of sales, so the trend is well identified
+    days = EPOCH_DAY + rng.integers(0, 3653, n)
+    X = design_matrix(types, bedrooms, bathrooms, parking, days)
+    prices = np.exp(X @ TRUE_COEFFICIENTS + rng.normal(0, noise, n))
+    dates = (np.datetime64('1970-01-01', 'D') + days).astype(str)
+    return list(zip(types.tolist(), bedrooms.tolist(), bathrooms.tolist(), parking.tolist(), dates.tolist(),
+                    prices.tolist())), X, np.log(prices)
+
+
+def test_fit_recovers_known_coefficients():
+    rows, _, _ = synthetic_sales(20000)
+    coefficients, residual_std = fit(rows)
+    # RIDGE pulls the type dummies, which vary least, a little towards zero
+    np.testing.assert_allclose(coefficients, TRUE_COEFFICIENTS, rtol=0.15, atol=0.005)
+    assert residual_std == pytest.approx(0.05, rel=0.05)
+
+
+def test_fit_matches_closed_form_ridge():
+    rows, X, y = synthetic_sales(500, noise=0.2)
+    coefficients, _ = fit(rows)
+    penalty = RIDGE * len(y) * np.diag([0.0] + [1.0] * (len(COEFFICIENTS) - 1))
+    np.testing.assert_allclose(coefficients, np.linalg.solve(X.T @ X + penalty, X.T @ y), rtol=1e-6, atol=1e-9)
+
+
+def test_fit_needs_min_sales():
+    rows, _, _ = synthetic_sales(MIN_SALES - 1)
+    assert fit(rows) is None
+
+
+def test_score_uses_persisted_coefficients(market_db):
+    valuation_model.refit(market_db, refit_all=True)
+    model = valuation_model.ValuationModel(market_db)
+    estimate, low, high = model.score([1, 2, 10_000], ['House', 'Apartment', 'House'], [3, 2, 3], [2, 1, 2],
+                                      [1, 1, 1], as_of=AS_OF)
+    X = design_matrix(['House', 'Apartment'], [3, 2], [2, 1], [1, 1],
+                      [valuation_model.day_number(AS_OF)] * 2)
+    position = np.searchsorted(model.suburb_ids, [1, 2])
+    np.testing.assert_allclose(estimate[:2], np.exp(np.einsum('ij,ij->i', X, model.coefficients[position])))
+    assert np.all(low[:2] < estimate[:2]) and np.all(estimate[:2] < high[:2])
+    assert np.isnan(estimate[2])
+
+
+def test_parse_property_features():
+    assert mortgage_assistant.parse_property_features("a 3-bedroom townhouse, two baths and 1 car space") == {
+        'property_type': 'Townhouse', 'bedrooms': 3, 'bathrooms': 2, 'parking': 1}
+    assert mortgage_assistant.parse_property_features("somewhere quiet") == {}
+
+
+def test_agent_values_a_described_property(market_db):
+    valuation_model.refit(market_db)
+    client = ScriptedClient({'income': 150000, 'loan_amount': 900000})
+    agent = mortgage_assistant.ConversationalMortgageAgent(llm_client=client, db_path=PRODUCTS_DB,
+                                                          market_db_path=market_db)
+    reply = agent.get_next_response("We'd like a 3 bedroom house with 2 bathrooms in Bondi")
+
+    assert agent.state['property_details'] == {'property_type': 'House', 'bedrooms': 3, 'bathrooms': 2,
+                                               'suburb': 'Bondi', 'postcode': '2026', 'suburb_id': 3}
+    assert agent.state['property_estimate'] > 0
+    local_market = agent.state['local_market']
+    market = MarketData(market_db)
+    stats = market.suburb_stats(market.find_suburb('Bondi')['id'], 6)
+    assert local_market['sales_last_6_months'] == sum(row['sales'] for row in stats) > 0
+    assert local_market['by_property_type']['House']['median_price'] == round(
+        [row for row in stats if row['property_type'] == 'House'][-1]['median_price'])
+    assert 'property_value' not in agent.state['collected_info']
+    assert mortgage_assistant.SCENARIO_HEADING in reply
+
+    # A value the customer states replaces the estimate
+    client.financial = {'property_value': 2500000}
+    agent.get_next_response("It's listed at 2.5m")
+    assert 'property_estimate' not in agent.state
+    assert agent.customer_profile()['financial']['property_value'] == 2500000
+
+
+def test_agent_matches_suburbs_from_the_cached_names(market_db):
+    agent = mortgage_assistant.ConversationalMortgageAgent(llm_client=ScriptedClient({}), db_path=PRODUCTS_DB,
+                                                          market_db_path=market_db)
+    market = agent.market_data()
+    assert agent.market_data() is market
+    assert market.suburb_names() is market.suburb_names()
+
+    assert agent.find_suburb(market, "somewhere near castle hill")['name'] == 'Castle Hill'
+    assert agent.find_suburb(market, "we'd like a manly sort of place") is None
+    assert agent.find_suburb(market, "We like Manly")['name'] == 'Manly'
+
+
+def test_estimate_by_suburb_id_matches_by_name(market_db):
+    valuation_model.refit(market_db)
+    by_name = valuation_model.estimate_property(market_db, 'Bondi', None, 'House', 3, 2, 1, AS_OF)
+    by_id = valuation_model.estimate_property(market_db, property_type='House', bedrooms=3, bathrooms=2, parking=1,
+                                              as_of=AS_OF, suburb_id=MarketData(market_db).find_suburb('Bondi')['id'])
+    assert by_id == by_name
@@ -0,0 +1,197 @@
+import contextvars
+import json
+import os
+import random
+import threading
+import time
+import uuid
+
+# Span currently open on this thread / task
+_current_span = contextvars.ContextVar('mortgage_current_span', default=None)
+
+
+class NoopSpan:
+    """Returned when tracing is off or the turn was not sampled; every call is a no-op"""
+
+    recording = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set_attribute(self, key, value):
+        pass
+
+    def set_attributes(self, attributes):
+        pass
+
+    def record_exception(self, exc):
+        pass
+
+
+NOOP_SPAN = NoopSpan()
+
+
+class UnsampledSpan(NoopSpan):
+    """Root of a turn that lost the sampling draw, so its children stay unrecorded too"""
+
+    def __enter__(self):
+        self.token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current_span.reset(self.token)
+        return False
+
+
+class Span:
+    """A timed unit of work, exported in the OpenTelemetry (OTLP/JSON) span shape"""
+
+    recording = True
+
+    def __init__(self, tracer, name, parent, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        # Finished spans of the whole trace are exported together when the root ends
+        self.finished = parent.finished if parent else []
+        self.attributes = dict(attributes)
+        self.status = None
+
+    def __enter__(self):
+        self.token = _current_span.set(self)
+        self.start_ns = time.time_ns()
+        self.start_perf = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end_ns = self.start_ns + (time.perf_counter_ns() - self.start_perf)
+        _current_span.reset(self.token)
+        if exc is not None:
+            self.record_exception(exc)
+        self.finished.append(self)
+        if self.parent is None:
+            self.tracer.export(self.finished)
+        return False
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def set_attributes(self, attributes):
+        self.attributes.update(attributes)
+
+    def record_exception(self, exc):
+        self.status = {"code": "STATUS_CODE_ERROR", "message": f"{type(exc).__name__}: {exc}"}
+
+    def to_otlp(self, resource):
+        return {
+            "resource": resource,
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent.span_id if self.parent else "",
+            "name": self.name,
+            "kind": "SPAN_KIND_INTERNAL",
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": k, "value": otlp_value(v)} for k, v in self.attributes.items()],
+            "status": self.status or {"code": "STATUS_CODE_OK"}
+        }
+
+
+def otlp_value(value):
+    """Encode an attribute value as an OTLP AnyValue"""
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class JsonlSink:
+    """Appends one OTLP-shaped span per line to a local file"""
+
+    def __init__(self, path, service_name='mortgage-assistant'):
+        self.path = path
+        self.resource = {"attributes": [{"key": "service.name", "value": {"stringValue": service_name}}]}
+        self.lock = threading.Lock()
+
+    def export(self, spans):
+        lines = ''.join(json.dumps(s.to_otlp(self.resource), separators=(',', ':')) + '\n' for s in spans)
+        with self.lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(lines)
+
+
+class MemorySink:
+    """Keeps span durations and error counts by span name in memory, for load tests"""
+
+    def __init__(self):
+        self.durations = {}  # span name -> [seconds]
+        self.errors = {}     # span name -> count
+        self.lock = threading.Lock()
+
+    def export(self, spans):
+        with self.lock:
+            for s in spans:
+                self.durations.setdefault(s.name, []).append((s.end_ns - s.start_ns) / 1e9)
+                if s.status is not None:
+                    self.errors[s.name] = self.errors.get(s.name, 0) + 1
+
+    def drain(self):
+        """Return (durations, errors) collected so far and start afresh"""
+        with self.lock:
+            durations, errors = self.durations, self.errors
+            self.durations, self.errors = {}, {}
+        return durations, errors
+
+
+class Tracer:
+    """Creates spans; with no sink every span is the shared no-op"""
+
+    def __init__(self, sink=None, sample_rate=1.0):
+        self.sink = sink
+        self.sample_rate = float(sample_rate)
+
+    @classmethod
+    def from_env(cls):
+        """Configure from MORTGAGE_TRACE_FILE and MORTGAGE_TRACE_SAMPLE_RATE"""
+        path = os.getenv("MORTGAGE_TRACE_FILE")
+        sink = JsonlSink(path) if path else None
+        return cls(sink, os.getenv("MORTGAGE_TRACE_SAMPLE_RATE", "1.0"))
+
+    def span(self, name, attributes=None):
+        if self.sink is None:
+            return NOOP_SPAN
+        parent = _current_span.get()
+        if parent is None:
+            # Head sampling: the decision is made once per root span (one agent turn)
+            if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+                return UnsampledSpan()
+        elif not parent.recording:
+            return NOOP_SPAN
+        return Span(self, name, parent, attributes or {})
+
+    def export(self, spans):
+        try:
+            self.sink.export(spans)
+        except Exception as e:
+            print(f"Error exporting trace: {e}")
+
+
+tracer = Tracer.from_env()
+
+
+def span(name, attributes=None):
+    """Start a span on the process tracer; use as a context manager"""
+    return tracer.span(name, attributes)
+
+
+def current_span():
+    """The innermost open span, or the no-op span when none is recording"""
+    return _current_span.get() or NOOP_SPAN
@@ -0,0 +1,52 @@
+import json
+import os
+import threading
+import time
+
+
+class TrafficCapture:
+    """Appends one JSON line per completed turn, for replay with benchmarks/replay_traffic.py
+
+    Lines are {"ts", "session_id", "turn", "message", "latency_ms", "stage", "reply_chars", "streamed"}.
+    Messages are stored verbatim, so treat the file as customer data.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Configure from MORTGAGE_CAPTURE_FILE; None when capture is off"""
+        path = os.getenv("MORTGAGE_CAPTURE_FILE")
+        return cls(path) if path else None
+
+    def record(self, session_id, agent, message, latency, streamed=False):
+        history = agent.state['conversation_history']
+        entry = {
+            "ts": round(time.time() - latency, 6),
+            "session_id": session_id,
+            "turn": len(history) // 2,
+            "message": message,
+            "latency_ms": round(latency * 1e3, 3),
+            "stage": agent.state.get('current_stage'),
+            "reply_chars": len(history.entries[-1][1]) if history else 0,
+            "streamed": streamed
+        }
+        line = json.dumps(entry, ensure_ascii=False) + '\n'
+        with self.lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+
+
+capture = TrafficCapture.from_env()
+
+
+def record_turn(session_id, agent, message, latency, streamed=False):
+    """Capture a completed turn when MORTGAGE_CAPTURE_FILE is set; never raises"""
+    if capture is None:
+        return
+    try:
+        capture.record(session_id, agent, message, latency, streamed)
+    except Exception as e:
+        print(f"Error capturing turn: {e}")
@@ -0,0 +1,224 @@
+"""Hedonic automated valuation model (AVM), fitted per suburb on recent_sales.
+
+    log(price) = intercept + apartment + townhouse + bedrooms + bathrooms + parking + trend * years
+
+House is the baseline type. The years term is time since 2000, so the trend is the
+suburb's log price growth per year. Each suburb is one ridge-regularised least squares
+solve; suburbs are spread over a process pool, and the coefficients are stored in
+valuation_models together with the suburb_versions.version they were fitted at. A refit
+only touches suburbs whose version has moved on, i.e. those that ingest gave new sales.
+Scoring looks the coefficients up by suburb and takes a dot product, so batches of any
+size are a handful of array operations:
+
+    python valuation_model.py --fit --workers 4
+    python valuation_model.py --suburb Bondi --type House --bedrooms 3 --bathrooms 2 --parking 1
+"""
+import argparse
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timezone
+from urllib.parse import quote
+
+import numpy as np
+
+from market_arrays import day_number
+from market_queries import MarketData
+
+COEFFICIENTS = ['intercept', 'apartment', 'townhouse', 'bedrooms', 'bathrooms', 'parking', 'trend']
+EPOCH_DAY = day_number('2000-01-01')
+# Suburbs with fewer usable sales get a model row without coefficients
+MIN_SALES = 30
+# Shrinks coefficients the data cannot identify (e.g. townhouse in a suburb without any) towards zero
+RIDGE = 1e-2
+# Used for features the customer did not mention
+DEFAULT_FEATURES = {'bedrooms': 3, 'bathrooms': 1, 'parking': 1}
+# Share of the residual spread reported either side of an estimate (~80% interval)
+INTERVAL_Z = 1.2816
+
+TRAINING_QUERY = '''
+    SELECT property_type, bedrooms, bathrooms, parking, sale_date, sale_price
+    FROM recent_sales
+    WHERE suburb_id = :suburb_id AND sale_price > 0 AND sale_date IS NOT NULL
+      AND bedrooms IS NOT NULL AND bathrooms IS NOT NULL AND parking IS NOT NULL
+'''
+
+STALE_QUERY = '''
+    SELECT v.suburb_id, v.version
+    FROM suburb_versions v LEFT JOIN valuation_models m ON m.suburb_id = v.suburb_id
+    WHERE m.suburb_id IS NULL OR m.version != v.version
+'''
+
+MODEL_COLUMNS = ['suburb_id', 'version', 'sales'] + COEFFICIENTS + ['residual_std', 'fitted_at']
+
+
+def design_matrix(property_types, bedrooms, bathrooms, parking, days):
+    """Regressors in COEFFICIENTS order; property types other than Apartment/Townhouse count as House"""
+    property_types = np.asarray(property_types, dtype=str)
+    days = np.asarray(days, dtype=float)
+    return np.column_stack([
+        np.ones(len(days)),
+        property_types == 'Apartment',
+        property_types == 'Townhouse',
+        np.asarray(bedrooms, dtype=float),
+        np.asarray(bathrooms, dtype=float),
+        np.asarray(parking, dtype=float),
+        (days - EPOCH_DAY) / 365.25
+    ])
+
+
+def fit(rows):
+    """(coefficients, residual_std) for one suburb's training rows, or None when there are too few"""
+    if len(rows) < MIN_SALES:
+        return None
+    types, bedrooms, bathrooms, parking, dates, prices = zip(*rows)
+    days = (np.array(dates, dtype='U10').astype('datetime64[D]') - np.datetime64('1970-01-01', 'D')).astype(int)
+    X = design_matrix(['' if t is None else t for t in types], bedrooms, bathrooms, parking, days)
+    y = np.log(np.array(prices, dtype=float))
+    # Ridge as extra rows: sqrt(RIDGE) * I for every coefficient but the intercept
+    penalty = np.sqrt(RIDGE * len(y)) * np.eye(len(COEFFICIENTS))[1:]
+    coefficients = np.linalg.lstsq(np.vstack([X, penalty]), np.concatenate([y, np.zeros(len(penalty))]),
+                                   rcond=None)[0]
+    residuals = y - X @ coefficients
+    return coefficients, float(np.sqrt(residuals @ residuals / max(len(y) - len(COEFFICIENTS), 1)))
+
+
+def fit_suburbs(db_path, suburbs):
+    """Worker: fit [(suburb_id, version)] and return valuation_models rows"""
+    conn = sqlite3.connect(f"file:{quote(os.path.abspath(db_path))}?mode=ro", uri=True)
+    fitted_at = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    rows = []
+    for suburb_id, version in suburbs:
+        training = conn.execute(TRAINING_QUERY, {'suburb_id': suburb_id}).fetchall()
+        result = fit(training)
+        coefficients, residual_std = result if result else ([None] * len(COEFFICIENTS), None)
+        rows.append((suburb_id, version, len(training), *[None if c is None else float(c) for c in coefficients],
+                     residual_std, fitted_at))
+    conn.close()
+    return rows
+
+
+def refit(db_path='property_market.db', workers=1, refit_all=False, chunk_size=200):
+    """Fit every suburb whose sales changed since its model (all suburbs with refit_all); returns the count"""
+    conn = sqlite3.connect(db_path)
+    if refit_all:
+        stale = conn.execute('SELECT suburb_id, version FROM suburb_versions').fetchall()
+    else:
+        stale = conn.execute(STALE_QUERY).fetchall()
+    chunks = [stale[i:i + chunk_size] for i in range(0, len(stale), chunk_size)]
+    if workers > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(fit_suburbs, [db_path] * len(chunks), chunks))
+    else:
+        results = [fit_suburbs(db_path, chunk) for chunk in chunks]
+    with conn:
+        conn.executemany(f"INSERT OR REPLACE INTO valuation_models ({', '.join(MODEL_COLUMNS)}) "
+                         f"VALUES ({', '.join('?' * len(MODEL_COLUMNS))})", [row for rows in results for row in rows])
+    conn.close()
+    return len(stale)
+
+
+class ValuationModel:
+    """Fitted coefficients of every suburb as arrays, for O(1) single and vectorized batch scoring"""
+
+    def __init__(self, db_path='property_market.db'):
+        self.db_path = db_path
+        conn = sqlite3.connect(f"file:{quote(os.path.abspath(db_path))}?mode=ro", uri=True)
+        rows = conn.execute(f"SELECT suburb_id, {', '.join(COEFFICIENTS)}, residual_std FROM valuation_models "
+                            f"WHERE intercept IS NOT NULL ORDER BY suburb_id").fetchall()
+        conn.close()
+        table = np.array(rows, dtype=float).reshape(-1, len(COEFFICIENTS) + 2)
+        self.suburb_ids = table[:, 0].astype(np.int64)
+        self.coefficients = table[:, 1:-1]
+        self.residual_std = table[:, -1]
+
+    def score(self, suburb_ids, property_types, bedrooms, bathrooms, parking, as_of=None):
+        """Median price estimates and ~80% interval bounds as arrays; NaN for suburbs without a model"""
+        suburb_ids = np.asarray(suburb_ids, dtype=np.int64)
+        if not len(self.suburb_ids):
+            missing = np.full(len(suburb_ids), np.nan)
+            return missing, missing, missing
+        position = np.minimum(np.searchsorted(self.suburb_ids, suburb_ids), len(self.suburb_ids) - 1)
+        known = self.suburb_ids[position] == suburb_ids
+        day = day_number(as_of or date.today().isoformat())
+        X = design_matrix(property_types, bedrooms, bathrooms, parking, np.full(len(suburb_ids), day))
+        log_price = np.where(known, np.einsum('ij,ij->i', X, self.coefficients[position]), np.nan)
+        spread = INTERVAL_Z * self.residual_std[position]
+        return np.exp(log_price), np.exp(log_price - spread), np.exp(log_price + spread)
+
+    def estimate(self, suburb_id, property_type='House', bedrooms=None, bathrooms=None, parking=None, as_of=None):
+        """{'estimate', 'low', 'high'} for one property, or None when the suburb has no model"""
+        features = {'bedrooms': bedrooms, 'bathrooms': bathrooms, 'parking': parking}
+        features = {name: DEFAULT_FEATURES[name] if value is None else value for name, value in features.items()}
+        estimate, low, high = self.score([suburb_id], [property_type or 'House'], [features['bedrooms']],
+                                         [features['bathrooms']], [features['parking']], as_of)
+        if np.isnan(estimate[0]):
+            return None
+        return {'estimate': float(estimate[0]), 'low': float(low[0]), 'high': float(high[0])}
+
+
+_models = {}
+_models_lock = threading.Lock()
+
+
+def get_model(db_path='property_market.db'):
+    """Process-wide ValuationModel, reloaded when the database (or its WAL) has been written since"""
+    key = os.path.abspath(db_path)
+    version = tuple(os.stat(p).st_mtime_ns for p in (key, key + '-wal') if os.path.exists(p))
+    with _models_lock:
+        cached = _models.get(key)
+        if cached is None or cached[0] != version:
+            cached = _models[key] = (version, ValuationModel(db_path))
+    return cached[1]
+
+
+def estimate_property(db_path, suburb=None, postcode=None, property_type=None, bedrooms=None, bathrooms=None,
+                      parking=None, as_of=None, suburb_id=None):
+    """Valuation of a described property by suburb_id, or by suburb name (and/or postcode) when the id
+    isn't known; None when it cannot be valued"""
+    if suburb_id is None:
+        found = MarketData(db_path).find_suburb(suburb, postcode) if suburb else None
+        if found is None:
+            return None
+        suburb_id = found['id']
+    return get_model(db_path).estimate(suburb_id, property_type, bedrooms, bathrooms, parking, as_of)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit the per-suburb valuation models or value a property")
+    parser.add_argument('--db', default='property_market.db')
+    parser.add_argument('--fit', action='store_true', help="Refit suburbs whose sales changed")
+    parser.add_argument('--refit-all', action='store_true', help="Refit every suburb")
+    parser.add_argument('--workers', type=int, default=1, help="Fitting processes (0: one per CPU)")
+    parser.add_argument('--suburb')
+    parser.add_argument('--postcode')
+    parser.add_argument('--type', default='House')
+    parser.add_argument('--bedrooms', type=int)
+    parser.add_argument('--bathrooms', type=int)
+    parser.add_argument('--parking', type=int)
+    parser.add_argument('--as-of', help="Valuation date, YYYY-MM-DD (default: today)")
+    parser.add_argument('--benchmark', type=int, metavar='N', help="Time scoring N random properties")
+    args = parser.parse_args()
+
+    if args.fit or args.refit_all:
+        start = time.perf_counter()
+        count = refit(args.db, args.workers or os.cpu_count(), args.refit_all)
+        print(f"Fitted {count:,} suburbs in {time.perf_counter() - start:.1f}s")
+    if args.suburb:
+        value = estimate_property(args.db, args.suburb, args.postcode, args.type, args.bedrooms, args.bathrooms,
+                                  args.parking, args.as_of)
+        if value is None:
+            print(f"No valuation model for {args.suburb}")
+        else:
+            print(f"${value['estimate']:,.0f} (${value['low']:,.0f} - ${value['high']:,.0f})")
+    if args.benchmark:
+        model = get_model(args.db)
+        rng = np.random.default_rng(0)
+        n = args.benchmark
+        start = time.perf_counter()
+        estimates, _, _ = model.score(rng.choice(model.suburb_ids, n), rng.choice(['House', 'Apartment', 'Townhouse'], n),
+                                      rng.integers(1, 6, n), rng.integers(1, 4, n), rng.integers(0, 3, n), args.as_of)
+        print(f"Scored {n:,} properties in {(time.perf_counter() - start) * 1e3:.1f} ms "
+              f"(median estimate ${np.nanmedian(estimates):,.0f})")